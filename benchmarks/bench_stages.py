@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+处理阶段性能基准测试
+
+用合成IR/录音在 采样率 × 扫频长度 × 通道数 的矩阵上
+测量每个阶段的耗时和峰值内存，并把结果保存为JSON基线。
+
+    python benchmarks/bench_stages.py run --quick -o data/bench/base.json
+    python benchmarks/bench_stages.py run -o data/bench/new.json
+    python benchmarks/bench_stages.py compare data/bench/base.json data/bench/new.json --threshold 0.15
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from core.ir import extract_ir
+from core.metrics import RT60, C50
+from core.modes import modes
+from core.reflections import reflections
+from core.separate import separate_ir_components
+from core.simulate import synthetic_ir
+from core.sweep import generate_sweep
+from core.sync import sync_and_trim
+from utils.config import build_config
+from utils.plot import plot_ir
+
+
+STAGES = ("generate_sweep", "sync_and_trim", "extract_ir", "RT60", "C50",
+          "reflections", "separate_ir_components", "modes", "plot_ir")
+
+FULL_MATRIX = {"fs": (44100, 48000, 96000, 192000), "duration": (1, 8, 30, 60), "channels": (1, 2, 8)}
+QUICK_MATRIX = {"fs": (44100, 96000), "duration": (1, 4), "channels": (1, 2)}
+
+
+def synthetic_case(cfg, channels, seed=0):
+    """Sweep, inverse filter, recordings and IRs for one matrix point."""
+    import scipy.signal as sig
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sweep, inv = generate_sweep(cfg, save=False)
+    rng = np.random.default_rng(seed)
+    delay = int(0.05 * cfg.fs)
+    recs, irs = [], []
+    for ch in range(channels):
+        h = synthetic_ir(cfg.fs, seed=seed + ch)
+        rec = sig.oaconvolve(np.concatenate([np.zeros(delay), sweep]), h)
+        rec += rng.standard_normal(len(rec)) * 1e-4
+        recs.append(rec)
+        irs.append(h)
+    return sweep, inv, recs, irs
+
+
+def _stage_calls(stage, cfg, case, workdir):
+    """List of zero-argument callables, one per channel, for a stage."""
+    sweep, inv, recs, irs = case
+    synced = [r[int(0.05 * cfg.fs):] for r in recs]
+    calls = {
+        "generate_sweep": [lambda: generate_sweep(cfg, save=False)],
+        "sync_and_trim": [lambda r=r: sync_and_trim(r, sweep) for r in recs],
+        "extract_ir": [lambda r=r: extract_ir(r, inv, cfg, save=False) for r in synced],
+        "RT60": [lambda h=h: RT60(h, cfg=cfg) for h in irs],
+        "C50": [lambda h=h: C50(h, cfg=cfg) for h in irs],
+        "reflections": [lambda h=h: reflections(h, cfg) for h in irs],
+        "separate_ir_components": [lambda h=h: separate_ir_components(h, output_dir=workdir, cfg=cfg) for h in irs],
+        "modes": [lambda h=h: modes(h, cfg.fs) for h in irs],
+        "plot_ir": [lambda h=h: plot_ir(h, cfg.fs, None, path=os.path.join(workdir, "ir.png"), cfg=cfg) for h in irs],
+    }
+    return calls[stage]
+
+
+def measure(calls, repeat):
+    """Best and mean wall time over `repeat` runs, plus a tracemalloc peak from one extra run."""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for call in calls:
+                call()
+            times.append(time.perf_counter() - t0)
+        tracemalloc.start()
+        try:
+            for call in calls:
+                call()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {"best_s": min(times), "mean_s": sum(times) / len(times), "peak_mb": peak / 2**20}
+
+
+def case_key(stage, fs, duration, channels):
+    return f"{stage}|fs={fs}|dur={duration}|ch={channels}"
+
+
+def run(matrix, stages=STAGES, repeat=3, verbose=True):
+    results = {}
+    base = build_config()
+    with tempfile.TemporaryDirectory() as workdir:
+        for fs, duration, channels in itertools.product(matrix["fs"], matrix["duration"], matrix["channels"]):
+            cfg = base.with_overrides(fs=fs, sweep_duration=duration, silence_pre=0.0, silence_post=0.0)
+            case = synthetic_case(cfg, channels)
+            for stage in stages:
+                key = case_key(stage, fs, duration, channels)
+                results[key] = measure(_stage_calls(stage, cfg, case, workdir), repeat)
+                if verbose:
+                    r = results[key]
+                    print(f"  {key:<52} {r['best_s'] * 1e3:>10.2f} ms {r['peak_mb']:>9.1f} MB")
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": __import__("scipy").__version__,
+            "machine": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.10, mem_threshold=0.20):
+    """Return (rows, regressions); a case regresses if best time or peak memory grew beyond the thresholds."""
+    rows, regressions = [], []
+    for key, cur in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        t_ratio = cur["best_s"] / base["best_s"] if base["best_s"] > 0 else 1.0
+        m_ratio = cur["peak_mb"] / base["peak_mb"] if base["peak_mb"] > 0 else 1.0
+        row = (key, base["best_s"], cur["best_s"], t_ratio, m_ratio)
+        rows.append(row)
+        if t_ratio > 1 + threshold or m_ratio > 1 + mem_threshold:
+            regressions.append(row)
+    return rows, regressions
+
+
+def _parse_list(text, cast):
+    return tuple(cast(x) for x in text.split(",")) if text else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SoundCheck 阶段性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="运行基准并保存JSON")
+    p.add_argument("--quick", action="store_true", help="使用小矩阵")
+    p.add_argument("--fs", help="采样率列表，例如 44100,96000")
+    p.add_argument("--durations", help="扫频长度列表(秒)，例如 1,8,60")
+    p.add_argument("--channels", help="通道数列表，例如 1,8")
+    p.add_argument("--stages", help=f"阶段列表 (默认全部: {','.join(STAGES)})")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("-o", "--output", default="data/bench/latest.json")
+
+    p = sub.add_parser("compare", help="对比两个基准JSON，回归时返回非零")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=0.10, help="耗时回归阈值 (0.10 = +10%%)")
+    p.add_argument("--mem-threshold", type=float, default=0.20, help="内存回归阈值")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        matrix = dict(QUICK_MATRIX if args.quick else FULL_MATRIX)
+        for name, text, cast in (("fs", args.fs, int), ("duration", args.durations, float),
+                                 ("channels", args.channels, int)):
+            matrix[name] = _parse_list(text, cast) or matrix[name]
+        stages = _parse_list(args.stages, str) or STAGES
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            parser.error(f"未知阶段: {', '.join(sorted(unknown))}")
+        print(f"🏁 基准矩阵: fs={matrix['fs']} 时长={matrix['duration']} 通道={matrix['channels']}")
+        report = run(matrix, stages, repeat=args.repeat)
+        out_dir = os.path.dirname(args.output)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"📁 基准结果: {args.output}")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    with open(args.current, encoding="utf-8") as fh:
+        current = json.load(fh)
+    rows, regressions = compare(baseline, current, args.threshold, args.mem_threshold)
+    for key, base_s, cur_s, t_ratio, m_ratio in rows:
+        flag = "❌" if (key, base_s, cur_s, t_ratio, m_ratio) in regressions else "  "
+        print(f"{flag} {key:<52} {base_s * 1e3:>10.2f} -> {cur_s * 1e3:>10.2f} ms  x{t_ratio:.2f}  mem x{m_ratio:.2f}")
+    print(f"\n{len(rows)} 项对比, {len(regressions)} 项回归 (耗时阈值 +{args.threshold:.0%}, 内存阈值 +{args.mem_threshold:.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+离线分析 - 从已有的录音或IR文件计算声学指标
+只依赖 numpy/scipy(以及读取文件用的 soundfile)，不初始化音频设备
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from core.metrics import RT60, C50, sti
+from utils.config import get_config
+
+
+def load_audio(path):
+    """Read a WAV (as float64) or .scir file (memory-mapped) as mono; returns (data, fs)."""
+    if str(path).endswith(".scir"):
+        from utils.irfile import read_ir
+        return read_ir(path)
+    import soundfile as sf
+
+    data, fs = sf.read(path, dtype="float64", always_2d=False)
+    if data.ndim > 1:
+        data = data[:, 0]
+    return data, int(fs)
+
+
+@lru_cache(maxsize=8)
+def _sweep_for(cfg):
+    """Sweep and inverse filter for a Config; cached since Config is hashable."""
+    from core.sweep import generate_sweep
+
+    return generate_sweep(cfg, save=False)
+
+
+def ir_from_recording(rec, cfg=None):
+    """Run drift correction -> sync -> deconvolution on a raw sweep recording, without writing files."""
+    from core.drift import correct_drift
+    from core.ir import extract_ir
+    from core.sync import sync_and_trim, sync_window
+
+    cfg = cfg or get_config()
+    sig, inv = _sweep_for(cfg)
+    rec, _ = correct_drift(rec, sig, cfg)
+    rec2 = sync_and_trim(rec, sig, sync_window(cfg))
+    return extract_ir(rec2, inv, cfg, save=False)
+
+
+def analyze_ir(ir, cfg=None, with_reflections=False):
+    """Compute the broadband metrics for an impulse response.
+
+    Returns:
+        dict with rt60, c50, sti and (optionally) the detected reflection times
+    """
+    cfg = cfg or get_config()
+    result = {
+        "fs": cfg.fs,
+        "duration": len(ir) / cfg.fs,
+        "rt60": RT60(ir, cfg=cfg),
+        "c50": C50(ir, cfg=cfg),
+        "sti": sti(ir, cfg=cfg)["sti"],
+    }
+    if with_reflections:
+        from core.reflections import reflections
+
+        result["reflections"] = reflections(ir, cfg)
+    return result
+
+
+def analyze_file(path, cfg=None, recording=False, with_reflections=False):
+    """Load a WAV file (IR, or raw recording if recording=True) and analyze it.
+
+    The file's own sample rate overrides cfg.fs, so files recorded at
+    44.1/48/96 kHz can be mixed in one process.
+    """
+    cfg = cfg or get_config()
+    data, fs = load_audio(path)
+    if fs != cfg.fs:
+        cfg = cfg.with_overrides(fs=fs)
+    ir = ir_from_recording(data, cfg) if recording else np.asarray(data, dtype=np.float64)
+    result = analyze_ir(ir, cfg, with_reflections=with_reflections)
+    result["path"] = str(path)
+    return result, ir, cfg
+
+
+def analyze_take(rec, cfg=None, archive=None, return_ir=False):
+    """Raw recording -> IR -> broadband and octave-band metrics, quietly.
+
+    Used as a worker entry point by the daemon and session modes. With an
+    archive directory the IR is written there and only the measurement id
+    travels back; the catalog row is added by the calling process.
+
+    Returns:
+        dict with measurement_id (None without archive), metrics
+        ({(name, band): value}, see flatten_metrics), rt60, c50, sti, bands,
+        quality (see core.quality.assess), seconds and, with return_ir=True,
+        the IR itself
+    """
+    import contextlib
+    import io
+    import time
+
+    from core.metrics import band_metrics
+    from core.quality import assess_take
+    from utils.store import MeasurementStore, flatten_metrics, write_array
+
+    cfg = cfg or get_config()
+    start = time.perf_counter()
+    inv_length = len(_sweep_for(cfg)[1])
+    with contextlib.redirect_stdout(io.StringIO()):
+        ir = ir_from_recording(rec, cfg)
+        ir = ir if ir.ndim == 1 else ir[:, 0]
+        result = analyze_ir(ir, cfg)
+        bands = band_metrics(ir, cfg, valid=len(ir) - inv_length + 1)
+    quality = assess_take(ir, rec, cfg, inv_length=inv_length)
+    mid = None
+    if archive:
+        mid = MeasurementStore.new_id()
+        write_array(archive, mid, "ir", ir)
+    take = {
+        "measurement_id": mid,
+        "metrics": flatten_metrics({k: result[k] for k in ("rt60", "c50", "sti")}, bands),
+        "rt60": result["rt60"],
+        "c50": result["c50"],
+        "sti": result["sti"],
+        "bands": bands,
+        "quality": quality,
+        "seconds": time.perf_counter() - start,
+    }
+    if return_ir:
+        take["ir"] = ir
+    return take
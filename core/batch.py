@@ -0,0 +1,135 @@
+"""
+批量离线分析 - 用进程池处理大量录音/IR文件
+sync -> IR -> metrics -> (可选) 图表，结果汇总到一张CSV表
+"""
+
+import csv
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.config import get_config
+
+
+RESULT_FIELDS = ["path", "fs", "duration", "rt60", "c50", "sti", "reflections", "plot", "measurement_id", "error", "seconds"]
+
+
+def expand_inputs(patterns):
+    """Expand glob patterns (``**`` allowed) into a sorted, de-duplicated file list."""
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        paths.update(p for p in matches if os.path.isfile(p))
+    return sorted(paths)
+
+
+def _plot_path(plots_dir, path, root):
+    """Plot file for path, mirroring its location below root so equal names do not collide."""
+    stem = os.path.splitext(os.path.relpath(os.path.abspath(path), root))[0]
+    return os.path.join(plots_dir, f"{stem}.png")
+
+
+def analyze_task(task):
+    """Worker entry point: analyze one file and return a result row.
+
+    Errors are caught and reported in the row so one bad file does not
+    abort a batch of thousands.
+    """
+    path, cfg, recording, plot, archive, room = task
+    from core.analysis import analyze_file
+
+    start = time.perf_counter()
+    row = {"path": path}
+    try:
+        result, ir, file_cfg = analyze_file(path, cfg, recording=recording, with_reflections=True)
+        row.update(fs=result["fs"], duration=round(result["duration"], 4),
+                   rt60=result["rt60"], c50=result["c50"], sti=result["sti"], reflections=len(result["reflections"]))
+        if archive:
+            from core.analysis import _sweep_for
+            from core.metrics import band_metrics
+            from utils.store import MeasurementStore, flatten_metrics
+
+            valid = len(ir) - len(_sweep_for(file_cfg)[1]) + 1 if recording else None
+            # IR and catalog row in one step: a crashed batch leaves no orphan arrays
+            metrics = flatten_metrics({k: row[k] for k in ("rt60", "c50", "sti")},
+                                      band_metrics(ir, file_cfg, valid=valid))
+            with MeasurementStore(archive) as store:
+                row["measurement_id"] = store.add_measurement(room=room, cfg=file_cfg, source=path, kind="batch",
+                                                              metrics=metrics, arrays={"ir": ir})
+        if plot:
+            from utils.plot import plot_ir
+
+            row["plot"] = plot
+            plot_ir(ir, file_cfg.fs, result["reflections"], path=row["plot"], cfg=file_cfg)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def default_chunksize(n_tasks, workers):
+    """A few chunks per worker: amortises IPC while keeping the pool balanced."""
+    return max(1, n_tasks // (workers * 4))
+
+
+def run_batch(patterns, cfg=None, workers=None, chunksize=None, recording=False,
+              plots_dir=None, output="data/batch/results.csv", archive=None, room=None):
+    """Analyze every file matching ``patterns`` across a process pool.
+
+    Args:
+        patterns: glob patterns of IR files (or raw recordings if recording=True)
+        cfg: base Config; each file's own sample rate overrides cfg.fs
+        workers: process count (default: os.cpu_count())
+        chunksize: files per work unit (default: default_chunksize())
+        plots_dir: if given, write one IR plot per file there
+        output: CSV path for the result table (None to skip writing)
+        archive: measurement archive directory to record results and IRs in
+        room: room name stored with archived measurements
+
+    Returns:
+        list of result rows, in input order
+    """
+    cfg = cfg or get_config()
+    paths = expand_inputs(patterns)
+    if not paths:
+        print("⚠️ 没有匹配的文件")
+        return []
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    chunksize = chunksize or default_chunksize(len(paths), workers)
+    if plots_dir:
+        os.makedirs(plots_dir, exist_ok=True)
+
+    print(f"📦 批量分析 {len(paths)} 个文件 ({workers} 进程, 每块 {chunksize} 个)")
+    start = time.perf_counter()
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    tasks = [(p, cfg, recording, _plot_path(plots_dir, p, root) if plots_dir else None, archive, room)
+             for p in paths]
+    if workers == 1:
+        rows = [analyze_task(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(analyze_task, tasks, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    if output:
+        write_table(rows, output)
+    failed = sum(1 for r in rows if r.get("error"))
+    print(f"✅ 批量分析完成: {len(rows) - failed} 成功, {failed} 失败, 用时 {elapsed:.1f}秒")
+    if output:
+        print(f"📁 结果表: {output}")
+    return rows
+
+
+def write_table(rows, output):
+    """Write result rows to a single CSV table."""
+    out_dir = os.path.dirname(output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(output, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,254 @@
+"""
+分段卷积引擎 - 用测得的IR实时/离线渲染音频 (试听房间效果)
+
+    python run.py auralize speech.wav -o out.wav          # 最近一次测量的IR
+    python run.py auralize speech.wav --ir ir.wav --part late --play
+
+非均匀分段重叠保留 (overlap-save) 卷积：IR 开头用小分段 (延迟只有一个小块)，
+后面的分段逐级加倍，尾部用大分段 (FFT 效率高)。各分段的频谱在构造时预先计算。
+分段 k 的块长 N_k、起点 o_k 满足 o_k >= N_k，所以大分段的输出总能在需要之前
+算好，整个引擎是同步的：每输入一个小块就输出一个小块。
+
+离线渲染 (render) 用均匀大分段，按批一次处理多个块的频谱，
+比对整段音频做一次 fftconvolve 快且内存占用固定。
+"""
+
+import numpy as np
+
+
+HEAD_BLOCK = 128
+MAX_BLOCK = 8192
+PER_LEVEL = 2
+RENDER_BLOCK = 8192
+RENDER_BATCH = 64
+
+
+def partition_plan(length, block=HEAD_BLOCK, max_block=MAX_BLOCK, per_level=PER_LEVEL):
+    """Non-uniform partitioning of an IR of `length` taps.
+
+    per_level partitions of each size block, 2*block, ... max_block, then
+    max_block partitions until the IR is covered. A segment of size N
+    always starts at an offset >= N.
+
+    Returns:
+        [(offset, size, count), ...]
+    """
+    if block < 1 or block & (block - 1) or max_block < block:
+        raise ValueError("分段长度必须是2的幂，且 max_block >= block")
+    plan, offset, size = [], 0, block
+    while offset < length:
+        remaining = -(-(length - offset) // size)
+        count = remaining if size == max_block else min(per_level, remaining)
+        plan.append((offset, size, count))
+        offset += size * count
+        if size < max_block and offset >= 2 * size:
+            size *= 2
+    return plan
+
+
+def _split(h, size, count):
+    """h zero-padded to count*size taps, as (count, size) partitions."""
+    parts = np.zeros(count * size)
+    parts[:len(h)] = h
+    return parts.reshape(count, size)
+
+
+class _Segment:
+    """Uniformly partitioned overlap-save convolution of one IR segment."""
+
+    def __init__(self, h, offset, size, count):
+        self.offset, self.size, self.count = offset, size, count
+        padded = np.zeros((count, 2 * size))
+        padded[:, :size] = _split(h[offset:offset + size * count], size, count)
+        self.spectra = np.fft.rfft(padded, axis=1)        # pre-transformed partitions
+        self.fdl = np.zeros_like(self.spectra)            # frequency-domain delay line
+        self.pos = 0
+        self.window = np.zeros(2 * size)                  # last 2N input samples
+        self.fill = 0
+
+    def push(self, x):
+        """Add len(x) input samples (len(x) divides size); returns an output block or None."""
+        n = len(x)
+        self.window[self.size + self.fill:self.size + self.fill + n] = x
+        self.fill += n
+        if self.fill < self.size:
+            return None
+        self.fdl[self.pos] = np.fft.rfft(self.window)
+        order = (self.pos - np.arange(self.count)) % self.count
+        acc = np.einsum("pk,pk->k", self.fdl[order], self.spectra)
+        self.pos = (self.pos + 1) % self.count
+        self.window[:self.size] = self.window[self.size:]
+        self.fill = 0
+        return np.fft.irfft(acc)[self.size:]
+
+
+class PartitionedConvolver:
+    """Streaming low-latency convolution with a fixed IR.
+
+    Feed exactly `block` samples per process() call (e.g. the sounddevice
+    blocksize); each call returns the next `block` output samples. The
+    latency is one block. Large segments do their FFTs only every N
+    samples, so their cost arrives in bursts at those block boundaries.
+
+    Args:
+        ir: impulse response (1-D)
+        block: head partition size and I/O block size (power of two)
+        max_block: largest partition size
+    """
+
+    def __init__(self, ir, block=HEAD_BLOCK, max_block=MAX_BLOCK, per_level=PER_LEVEL):
+        h = np.asarray(ir, dtype=np.float64)
+        if h.ndim != 1 or not len(h):
+            raise ValueError("IR 必须是非空的一维数组")
+        self.block = block
+        self.plan = partition_plan(len(h), block, max(block, max_block), per_level)
+        self.segments = [_Segment(h, o, n, c) for o, n, c in self.plan]
+        self.length = len(h)
+        horizon = max(o + n for o, n, _ in self.plan) + block
+        self._ring = np.zeros(1 << int(np.ceil(np.log2(horizon))))
+        self._t = 0  # input samples consumed
+
+    def _accumulate(self, start, y):
+        ring = self._ring
+        a = start % len(ring)
+        b = min(len(ring), a + len(y))
+        ring[a:b] += y[:b - a]
+        ring[:len(y) - (b - a)] += y[b - a:]
+
+    def process(self, x):
+        """Convolve one block of `block` input samples; returns `block` output samples."""
+        x = np.asarray(x, dtype=np.float64)
+        if x.shape != (self.block,):
+            raise ValueError(f"每次必须输入 {self.block} 个采样 (单通道)")
+        self._t += self.block
+        for seg in self.segments:
+            y = seg.push(x)
+            if y is not None:
+                # y is the segment's convolution for input times [t - N, t), heard o samples later
+                self._accumulate(self._t - seg.size + seg.offset, y)
+        ring = self._ring
+        a = (self._t - self.block) % len(ring)
+        out = ring[a:a + self.block].copy()
+        ring[a:a + self.block] = 0
+        return out
+
+    def reset(self):
+        for seg in self.segments:
+            seg.fdl[:] = 0
+            seg.window[:] = 0
+            seg.fill = seg.pos = 0
+        self._ring[:] = 0
+        self._t = 0
+
+
+def render(x, ir, block=RENDER_BLOCK, batch=RENDER_BATCH):
+    """Offline convolution of a long signal with an IR (full length output).
+
+    Uniformly partitioned overlap-save with large blocks; `batch` input
+    blocks are transformed and multiplied at a time, so memory stays at
+    about (batch + partitions) spectra regardless of the signal length.
+
+    Args:
+        x: (frames,) or (frames, channels) signal; every channel is convolved
+        ir: (taps,) impulse response
+
+    Returns:
+        array of len(x) + len(ir) - 1 frames, same channel layout as x
+    """
+    x = np.asarray(x, dtype=np.float64)
+    h = np.asarray(ir, dtype=np.float64)
+    if x.ndim == 2:
+        return np.stack([render(x[:, ch], h, block, batch) for ch in range(x.shape[1])], axis=1)
+    n = 1 << int(np.ceil(np.log2(max(1, min(block, len(h))))))
+    count = -(-len(h) // n)
+    parts = np.zeros((count, 2 * n))
+    parts[:, :n] = _split(h, n, count)
+    spectra = np.fft.rfft(parts, axis=1)
+
+    total = len(x) + len(h) - 1
+    blocks = -(-total // n)
+    padded = np.zeros((blocks + 1) * n)
+    padded[n:n + len(x)] = x
+    out = np.empty(blocks * n)
+    history = np.zeros((count - 1, n + 1), dtype=complex)  # spectra of the previous blocks
+    for first in range(0, blocks, batch):
+        last = min(blocks, first + batch)
+        # frame j holds input samples [(j - 1) n, (j + 1) n)
+        frames = np.lib.stride_tricks.sliding_window_view(padded[first * n:(last + 1) * n], 2 * n)[::n]
+        spec = np.concatenate([history, np.fft.rfft(frames, axis=1)])
+        acc = np.zeros((last - first, n + 1), dtype=complex)
+        for p in range(count):
+            acc += spec[count - 1 - p:count - 1 - p + last - first] * spectra[p]
+        out[first * n:last * n] = np.fft.irfft(acc, axis=1)[:, n:].reshape(-1)
+        history = spec[len(spec) - (count - 1):] if count > 1 else history
+    return out[:total]
+
+
+def stream(x, ir, block=HEAD_BLOCK, max_block=MAX_BLOCK):
+    """Yield output blocks of x convolved with ir, as a live engine would (tail included)."""
+    engine = PartitionedConvolver(ir, block, max_block)
+    x = np.asarray(x, dtype=np.float64)
+    total = len(x) + engine.length - 1
+    for start in range(0, total, block):
+        chunk = np.zeros(block)
+        seg = x[start:start + block]
+        chunk[:len(seg)] = seg
+        yield engine.process(chunk)
+
+
+PARTS = ("full", "direct", "early", "late")
+
+
+def ir_part(ir, part="full", cfg=None):
+    """The whole IR or one of its separate_ir_components() parts (zero outside its window)."""
+    if part == "full":
+        return np.asarray(ir, dtype=np.float64)
+    from core.separate import component_spans
+
+    if part not in PARTS:
+        raise ValueError(f"未知的IR部分: {part} (可选: {', '.join(PARTS)})")
+    a, b = component_spans(ir, cfg)[part]
+    h = np.zeros(b)
+    h[a:b] = ir[a:b]
+    return h
+
+
+def load_source(path, fs):
+    """Read a dry signal as mono float64, resampled to fs when needed."""
+    import math
+    import soundfile as sf
+
+    x, src_fs = sf.read(path, dtype="float64", always_2d=True)
+    x = x.mean(axis=1)
+    if src_fs != fs:
+        from scipy.signal import resample_poly
+
+        g = math.gcd(int(src_fs), int(fs))
+        x = resample_poly(x, fs // g, src_fs // g)
+    return x
+
+
+def play(x, ir, fs, block=256, max_block=MAX_BLOCK):
+    """Play x through the IR live, convolving block by block in the sounddevice callback."""
+    import threading
+    import sounddevice as sd
+
+    engine = PartitionedConvolver(ir, block, max_block)
+    gain = 1.0 / max(np.sqrt(np.sum(np.square(ir))), 1e-12)  # unit-energy IR keeps the loudness
+    total = len(x) + engine.length - 1
+    state = {"pos": 0}
+    finished = threading.Event()
+
+    def callback(outdata, frames, time_info, status):
+        pos = state["pos"]
+        chunk = np.zeros(block)
+        seg = x[pos:pos + block]
+        chunk[:len(seg)] = seg
+        outdata[:, 0] = np.clip(engine.process(chunk) * gain, -1, 1)
+        state["pos"] = pos + block
+        if state["pos"] >= total:
+            raise sd.CallbackStop
+
+    with sd.OutputStream(samplerate=fs, blocksize=block, channels=1, callback=callback,
+                         finished_callback=finished.set):
+        finished.wait()
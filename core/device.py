@@ -1,9 +1,44 @@
+"""
+音频设备选择与设备延迟校准
+
+    python run.py calibrate                       校准当前设备 (3 次短扫频)
+    python run.py calibrate --loopback 1          输入通道 1 接了输出的回环线：同时测量测量链的频响
+    python run.py calibrate --list                列出已保存的设备档案
+
+同一对输入/输出设备 (同一主机 API、同一采样率) 的播放-录音延迟是固定的。校准把延迟、
+电平和 (有回环通道时) 声卡本身的频响保存到 data/devices/profiles.json。
+之后的测量自动选用最近校准的设备，不再询问，同步只在延迟附近的小窗口内
+搜索 (见 core.sync.sync_window)，IR 中除去测量链的频响 (见 core.ir.compensate_chain)。
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+
+PROFILE_PATH = "data/devices/profiles.json"
+CALIBRATION_SWEEP = 2.0     # seconds
+CALIBRATION_SILENCE = 0.1   # seconds before the sweep
+CHAIN_WINDOW = 0.05         # loopback IR length used for the chain response, seconds
+CHAIN_POINTS_PER_OCTAVE = 6
 
-import sounddevice as sd
 
 def choose_device():
-    """让用户分别选择麦克风（输入）和扬声器（输出）设备"""
+    """让用户分别选择麦克风（输入）和扬声器（输出）设备
+
+    If the most recently calibrated device pair (see calibrate()) is
+    connected, it is selected without asking. Returns (input_id, output_id).
+    """
+    import sounddevice as sd
+
     devices = sd.query_devices()
+    ids = profile_devices(devices, last_profile())
+    if ids is not None:
+        sd.default.device = ids
+        print(f"✅ 使用已校准的音频设备: 🎤 {devices[ids[0]]['name']} / 🔊 {devices[ids[1]]['name']}")
+        return ids
 
     # 获取输入设备列表
     input_devices = []
@@ -78,3 +113,289 @@ def choose_device():
     except Exception as e:
         print(f"❌ 声卡选择失败: {e}")
         raise SystemExit
+    return inp, outp
+
+
+def list_devices():
+    """Audio devices as dicts (id, name, inputs, outputs, samplerate, default_input/output)."""
+    import sounddevice as sd
+
+    default_in, default_out = sd.default.device
+    return [{"id": i, "name": d["name"], "inputs": d["max_input_channels"],
+             "outputs": d["max_output_channels"], "samplerate": d["default_samplerate"],
+             "default_input": i == default_in, "default_output": i == default_out}
+            for i, d in enumerate(sd.query_devices())]
+
+
+def _match_device(devices, spec, kind):
+    """Index of the device given by an id or a (case-insensitive) name fragment."""
+    key = f"max_{kind}_channels"
+    spec = str(spec).strip()
+    if spec.isdigit():
+        idx = int(spec)
+        if idx < len(devices) and devices[idx][key] > 0:
+            return idx
+        raise ValueError(f"设备 {idx} 不是有效的{'输入' if kind == 'input' else '输出'}设备")
+    for i, d in enumerate(devices):
+        if d[key] > 0 and spec.lower() in d['name'].lower():
+            return i
+    raise ValueError(f"找不到名称包含 {spec!r} 的{'输入' if kind == 'input' else '输出'}设备")
+
+
+def select_devices(cfg=None):
+    """Non-interactive device selection for unattended runs (daemon, scripts).
+
+    cfg.device_select (config/audio.yaml):
+        auto                 the most recently calibrated device pair when it is
+                             connected, else the system default devices, else
+                             the first usable ones
+        "<input>,<output>"   device ids or name fragments, e.g. "UMC,UMC"
+
+    Returns:
+        (input_id, output_id); also set as sounddevice's default
+    """
+    import sounddevice as sd
+    from utils.config import get_config
+
+    cfg = cfg or get_config()
+    devices = sd.query_devices()
+    spec = cfg.device_select.strip()
+    calibrated = profile_devices(devices, last_profile()) if spec.lower() == "auto" else None
+    if calibrated is not None:
+        inp, outp = calibrated
+    elif spec.lower() == "auto":
+        ids = []
+        for default, kind in zip(sd.default.device, ("input", "output")):
+            if default is not None and 0 <= default < len(devices) and devices[default][f"max_{kind}_channels"] > 0:
+                ids.append(default)
+                continue
+            usable = [i for i, d in enumerate(devices) if d[f"max_{kind}_channels"] > 0]
+            if not usable:
+                raise RuntimeError(f"没有找到可用的{'输入' if kind == 'input' else '输出'}设备")
+            ids.append(usable[0])
+        inp, outp = ids
+    else:
+        parts = spec.split(",")
+        if len(parts) == 1:
+            parts = parts * 2
+        inp = _match_device(devices, parts[0], "input")
+        outp = _match_device(devices, parts[1], "output")
+
+    sd.default.device = (inp, outp)
+    print(f"✅ 自动选择音频设备: 🎤 {devices[inp]['name']} / 🔊 {devices[outp]['name']}")
+    return inp, outp
+
+
+def device_key(inp, outp, fs):
+    """Profile key of a device pair: host API, input and output device names, sample rate."""
+    import sounddevice as sd
+
+    devices = sd.query_devices()
+    hostapi = sd.query_hostapis(devices[inp]["hostapi"])["name"]
+    return f"{hostapi}|{devices[inp]['name']}|{devices[outp]['name']}|{int(fs)}"
+
+
+def load_profiles(path=PROFILE_PATH):
+    """Stored calibration profiles: {"profiles": {key: profile}, "last": key or None}."""
+    if not os.path.exists(path):
+        return {"profiles": {}, "last": None}
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    data.setdefault("profiles", {})
+    data.setdefault("last", None)
+    return data
+
+
+def save_profile(profile, path=PROFILE_PATH):
+    """Store (or replace) a profile under profile["key"] and make it the last calibrated one."""
+    data = load_profiles(path)
+    data["profiles"][profile["key"]] = profile
+    data["last"] = profile["key"]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return profile
+
+
+def find_profile(key, path=PROFILE_PATH):
+    """The stored profile for a device key, or None."""
+    return load_profiles(path)["profiles"].get(key)
+
+
+def last_profile(path=PROFILE_PATH):
+    """The most recently calibrated profile, or None."""
+    data = load_profiles(path)
+    return data["profiles"].get(data["last"]) if data["last"] else None
+
+
+def profile_devices(devices, profile):
+    """(input_id, output_id) of the devices named in profile, or None when they are not connected."""
+    import sounddevice as sd
+
+    if not profile or profile.get("simulated"):
+        return None
+    ids = []
+    for name, kind in ((profile["input"], "input"), (profile["output"], "output")):
+        match = [i for i, d in enumerate(devices)
+                 if d["name"] == name and d[f"max_{kind}_channels"] > 0
+                 and sd.query_hostapis(d["hostapi"])["name"] == profile["hostapi"]]
+        if not match:
+            return None
+        ids.append(match[0])
+    return tuple(ids)
+
+
+def profile_config(cfg, profile):
+    """cfg with a device profile applied: sync_latency, and chain_response when it was measured."""
+    overrides = {"sync_latency": profile["latency_s"]}
+    if profile.get("response"):
+        overrides["chain_response"] = tuple(tuple(p) for p in profile["response"])
+    return cfg.with_overrides(**overrides)
+
+
+def use_devices(cfg=None, interactive=False, path=PROFILE_PATH):
+    """Select the audio devices and apply their calibration profile, if any.
+
+    interactive=True lists the devices and asks (choose_device()) unless a
+    calibrated pair is connected; otherwise select_devices(cfg) is used.
+
+    Returns:
+        cfg, with sync_latency / chain_response from the profile when the
+        selected pair has been calibrated at cfg.fs
+    """
+    from utils.config import get_config
+
+    cfg = cfg or get_config()
+    inp, outp = choose_device() if interactive else select_devices(cfg)
+    profile = find_profile(device_key(inp, outp, cfg.fs), path)
+    if profile is None:
+        print("💡 该设备组合尚未校准 (python run.py calibrate)，使用完整互相关同步")
+        return cfg
+    print(f"📐 设备档案: 延迟 {profile['latency_s'] * 1000:.2f} ms"
+          + (", 补偿测量链频响" if profile.get("response") else ""))
+    return profile_config(cfg, profile)
+
+
+def _start(rec, sig):
+    """Recording position of the first sample of sig (full cross-correlation)."""
+    from core.sync import sync_and_trim
+
+    return len(rec) - len(sync_and_trim(rec, sig))
+
+
+def _chain_response(ir, ideal, fs, grid):
+    """Smoothed magnitude response (dB, 0 dB mean) of a loopback IR against the ideal sweep IR.
+
+    Both are cut to CHAIN_WINDOW from just before their peaks, so the
+    response is resolved down to about 1 / CHAIN_WINDOW Hz.
+    """
+    from core.eq import power_spectrum
+
+    n, pre = int(CHAIN_WINDOW * fs), int(0.001 * fs)
+    parts = []
+    for x in (ir, ideal):
+        i = max(0, int(np.argmax(np.abs(x))) - pre)
+        parts.append(power_spectrum(x[i:i + n], fs, grid))
+    db = 10 * np.log10(np.maximum(parts[0], 1e-30) / np.maximum(parts[1], 1e-30))
+    return db - db.mean()
+
+
+def calibrate(cfg=None, loopback=None, takes=3, simulate=False, path=PROFILE_PATH, save=True):
+    """Measure and store the latency profile of the selected device pair.
+
+    Plays `takes` short sweeps (CALIBRATION_SWEEP seconds). The latency is
+    the recording position of the played signal on the loopback channel
+    when there is one (the electrical latency alone), else on channel 0
+    (the acoustic path at the calibration position included). The gain is
+    the level of the deconvolved peak on channel 0 relative to a lossless
+    chain. With a loopback channel the smoothed magnitude response of the
+    chain is stored too; measurements divide it out of the IR.
+
+    Args:
+        loopback: input channel wired straight to the output, or None
+        simulate: use core.simulate instead of a sound card
+
+    Returns:
+        the profile dict (also saved to path when save=True)
+    """
+    import scipy.signal as sps
+    from core.eq import log_grid
+    from core.sweep import generate_sweep
+    from utils.config import get_config
+
+    cfg = cfg or get_config()
+    if takes < 1:
+        raise ValueError("校准次数至少为 1")
+    channels = max(cfg.input_channels, loopback + 1 if loopback is not None else 1)
+    cal = cfg.with_overrides(sweep_duration=CALIBRATION_SWEEP, silence_pre=CALIBRATION_SILENCE,
+                             silence_post=0.0, record_tail=0.5, input_channels=channels,
+                             dtype="float64", sync_latency=-1.0, chain_response=())
+    if simulate:
+        profile = {"key": f"simulated|{int(cfg.fs)}", "hostapi": "simulated", "input": "simulated",
+                   "output": "simulated", "simulated": True}
+    else:
+        import sounddevice as sd
+
+        inp, outp = select_devices(cfg)
+        devices = sd.query_devices()
+        profile = {"key": device_key(inp, outp, cfg.fs),
+                   "hostapi": sd.query_hostapis(devices[inp]["hostapi"])["name"],
+                   "input": devices[inp]["name"], "output": devices[outp]["name"]}
+    sig, inv = generate_sweep(cal, save=False)
+    ideal = sps.fftconvolve(sig, inv)
+    ideal_peak = float(np.max(np.abs(ideal)))
+    grid = log_grid(max(cal.sweep_freq_min, 1 / CHAIN_WINDOW), min(cal.sweep_freq_max, 0.45 * cal.fs),
+                    CHAIN_POINTS_PER_OCTAVE)
+
+    print(f"📐 设备校准: {takes} 次 {CALIBRATION_SWEEP:g} 秒扫频"
+          + (f", 回环通道 {loopback}" if loopback is not None else ""))
+    latencies, gains, responses = [], [], []
+    for n in range(takes):
+        if simulate:
+            from core.simulate import simulate_recording
+            rec = simulate_recording(sig, cal, loopback=loopback)
+        else:
+            from core.record import play_and_record
+            rec = play_and_record(sig, cal, save=False)
+        rec = np.asarray(rec, dtype=np.float64).reshape(len(rec), -1)
+        start = _start(rec[:, 0], sig)
+        peak = np.max(np.abs(sps.fftconvolve(rec[start:, 0], inv)))
+        gains.append(20 * np.log10(max(peak, 1e-30) / ideal_peak))
+        if loopback is not None:
+            start = _start(rec[:, loopback], sig)
+            responses.append(_chain_response(sps.fftconvolve(rec[start:, loopback], inv), ideal, cal.fs, grid))
+        latencies.append(start / cal.fs)
+        print(f"   #{n + 1}: 延迟 {latencies[-1] * 1000:.2f} ms, 电平 {gains[-1]:+.1f} dB")
+
+    profile.update({
+        "fs": int(cfg.fs),
+        "latency_s": float(np.median(latencies)),
+        "jitter_s": float(np.max(latencies) - np.min(latencies)),
+        "gain_db": float(np.median(gains)),
+        "loopback": loopback,
+        "response": [[round(float(f), 2), round(float(d), 3)] for f, d in zip(grid, np.mean(responses, axis=0))]
+                    if responses else [],
+        "takes": takes,
+        "calibrated": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    if profile["jitter_s"] * cal.fs > 1:
+        print(f"⚠️ 延迟不稳定 (各次相差 {profile['jitter_s'] * 1000:.2f} ms)，同步窗口可能失效")
+    if save:
+        save_profile(profile, path)
+        print(f"✅ 设备档案已保存: {path}")
+    return profile
+
+
+def format_profile(profile):
+    """One-line summary of a stored profile."""
+    chain = ""
+    if profile.get("response"):
+        db = [d for _, d in profile["response"]]
+        chain = f", 测量链频响 {min(db):+.1f}~{max(db):+.1f} dB (回环通道 {profile['loopback']})"
+    return (f"{profile['input']} / {profile['output']} ({profile['hostapi']}, {profile['fs']} Hz): "
+            f"延迟 {profile['latency_s'] * 1000:.2f} ms (抖动 {profile['jitter_s'] * 1000:.2f} ms), "
+            f"电平 {profile['gain_db']:+.1f} dB{chain} [{profile['calibrated']}]")
@@ -0,0 +1,236 @@
+"""
+时钟漂移检测与补偿 - 麦克风和扬声器不在同一时钟上时使用
+
+    python run.py measure --set drift_correction=auto     自动估计并补偿 (默认)
+    python run.py measure --set drift_correction=off      关闭
+    python run.py measure --set drift_correction=-23.5    使用已知漂移 (ppm)
+
+两个声卡各自的晶振频率略有差别 (典型 10~100 ppm)，录音相对扫频被均匀拉伸，
+sync_and_trim 只能对齐一个固定偏移，高频段的IR因此被抹平。
+
+估计: 在扫频中取几段各一个倍频程的短信号 (起始频率从 1 kHz 到 16 kHz，时间间隔尽量大)，
+分别与录音做互相关，用抛物线插值得到亚采样时延，对时间做直线拟合，斜率即漂移。
+补偿: 带窗 sinc 多相插值表 (相位间线性插值) 的分数重采样器，
+按块计算，内存占用与录音长度无关。
+"""
+
+import math
+
+import numpy as np
+
+from utils.config import get_config
+
+
+SEGMENT_FREQS = (1000.0, 16000.0)  # sweep frequency at the start of the first/last segment
+SEGMENT_OCTAVES = 1.0          # bandwidth of each segment
+SEGMENTS = 5
+MAX_PPM = 1000.0               # search range of the per-segment delay
+MIN_SHIFT = 0.5                # samples; "auto" leaves drifts adding up to less over the sweep alone
+MAX_RESIDUAL = 0.5             # samples; segments further off the line are dropped
+MAX_COARSE_RESIDUAL = 2.0      # samples, same for the first (envelope) pass
+REFINE_PASSES = 2
+
+TAPS = 32
+PHASES = 512
+CHUNK = 1 << 15
+
+
+def segments(cfg, count=SEGMENTS, octaves=SEGMENT_OCTAVES):
+    """(start sample in the played signal, length) of the segments used for the drift estimate.
+
+    Each segment spans `octaves` of the sweep, so its correlation peak is
+    about as sharp as a band-limited IR of that width and stays on the
+    direct sound.
+    """
+    fs, T = cfg.fs, cfg.sweep_duration
+    f1, f2 = cfg.sweep_freq_min, cfg.sweep_freq_max
+    total = math.log2(f2 / f1)
+    length = T * min(1.0, octaves / total) if total > 0 else T
+    t0, t1 = (math.log2(min(max(f, f1), f2) / f1) / total * T for f in SEGMENT_FREQS)
+    t1 = min(t1, T - length)
+    t0 = min(t0, t1)
+    pre = int(cfg.silence_pre * fs)
+    return [(pre + int(t * fs), int(length * fs)) for t in np.linspace(t0, t1, count)]
+
+
+def _peak(xc):
+    """Sub-sample position of the maximum of xc (parabolic interpolation)."""
+    i = int(np.argmax(xc))
+    if 0 < i < len(xc) - 1:
+        a, b, c = xc[i - 1], xc[i], xc[i + 1]
+        den = a - 2 * b + c
+        if den < 0:
+            return i + 0.5 * (a - c) / den
+    return float(i)
+
+
+def _locate(ref, template, lo, hi, envelope=False):
+    """Sub-sample position of template within ref[lo:hi].
+
+    envelope=True takes the peak of the correlation envelope: coarser, but
+    immune to the carrier-cycle slips a stretched high-frequency segment
+    causes before the drift is known.
+    """
+    import scipy.signal as sps
+
+    lo, hi = max(0, lo), min(len(ref), hi)
+    if hi - lo < len(template):
+        return None
+    xc = sps.correlate(np.asarray(ref[lo:hi], dtype=np.float64), template, mode="valid", method="fft")
+    return lo + _peak(np.abs(sps.hilbert(xc)) if envelope else xc)
+
+
+def _fit(pos, found):
+    """Line fit found = offset + slope * pos; the segment furthest off it is
+    dropped if it is more than MAX_RESIDUAL samples off (at most one)."""
+    keep = np.ones(len(pos), dtype=bool)
+    while True:
+        slope, offset = np.polyfit(pos[keep], found[keep], 1)
+        error = np.abs(found - (offset + slope * pos))
+        worst = int(np.argmax(np.where(keep, error, -1)))
+        if error[worst] <= MAX_RESIDUAL or keep.sum() < max(3, len(pos)):
+            return slope, offset, keep, float(np.sqrt(np.mean(error[keep] ** 2)))
+        keep[worst] = False
+
+
+def estimate_drift(rec, sig, cfg=None, count=SEGMENTS, passes=REFINE_PASSES, window=None):
+    """Clock drift of a raw sweep recording against the played signal.
+
+    The highest segment is located anywhere in the recording; the others
+    are searched within MAX_PPM of the position that implies, using the
+    correlation envelope. The refinement passes stretch the segments by
+    the drift found so far and locate them again, first on the envelope
+    (the unstretched envelope peaks share a drift-dependent offset), then
+    on the correlation peak itself. One segment off the fitted line by more than MAX_RESIDUAL
+    samples (a reflection stronger than the direct sound in that band)
+    may be left out of the fit.
+
+    Args:
+        rec: raw recording (channel 0 is used)
+        sig: played signal (generate_sweep()[0])
+        window: core.sync.sync_window() of a calibrated device latency;
+            narrows the anchor search
+
+    Returns:
+        dict with ppm (positive: the recording has more samples than were
+        played), offset (recording position of sig's first sample),
+        residual (rms fit error of the kept segments, samples), reliable
+        (both the envelope and the final fit are consistent) and delays
+        [(position in sig, position in rec, kept)]
+    """
+    cfg = cfg or get_config()
+    ref = np.asarray(rec if rec.ndim == 1 else rec[:, 0])
+    parts = segments(cfg, count)
+    templates = [np.asarray(sig[a:a + n], dtype=np.float64) for a, n in parts]
+    last = parts[-1][0]
+    anchor = None
+    if window is not None:
+        slack = int(MAX_PPM * 1e-6 * last)
+        anchor = _locate(ref, templates[-1], window[0] + last - slack, window[1] + last + len(templates[-1]) + slack)
+    if anchor is None:
+        anchor = _locate(ref, templates[-1], 0, len(ref))
+    if anchor is None:
+        raise ValueError("录音太短，无法估计时钟漂移")
+    slope, offset, search = 1.0, anchor - last, int(MAX_PPM * 1e-6 * len(sig)) + 32
+    for step in range(passes + 1):
+        points = []
+        for (a, n), template in zip(parts, templates):
+            if step:
+                template = resample(template, 1 / slope)
+            expected = int(round(offset + slope * a))
+            found = _locate(ref, template, expected - search, expected + len(template) + search, envelope=step < 2)
+            if found is not None:
+                points.append((a, found))
+        if len(points) < 2:
+            raise ValueError("录音太短或扫频太短，无法估计时钟漂移")
+        pos, found = (np.array(v, dtype=np.float64) for v in zip(*points))
+        slope, offset, keep, residual = _fit(pos, found)
+        if not step:
+            coarse = residual
+        elif step == 1:
+            search = 8
+    ppm = float((slope - 1) * 1e6)
+    return {"ppm": ppm, "offset": float(offset), "residual": residual,
+            "reliable": coarse <= MAX_COARSE_RESIDUAL and residual <= MAX_RESIDUAL and abs(ppm) <= MAX_PPM,
+            "delays": [(int(p), float(f), bool(k)) for p, f, k in zip(pos, found, keep)]}
+
+
+def _table(taps=TAPS, phases=PHASES, cutoff=0.95):
+    """Windowed-sinc interpolation filters for phases 0..phases (inclusive), (phases + 1, taps)."""
+    frac = np.arange(phases + 1)[:, None] / phases
+    k = np.arange(taps)[None, :] - (taps // 2 - 1) - frac
+    h = cutoff * np.sinc(cutoff * k) * np.kaiser(taps, 8.0)[None, :]
+    return h / h.sum(axis=1, keepdims=True)
+
+
+def resample(x, ratio, offset=0.0, length=None, cfg=None, taps=TAPS, phases=PHASES, chunk=CHUNK):
+    """Fractional resampling y[n] = x(offset + ratio * n) of a 1-D or (frames, channels) signal.
+
+    The interpolation filter for each output sample is looked up in a
+    polyphase table and linearly interpolated between neighbouring phases.
+    Output is computed in chunks of `chunk` samples that read only the
+    input they need, so x may be a memmap; the output buffer itself comes
+    from utils.memory.empty() (disk-backed beyond cfg.memory_budget_mb).
+    """
+    from utils.memory import empty
+
+    x = np.asarray(x) if not isinstance(x, np.memmap) else x
+    dtype = x.dtype if x.dtype in (np.float32, np.float64) else np.dtype(np.float64)
+    if length is None:
+        length = max(0, int(math.floor((len(x) - 1 - offset) / ratio)) + 1)
+    if x.ndim == 2:
+        y = empty((length, x.shape[1]), dtype, cfg, name="drift")
+        for ch in range(x.shape[1]):
+            y[:, ch] = resample(x[:, ch], ratio, offset, length, cfg, taps, phases, chunk)
+        return y
+    table = _table(taps, phases)
+    half = taps // 2 - 1
+    y = empty(length, dtype, cfg, name="drift")
+    k = np.arange(taps)
+    for a in range(0, length, chunk):
+        t = offset + ratio * np.arange(a, min(a + chunk, length), dtype=np.float64)
+        i = np.floor(t)
+        p = (t - i) * phases
+        j = np.minimum(p.astype(np.int64), phases - 1)
+        w = (p - j)[:, None]
+        h = (1 - w) * table[j] + w * table[j + 1]
+        # input window of this chunk, zero beyond the ends of x
+        lo = int(i[0]) - half
+        hi = int(i[-1]) - half + taps
+        window = np.zeros(hi - lo, dtype=np.float64)
+        src = x[max(lo, 0):min(hi, len(x))]
+        window[max(lo, 0) - lo:max(lo, 0) - lo + len(src)] = src
+        y[a:a + len(t)] = np.einsum("ij,ij->i", h, window[(i.astype(np.int64) - half - lo)[:, None] + k])
+    return y
+
+
+def correct_drift(rec, sig, cfg=None):
+    """Estimate (per cfg.drift_correction) and undo the clock drift of a raw recording.
+
+    cfg.drift_correction: "auto" (estimate; resample when the drift adds up
+    to MIN_SHIFT samples over the sweep and the fit is consistent), "off", or a known drift in ppm. Run it
+    before sync_and_trim: a drifting recording also misleads the
+    full-sweep synchronisation.
+
+    Returns:
+        (recording, drift dict or None); the recording is rec itself when
+        nothing was corrected
+    """
+    from core.sync import sync_window
+
+    cfg = cfg or get_config()
+    mode = cfg.drift_correction.strip().lower()
+    if mode == "off":
+        return rec, None
+    if mode == "auto":
+        drift = estimate_drift(rec, sig, cfg, window=sync_window(cfg))
+        if not drift["reliable"]:
+            print("⚠️ 时钟漂移估计不可靠 (各频段时延不一致)，未补偿")
+            return rec, drift
+        if abs(drift["ppm"]) * 1e-6 * cfg.sweep_duration * cfg.fs < MIN_SHIFT:
+            return rec, drift
+    else:
+        drift = {"ppm": float(mode), "offset": None, "residual": None, "reliable": True, "delays": []}
+    out = resample(rec, 1 + drift["ppm"] * 1e-6, cfg=cfg)
+    print(f"🕐 时钟漂移 {drift['ppm']:+.1f} ppm，已重采样补偿")
+    return out, drift
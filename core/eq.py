@@ -0,0 +1,299 @@
+"""
+房间均衡器设计 - 由一个或多个测量IR自动拟合参量均衡 (削减房间模态峰)
+
+    python run.py eq data/sessions/*/*/ir.scir --bands 10 --range 20,300
+    python run.py eq ir.wav --fir 4096 --format json,minidsp
+
+各位置的频响按功率平均后做分数倍频程平滑，在对数频率网格上与目标曲线比较。
+每一步把一组候选峰值滤波器 (中心频率 × Q × 增益) 的频响一次性算成矩阵，
+选出误差最小的那个；全部滤波器放好后再做几轮联合微调。
+结果可导出为 JSON / CSV / miniDSP 双二阶系数 / REW·Equalizer APO 滤波器设置；
+FIR 则导出为 JSON / 抽头 CSV / miniDSP FIR 系数文件 / Equalizer APO 卷积 (WAV)。
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+FIT_RANGE = (20.0, 300.0)
+MAX_CUT_DB = -15.0
+MAX_BOOST_DB = 0.0   # only cut peaks; boosting room nulls wastes headroom
+Q_RANGE = (0.7, 15.0)
+POINTS_PER_OCTAVE = 48
+FORMATS = ("json", "csv", "minidsp", "apo")
+
+
+def log_grid(fmin=20.0, fmax=20000.0, points_per_octave=POINTS_PER_OCTAVE):
+    """Logarithmically spaced frequencies from fmin to fmax."""
+    n = int(np.ceil(np.log2(fmax / fmin) * points_per_octave)) + 1
+    return fmin * 2 ** (np.arange(n) / points_per_octave)
+
+
+def power_spectrum(ir, fs, grid, fraction=6):
+    """Power response of an IR averaged over 1/fraction-octave bands centred on grid.
+
+    Band averages come from a cumulative sum over the FFT bins, so every
+    grid point costs two lookups however wide its band is.
+    """
+    ir = np.asarray(ir, dtype=np.float64)
+    n = 1 << int(np.ceil(np.log2(max(len(ir), int(4 * fs / grid[0])))))
+    power = np.abs(np.fft.rfft(ir, n)) ** 2
+    cum = np.concatenate([[0.0], np.cumsum(power)])
+    df = fs / n
+    half = 2 ** (1 / (2 * fraction))
+    lo = np.clip(np.floor(grid / half / df).astype(int), 0, len(power) - 1)
+    hi = np.clip(np.ceil(grid * half / df).astype(int), lo + 1, len(power))
+    return (cum[hi] - cum[lo]) / (hi - lo)
+
+
+def average_response(irs, fs, grid, fraction=6):
+    """Spatially averaged (power mean) smoothed response in dB, normalised to 0 dB peak."""
+    power = np.mean([power_spectrum(ir, fs, grid, fraction) for ir in irs], axis=0)
+    db = 10 * np.log10(np.maximum(power, 1e-30))
+    return db - db.max()
+
+
+def peaking(fc, q, gain_db, fs):
+    """RBJ cookbook peaking biquads, vectorised over fc/q/gain.
+
+    Returns:
+        (b, a): arrays (..., 3), normalised so that a[..., 0] == 1
+    """
+    fc, q, gain_db = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (fc, q, gain_db)))
+    A = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * fc / fs
+    alpha = np.sin(w0) / (2 * q)
+    cos = np.cos(w0)
+    a0 = 1 + alpha / A
+    b = np.stack([1 + alpha * A, -2 * cos, 1 - alpha * A], axis=-1) / a0[..., None]
+    a = np.stack([np.ones_like(a0), -2 * cos / a0, (1 - alpha / A) / a0], axis=-1)
+    return b, a
+
+
+def response_db(b, a, grid, fs):
+    """Magnitude response (dB) of biquads (..., 3) at the grid frequencies -> (..., len(grid))."""
+    z = np.exp(-1j * 2 * np.pi * np.asarray(grid) / fs)
+    powers = np.stack([np.ones_like(z), z, z * z])  # (3, G)
+    num = np.abs(b @ powers)
+    den = np.abs(a @ powers)
+    return 20 * np.log10(np.maximum(num, 1e-30) / np.maximum(den, 1e-30))
+
+
+def _candidates(fc, q, gain, fs, grid, spread=(0.85, 1.0, 1.18), q_steps=(0.6, 0.8, 1.0, 1.25, 1.6),
+                gain_steps=(0.7, 0.85, 1.0, 1.15, 1.3)):
+    """All (fc, q, gain) combinations around a starting point, with their responses."""
+    f, qq, g = np.meshgrid(fc * np.asarray(spread), np.clip(q * np.asarray(q_steps), *Q_RANGE),
+                           gain * np.asarray(gain_steps), indexing="ij")
+    f, qq, g = f.ravel(), qq.ravel(), g.ravel()
+    b, a = peaking(f, qq, g, fs)
+    return f, qq, g, response_db(b, a, grid, fs)
+
+
+def fit_peq(response, grid, fs, bands=10, target=None, fit_range=FIT_RANGE, max_cut_db=MAX_CUT_DB,
+            max_boost_db=MAX_BOOST_DB, refine=3):
+    """Fit a bank of peaking filters that pulls the response towards the target.
+
+    Args:
+        response: smoothed response in dB on grid (see average_response)
+        target: target curve in dB on grid; None: flat at the mean level in fit_range
+        fit_range: (fmin, fmax) where the error is measured and filters are placed
+        refine: joint refinement passes after the greedy placement
+
+    Returns:
+        list of {"type": "peaking", "fc", "q", "gain_db"} dicts, ordered by frequency
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    inside = (grid >= fit_range[0]) & (grid <= fit_range[1])
+    if not inside.any():
+        raise ValueError("拟合范围内没有频率点")
+    if target is None:
+        target = np.full_like(grid, np.mean(response[inside]))
+    error = (response - target)[inside]
+    g = grid[inside]
+    q_grid = np.geomspace(Q_RANGE[0], Q_RANGE[1], 12)
+
+    def clip(gain):
+        return np.clip(gain, max_cut_db, max_boost_db)
+
+    filters, curves = [], []
+    eq = np.zeros_like(error)
+    for _ in range(bands):
+        residual = error + eq
+        # cut the largest remaining peak (or fill the deepest dip when boosting is allowed)
+        score = np.where(residual > 0, residual, -residual if max_boost_db > 0 else 0)
+        k = int(np.argmax(score))
+        if score[k] < 0.5:
+            break
+        f, q, gain = np.meshgrid(g[max(0, k - 2):k + 3], q_grid, [clip(-residual[k])], indexing="ij")
+        b, a = peaking(f.ravel(), q.ravel(), gain.ravel(), fs)
+        resp = response_db(b, a, g, fs)
+        cost = np.sum((residual + resp) ** 2, axis=1)
+        best = int(np.argmin(cost))
+        filters.append([f.ravel()[best], q.ravel()[best], gain.ravel()[best]])
+        curves.append(resp[best])
+        eq += resp[best]
+
+    for _ in range(refine):
+        for i, (fc, q, gain) in enumerate(filters):
+            others = eq - curves[i]
+            f, qq, gg, resp = _candidates(fc, q, gain, fs, g)
+            keep = (gg >= max_cut_db) & (gg <= max_boost_db)
+            cost = np.where(keep, np.sum((error + others + resp) ** 2, axis=1), np.inf)
+            best = int(np.argmin(cost))
+            filters[i] = [f[best], qq[best], gg[best]]
+            curves[i] = resp[best]
+            eq = others + resp[best]
+
+    return [{"type": "peaking", "fc": float(fc), "q": float(q), "gain_db": float(gain)}
+            for fc, q, gain in sorted(filters) if abs(gain) >= 0.1]
+
+
+def filters_response(filters, grid, fs):
+    """Combined magnitude response (dB) of a list of peaking filters."""
+    if not filters:
+        return np.zeros(len(grid))
+    b, a = peaking([f["fc"] for f in filters], [f["q"] for f in filters],
+                   [f["gain_db"] for f in filters], fs)
+    return response_db(b, a, grid, fs).sum(axis=0)
+
+
+def fit_fir(response, grid, fs, taps=4096, target=None, fit_range=FIT_RANGE,
+            max_cut_db=MAX_CUT_DB, max_boost_db=MAX_BOOST_DB):
+    """Linear-phase FIR correction (firwin2) towards the target inside fit_range.
+
+    Outside fit_range the correction fades to 0 dB. Frequency resolution is
+    about fs / taps, so low modes need long filters.
+    """
+    from scipy.signal import firwin2
+
+    inside = (grid >= fit_range[0]) & (grid <= fit_range[1])
+    if target is None:
+        target = np.full_like(grid, np.mean(response[inside]))
+    correction = np.where(inside, np.clip(target - response, max_cut_db, max_boost_db), 0.0)
+    freq = np.concatenate([[0.0], grid[grid < fs / 2], [fs / 2]])
+    gain = 10 ** (np.concatenate([[correction[0]], correction[grid < fs / 2], [0.0]]) / 20)
+    return firwin2(taps + (taps % 2 == 0), freq, gain, fs=fs)
+
+
+def design(irs, fs, bands=10, fraction=6, fit_range=FIT_RANGE, fir_taps=None, **kwargs):
+    """Measured IRs -> spatially averaged smoothed response -> EQ.
+
+    Returns:
+        dict with grid, response, filters (peaking) or fir, corrected response and fs
+    """
+    grid = log_grid(20.0, min(20000.0, 0.45 * fs))
+    response = average_response(irs, fs, grid, fraction)
+    result = {"fs": fs, "grid": grid, "response": response, "fit_range": fit_range}
+    if fir_taps:
+        from scipy.signal import freqz
+
+        fir = fit_fir(response, grid, fs, fir_taps, fit_range=fit_range, **kwargs)
+        _, h = freqz(fir, worN=grid, fs=fs)
+        result["fir"] = fir
+        result["corrected"] = response + 20 * np.log10(np.maximum(np.abs(h), 1e-30))
+    else:
+        filters = fit_peq(response, grid, fs, bands, fit_range=fit_range, **kwargs)
+        result["filters"] = filters
+        result["corrected"] = response + filters_response(filters, grid, fs)
+    inside = (grid >= fit_range[0]) & (grid <= fit_range[1])
+    for key in ("response", "corrected"):
+        level = result[key][inside]
+        result[f"{key}_spread_db"] = float(np.std(level - level.mean()))
+    return result
+
+
+def _coefficients(filters, fs):
+    b, a = peaking([f["fc"] for f in filters], [f["q"] for f in filters],
+                   [f["gain_db"] for f in filters], fs)
+    return [dict(f, b=list(map(float, bb)), a=list(map(float, aa))) for f, bb, aa in zip(filters, b, a)]
+
+
+def export(result, base, formats=FORMATS):
+    """Write the EQ as base.json / base.csv / base_minidsp.txt / base_apo.txt; returns the paths.
+
+    miniDSP expects a1/a2 with the opposite sign of the usual
+    y = b·x - a·y convention, so they are negated in that file.
+
+    A FIR design is written as its taps instead: one per line for miniDSP's
+    FIR import, a tap table in the CSV, and for Equalizer APO a base_fir.wav
+    referenced by a Convolution line in base_apo.txt.
+    """
+    os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+    fs = result["fs"]
+    paths = {}
+    filters = _coefficients(result.get("filters", []), fs)
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"未知的导出格式: {fmt} (可选: {', '.join(FORMATS)})")
+        if "fir" in result and fmt != "json":
+            paths[fmt] = _export_fir(result["fir"], fs, base, fmt)
+            continue
+        if fmt == "json":
+            path = f"{base}.json"
+            data = {"fs": fs, "fit_range": list(result["fit_range"]), "filters": filters,
+                    "response_spread_db": result["response_spread_db"],
+                    "corrected_spread_db": result["corrected_spread_db"]}
+            if "fir" in result:
+                data["fir"] = [float(v) for v in result["fir"]]
+            with open(path, "w", encoding="utf-8") as fh:
+                json.dump(data, fh, ensure_ascii=False, indent=2)
+        elif fmt == "csv":
+            path = f"{base}.csv"
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write("band,type,fc_hz,q,gain_db,b0,b1,b2,a1,a2\n")
+                for i, f in enumerate(filters, 1):
+                    fh.write(f"{i},{f['type']},{f['fc']:.2f},{f['q']:.4f},{f['gain_db']:.2f},"
+                             + ",".join(f"{v:.12g}" for v in f["b"] + f["a"][1:]) + "\n")
+        elif fmt == "minidsp":
+            path = f"{base}_minidsp.txt"
+            with open(path, "w", encoding="utf-8") as fh:
+                for i, f in enumerate(filters, 1):
+                    b0, b1, b2 = f["b"]
+                    _, a1, a2 = f["a"]
+                    fh.write(f"biquad{i},\nb0={b0:.15g},\nb1={b1:.15g},\nb2={b2:.15g},\n"
+                             f"a1={-a1:.15g},\na2={-a2:.15g}{',' if i < len(filters) else ''}\n")
+        else:  # REW / Equalizer APO filter settings
+            path = f"{base}_apo.txt"
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write("Preamp: 0.0 dB\n")
+                for i, f in enumerate(filters, 1):
+                    fh.write(f"Filter {i}: ON PK Fc {f['fc']:.1f} Hz Gain {f['gain_db']:.1f} dB Q {f['q']:.2f}\n")
+        paths[fmt] = path
+    return paths
+
+
+def _export_fir(fir, fs, base, fmt):
+    if fmt == "csv":
+        path = f"{base}.csv"
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write("tap,coefficient\n")
+            for i, v in enumerate(fir):
+                fh.write(f"{i},{v:.12g}\n")
+    elif fmt == "minidsp":
+        path = f"{base}_minidsp.txt"
+        np.savetxt(path, fir, fmt="%.10e")
+    else:  # Equalizer APO convolves with a WAV next to its config file
+        import soundfile as sf
+
+        wav = f"{base}_fir.wav"
+        sf.write(wav, np.asarray(fir, dtype=np.float32), fs, subtype="FLOAT")
+        path = f"{base}_apo.txt"
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(f"Preamp: 0.0 dB\nConvolution: {os.path.basename(wav)}\n")
+    return path
+
+
+def load_irs(paths):
+    """Read IR files (WAV or .scir); all must share one sample rate. Returns (irs, fs)."""
+    from core.analysis import load_audio
+
+    irs, rates = [], set()
+    for path in paths:
+        ir, fs = load_audio(path)
+        irs.append(np.asarray(ir, dtype=np.float64))
+        rates.add(fs)
+    if len(rates) != 1:
+        raise ValueError(f"IR 采样率不一致: {sorted(rates)}")
+    return irs, rates.pop()
@@ -0,0 +1,254 @@
+"""
+脉冲声源测量 - 不能播放大声扫频的场所，用拍手、气球、发令枪代替扫频
+
+    python run.py impulse --events 3                  连续录音，等待 3 次脉冲后平均
+    python run.py impulse --events 5 --length 2.0     混响较长的房间保留 2 秒
+    python run.py impulse --simulate                  模拟脉冲声源 (无需声卡)
+
+不经过 generate_sweep/extract_ir：声卡连续录音，按块送入 STA/LTA 能量比检测器
+(短时 1 ms 的单极点平滑能量，滤波器状态跨块保留；长时背景能量按块更新，跳过脉冲及其衰减)。
+能量比超过门限即为一次脉冲，以其后 5 ms 内的峰值 (直达声) 为起点截取 --length 秒，
+削波的事件丢弃。各事件按直达声互相关对齐 (含极性)，归一化后按峰值平方加权同步平均，
+得到的IR直接用于 RT60、C50 和倍频程分析。每次事件只需约 1 秒，
+而扫频测量需要 8 秒扫频加 3 秒尾部。
+"""
+
+import math
+import time
+
+import numpy as np
+
+from utils.config import get_config
+
+
+STA = 0.001             # short-term energy time constant, seconds
+LTA = 1.0               # long-term (background) energy time constant, seconds
+TRIGGER_DB = 25.0       # STA/LTA ratio counted as an impulse onset
+SEARCH = 0.005          # the direct sound is the peak within this long after the trigger, seconds
+PRE = 0.005             # kept before the direct sound, seconds
+LENGTH = 1.0            # kept after the direct sound, seconds
+ALIGN = 0.002           # window around the direct sound used for the fine alignment, seconds
+MAX_SHIFT = 0.0005      # fine alignment search range, seconds
+BLOCK = 0.05            # capture block, seconds
+FLOOR = 1e-12           # energy floor of the LTA (digital silence)
+
+
+class ImpulseDetector:
+    """Streaming STA/LTA onset detector that cuts out each impulsive event.
+
+    Feed consecutive capture blocks (any lengths) to push(); it returns the
+    events completed so far as dicts with onset (sample index of the direct
+    sound in the whole capture), peak (its value), level_db (peak dBFS),
+    ratio_db (STA/LTA at the trigger), clipped and ir (PRE + length
+    seconds, direct sound at PRE).
+
+    The STA is a one-pole average of the power, sample by sample; the LTA
+    (background) is the same over block mean powers, updated only with
+    blocks that no event touches, so an event's decay neither raises it
+    nor triggers again.
+    """
+
+    def __init__(self, fs, length=LENGTH, trigger_db=TRIGGER_DB, sta=STA, lta=LTA):
+        self.fs = fs
+        self.pre, self.search = int(PRE * fs), int(SEARCH * fs)
+        self.length = int(length * fs)
+        self.ratio = 10 ** (trigger_db / 10)
+        self.a_sta = 1.0 / max(1.0, sta * fs)
+        self.lta_samples = max(1.0, lta * fs)
+        self.sta = 0.0                      # STA filter state
+        self.lta = None                     # background power
+        self.buffer = np.zeros(0)
+        self.start = 0                      # capture index of buffer[0]
+        self.pending = None                 # (trigger index, ratio_db)
+        self.ready = 0                      # first index where a new trigger is accepted
+
+    def _trigger(self, sta, first, since):
+        """First STA/LTA crossing at or after capture index `since` in a block starting at `first`."""
+        hits = np.flatnonzero(sta[max(0, since - first):] > self.ratio * self.lta)
+        if not len(hits):
+            return None
+        i = max(0, since - first) + int(hits[0])
+        return first + i, 10 * math.log10(sta[i] / self.lta)
+
+    def push(self, block):
+        """Process one capture block; returns the events completed."""
+        import scipy.signal as sps
+
+        x = np.asarray(block, dtype=np.float64)
+        if x.ndim > 1:
+            x = x[:, 0]
+        if not len(x):
+            return []
+        p = x * x
+        if self.lta is None:
+            # warm-up: the first block's median power is the initial background
+            self.lta = self.sta = max(float(np.median(p)), FLOOR)
+        a = self.a_sta
+        sta, _ = sps.lfilter([a], [1.0, a - 1.0], p, zi=[(1.0 - a) * self.sta])
+        self.sta = float(sta[-1])
+        first = self.start + len(self.buffer)
+        self.buffer = np.concatenate([self.buffer, x])
+        quiet = self.pending is None and first >= self.ready
+        if self.pending is None:
+            self.pending = self._trigger(sta, first, self.ready)
+
+        events = []
+        while self.pending is not None:
+            trigger, ratio_db = self.pending
+            lo = trigger - self.start
+            if len(self.buffer) < lo + self.search + self.length:
+                break
+            window = self.buffer[max(0, lo - self.pre):lo + self.search]
+            onset = max(0, lo - self.pre) + int(np.argmax(np.abs(window)))
+            cut = np.zeros(self.pre + self.length)
+            begin = onset - self.pre
+            part = self.buffer[max(0, begin):onset + self.length]
+            cut[max(0, begin) - begin:max(0, begin) - begin + len(part)] = part
+            peak = float(self.buffer[onset])
+            events.append({"onset": self.start + onset, "peak": peak,
+                           "level_db": 20 * math.log10(max(abs(peak), 1e-12)), "ratio_db": ratio_db,
+                           "clipped": bool(np.any(np.abs(part) >= _clip_level())), "ir": cut})
+            self.ready = self.start + onset + self.length
+            # a further event later in this block
+            self.pending = self._trigger(sta, first, self.ready) if self.ready < first + len(x) else None
+
+        if quiet and self.pending is None and not events:
+            w = min(1.0, len(x) / self.lta_samples)
+            self.lta = max(FLOOR, (1 - w) * self.lta + w * float(np.mean(p)))
+
+        # keep only what a pending or future event can still need
+        keep_from = (self.pending[0] - self.pre if self.pending is not None
+                     else self.start + len(self.buffer) - self.pre - self.search)
+        drop = max(0, min(len(self.buffer), keep_from - self.start))
+        self.buffer = self.buffer[drop:]
+        self.start += drop
+        return events
+
+
+def _clip_level():
+    from core.quality import CLIP_LEVEL
+
+    return CLIP_LEVEL
+
+
+def average_events(events, fs):
+    """Synchronous average of cut events (ImpulseDetector output), direct sound at PRE.
+
+    Each event is normalised to a unit direct-sound peak and aligned with
+    the first one by cross-correlating ALIGN seconds around the direct
+    sound within +-MAX_SHIFT (the sign of the correlation also fixes the
+    polarity). All events share the background noise, so after the
+    normalisation a quiet event is noisier: each one is weighted by its
+    squared peak (inverse noise variance). Returns the averaged IR,
+    normalised to a unit peak.
+    """
+    if not events:
+        raise ValueError("没有可平均的脉冲事件")
+    pre, half, shift = int(PRE * fs), max(1, int(ALIGN * fs / 2)), max(1, int(MAX_SHIFT * fs))
+    ref = events[0]["ir"] / events[0]["ir"][pre]
+    weight = events[0]["ir"][pre] ** 2
+    total, weights = weight * ref, weight
+    seg = ref[pre - half:pre + half]
+    for event in events[1:]:
+        x = event["ir"] / abs(event["ir"][pre])
+        lags = range(-shift, shift + 1)
+        xc = [float(np.dot(seg, x[pre - half + k:pre + half + k])) for k in lags]
+        best = int(np.argmax(np.abs(xc)))
+        k, sign = lags[best], math.copysign(1.0, xc[best])
+        y = np.zeros_like(x)
+        if k >= 0:
+            y[:len(x) - k] = x[k:]
+        else:
+            y[-k:] = x[:k]
+        weight = event["ir"][pre] ** 2
+        total += weight * sign * y
+        weights += weight
+    ir = total / weights
+    peak = np.max(np.abs(ir))
+    return ir / peak if peak > 0 else ir
+
+
+def capture_events(cfg=None, count=3, length=LENGTH, trigger_db=TRIGGER_DB, timeout=60.0, simulate=False,
+                   source=None):
+    """Capture continuously until `count` usable (unclipped) impulsive events have been cut.
+
+    simulate=True feeds a core.simulate.simulate_impulses() capture (or
+    `source`, any 1-D capture) through the detector block by block instead
+    of a sound card.
+
+    Returns:
+        (usable events, all detected events)
+    """
+    cfg = cfg or get_config()
+    fs = cfg.fs
+    detector = ImpulseDetector(fs, length, trigger_db)
+    usable, found = [], []
+    block = int(BLOCK * fs)
+
+    def handle(events):
+        for event in events:
+            found.append(event)
+            if event["clipped"]:
+                print(f"   💥 #{len(found)}: {event['onset'] / fs:.2f} 秒, 峰值 {event['level_db']:.1f} dBFS"
+                      " ❌ 削波，已丢弃 (请离话筒远一些)")
+                continue
+            usable.append(event)
+            print(f"   💥 #{len(found)}: {event['onset'] / fs:.2f} 秒, 峰值 {event['level_db']:.1f} dBFS,"
+                  f" 能量比 {event['ratio_db']:.0f} dB ✅")
+
+    if simulate:
+        if source is None:
+            from core.simulate import simulate_impulses
+            source = simulate_impulses(cfg, times=[0.5 + 1.3 * length * k for k in range(count)])
+        for a in range(0, len(source), block):
+            handle(detector.push(source[a:a + block]))
+            if len(usable) >= count:
+                break
+        return usable, found
+
+    import queue
+    import sounddevice as sd
+
+    blocks = queue.Queue()
+    print(f"👂 等待脉冲声源 (拍手/气球/发令枪)，需要 {count} 次，最长 {timeout:.0f} 秒...")
+    with sd.InputStream(samplerate=fs, blocksize=block, channels=cfg.input_channels, dtype="float32",
+                        callback=lambda indata, frames, t, status: blocks.put(indata[:, 0].copy())):
+        deadline = time.monotonic() + timeout
+        while len(usable) < count and time.monotonic() < deadline:
+            try:
+                handle(detector.push(blocks.get(timeout=0.5)))
+            except queue.Empty:
+                continue
+    if len(usable) < count:
+        print(f"⚠️ 超时: 只得到 {len(usable)} 次可用脉冲")
+    return usable, found
+
+
+def measure_impulse(cfg=None, count=3, length=LENGTH, trigger_db=TRIGGER_DB, timeout=60.0, simulate=False,
+                    source=None):
+    """Impulsive-excitation measurement: capture, cut, align and average events, then analyze.
+
+    Returns:
+        dict with ir (averaged, unit peak, direct sound at PRE), events
+        (the usable ones, without their IRs), rejected (clipped) count,
+        rt60, c50, bands (octave T30/C50, truncated where the decay meets
+        the noise floor) and quality (core.quality.assess)
+    """
+    import contextlib
+    import io
+    from core.metrics import C50, RT60, band_metrics
+    from core.quality import assess
+
+    cfg = cfg or get_config()
+    usable, found = capture_events(cfg, count, length, trigger_db, timeout, simulate, source)
+    if not usable:
+        raise RuntimeError("没有检测到可用的脉冲 (请提高声源音量或降低 --trigger-db)")
+    ir = average_events(usable, cfg.fs)
+    quality = assess(ir, cfg)
+    end = int(round((quality["decay_end_s"] or quality["valid_s"]) * cfg.fs))
+    with contextlib.redirect_stdout(io.StringIO()):
+        rt60 = RT60(ir[:end], cfg=cfg)
+        bands = band_metrics(ir, cfg)
+    return {"ir": ir, "events": [{k: v for k, v in e.items() if k != "ir"} for e in usable],
+            "rejected": len(found) - len(usable), "rt60": rt60, "c50": C50(ir, cfg=cfg), "bands": bands,
+            "quality": quality}
@@ -2,25 +2,85 @@
 import os
 
 import numpy as np
-import scipy.signal as sig
-import soundfile as sf
 
-from utils.config import load_config
+from utils.config import get_config
+from utils.trace import traced
 
 
-fs = int(float(load_config().get("fs", 48000)))
+@traced()
+def extract_ir(rec,inv,cfg=None,save=True):
+    """Extract impulse response using deconvolution with inverse filter.
 
-def extract_ir(rec,inv):
-    """Extract impulse response using deconvolution with inverse filter."""
+    With save=False nothing is written to data/processed; otherwise the IR
+    is written both as ir.wav (for DAWs) and as the memory-mappable ir.scir.
+
+    Multichannel recordings (frames, channels) are deconvolved one channel
+    at a time into a single output buffer (spilled to disk if it exceeds
+    cfg.memory_budget_mb) and normalised in place.
+
+    cfg.chain_response (a calibrated device profile, see core.device) is
+    divided out of the IR before normalisation.
+    """
+    import scipy.signal as sig
+    from utils.memory import empty
+
+    cfg = cfg or get_config()
+    fs = cfg.fs
     print("🔄 提取脉冲响应中...")
-    ir=sig.fftconvolve(rec,inv,mode="full")
+    if rec.ndim == 1 and cfg.dtype == "float64":
+        ir=sig.fftconvolve(rec,inv,mode="full")
+    else:
+        dtype = np.dtype(cfg.dtype)
+        inv = inv.astype(dtype, copy=False)
+        frames = len(rec)+len(inv)-1
+        ir = empty((frames,) if rec.ndim == 1 else (frames, rec.shape[1]), dtype, cfg, name="ir")
+        for ch in range(1 if rec.ndim == 1 else rec.shape[1]):
+            x = rec if rec.ndim == 1 else rec[:, ch]
+            y = sig.fftconvolve(x.astype(dtype, copy=False), inv, mode="full")
+            if rec.ndim == 1:
+                ir[:] = y
+            else:
+                ir[:, ch] = y
+            del y
+    if cfg.chain_response:
+        compensate_chain(ir, cfg.chain_response, fs)
     peak=np.max(np.abs(ir))
     if peak>0:
         ir/=peak
     else:
         print("⚠️ 警告：IR峰值为0")
 
-    os.makedirs("data/processed",exist_ok=True)
-    sf.write("data/processed/ir.wav",ir,fs)
+    if save:
+        import soundfile as sf
+        from utils.irfile import DEFAULT_IR_PATH, record_latest_ir, write_ir
+        os.makedirs("data/processed",exist_ok=True)
+        sf.write("data/processed/ir.wav",ir,fs)
+        write_ir(DEFAULT_IR_PATH,ir,fs,config_hash=cfg.digest())
+        record_latest_ir(DEFAULT_IR_PATH)
     print(f"✅ IR提取完成，长度: {len(ir)/fs:.2f}秒")
     return ir
+
+
+CHAIN_LIMIT_DB = 20.0
+
+
+def compensate_chain(ir, response, fs, limit=CHAIN_LIMIT_DB):
+    """Divide the magnitude response of the measurement chain out of an IR, in place.
+
+    response: ((freq, dB), ...) as stored by core.device.calibrate(); it is
+    interpolated over log frequency (held constant beyond its ends) and the
+    correction is zero-phase and limited to +-limit dB. Each channel is
+    filtered through one zero-padded FFT, so the filter cannot wrap the
+    end of the IR onto its start.
+    """
+    freqs, db = (np.asarray(v, dtype=np.float64) for v in zip(*response))
+    n = 1 << int(np.ceil(np.log2(len(ir) + int(0.05 * fs))))
+    f = np.fft.rfftfreq(n, 1 / fs)
+    gain = np.interp(np.log(np.maximum(f, freqs[0])), np.log(freqs), db)
+    correction = 10 ** (-np.clip(gain, -limit, limit) / 20)
+    for ch in range(1 if ir.ndim == 1 else ir.shape[1]):
+        x = ir if ir.ndim == 1 else ir[:, ch]
+        y = np.fft.irfft(np.fft.rfft(x, n) * correction, n)
+        # zero-phase: the part before t=0 wrapped around to the end of the buffer is dropped
+        x[:] = y[:len(x)]
+    return ir
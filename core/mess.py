@@ -0,0 +1,112 @@
+"""
+多扫频法 (MESS) - 一次录音测量多个扬声器
+
+每个扬声器播放同一条指数扫频，第 k 个扬声器延迟 k·Δ 开始 (扫频相互重叠)。
+用一次去卷积得到的响应中，扬声器 k 的线性IR出现在 k·Δ 处，而其谐波失真
+出现在它之前 T·ln(n)/ln(f2/f1) 处。只要
+
+    Δ >= IR长度 + 最高考虑谐波的提前量
+
+各扬声器的IR和失真互不重叠，按时间加窗即可分开。N 个扬声器的总时长为
+T + (N-1)·Δ + 尾部，而不是 N·(T + 尾部)。
+
+    python run.py mess --speakers 4 --ir-length 1.5
+"""
+
+import math
+
+import numpy as np
+
+from utils.config import get_config
+
+
+HARMONICS = 3     # keep distortion products up to this order out of the neighbouring IR
+PRE_ONSET = 0.01  # seconds kept before each speaker's direct sound
+
+
+def harmonic_advance(cfg, order):
+    """How far (s) the order-th harmonic appears before the linear IR."""
+    return cfg.sweep_duration * math.log(order) / math.log(cfg.sweep_freq_max / cfg.sweep_freq_min)
+
+
+def sweep_offset(cfg=None, ir_length=1.5, harmonics=HARMONICS, guard=0.05):
+    """Start-time offset Δ (s) between consecutive speakers."""
+    cfg = cfg or get_config()
+    return ir_length + harmonic_advance(cfg, harmonics) + PRE_ONSET + guard
+
+
+def mess_durations(cfg, speakers, ir_length=1.5, harmonics=HARMONICS):
+    """(MESS capture seconds, one-sweep-per-speaker capture seconds)."""
+    one = cfg.silence_pre + cfg.sweep_duration + cfg.silence_post + cfg.record_tail
+    delta = sweep_offset(cfg, ir_length, harmonics)
+    return one + (speakers - 1) * delta, speakers * one
+
+
+def generate_mess(cfg=None, speakers=2, ir_length=1.5, harmonics=HARMONICS):
+    """Playback matrix with one time-offset sweep per speaker.
+
+    Returns:
+        (playback (frames, speakers), inverse filter, offset in samples)
+    """
+    from core.sweep import generate_sweep
+
+    cfg = cfg or get_config()
+    sig, inv = generate_sweep(cfg, save=False)
+    step = int(round(sweep_offset(cfg, ir_length, harmonics) * cfg.fs))
+    playback = np.zeros((len(sig) + (speakers - 1) * step, speakers), dtype=sig.dtype)
+    for k in range(speakers):
+        playback[k * step:k * step + len(sig), k] = sig
+    return playback, inv, step
+
+
+def separate_irs(rec, inv, cfg=None, speakers=2, step=None, ir_length=1.5):
+    """Deconvolve a MESS recording once and cut out one IR per speaker.
+
+    The common latency is found where the speakers' windows, folded on top
+    of each other, peak together; each IR then starts PRE_ONSET before
+    its expected position. All IRs share one normalisation, so relative
+    speaker levels are preserved.
+
+    Returns:
+        (frames, speakers) IR matrix
+    """
+    import scipy.signal as sps
+
+    cfg = cfg or get_config()
+    fs = cfg.fs
+    x = rec if rec.ndim == 1 else rec[:, 0]
+    h = sps.fftconvolve(x, inv.astype(x.dtype, copy=False), mode="full")
+    base = int(cfg.silence_pre * fs) + len(inv) - 1
+    length = int(ir_length * fs)
+    pre = int(PRE_ONSET * fs)
+
+    usable = [k for k in range(speakers) if base + k * step + step <= len(h)]
+    fold = np.zeros(step)
+    for k in usable:
+        seg = np.abs(h[base + k * step:base + (k + 1) * step])
+        fold[:len(seg)] = np.maximum(fold[:len(seg)], seg / (np.max(seg) or 1))
+    latency = int(np.argmax(fold))
+
+    irs = np.zeros((length, speakers), dtype=h.dtype)
+    for k in range(speakers):
+        start = max(0, base + k * step + latency - pre)
+        seg = h[start:start + length]
+        irs[:len(seg), k] = seg
+    peak = np.max(np.abs(irs))
+    if peak > 0:
+        irs /= peak
+    return irs
+
+
+def measure_mess(cfg=None, speakers=2, ir_length=1.5, simulate=False, harmonics=HARMONICS):
+    """Play the offset sweeps, record once and return the per-speaker IRs.
+
+    Returns:
+        (irs (frames, speakers), recording)
+    """
+    from core.record import record_take
+
+    cfg = cfg or get_config()
+    playback, inv, step = generate_mess(cfg, speakers, ir_length, harmonics)
+    rec = record_take(playback, cfg, simulate, save=False)
+    return separate_irs(rec, inv, cfg, speakers, step, ir_length), rec
@@ -1,7 +1,8 @@
-
-import numpy as np,scipy.signal as sig
+import numpy as np
+from utils.trace import traced
+@traced()
 def modes(ir,fs):
-    N=len(ir); win=ir*sig.hann(N)
+    N=len(ir); win=ir*np.hanning(N)
     H=np.fft.rfft(win); f=np.fft.rfftfreq(N,1/fs)
     Hdb=20*np.log10(np.abs(H)/np.max(np.abs(H))+1e-12)
     return f,Hdb
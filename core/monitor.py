@@ -0,0 +1,274 @@
+"""
+房间监测守护进程 - 按计划无人值守地重复测量
+
+    python run.py daemon --room A --interval 3600          每小时一次
+    python run.py daemon --room A --at 02:00,12:30         每天固定时间
+    touch data/monitor/trigger   或   kill -USR1 <pid>     立即触发一次测量
+
+音频采集在线程中执行，分析 (同步/去卷积/指标) 在进程池中执行，
+事件循环本身从不阻塞。每次结果写入测量档案，并与同一房间/位置
+最近几次测量的中位数比较，T30 或 C50 超出容差时输出漂移警报。
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import signal
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.config import get_config
+
+
+TRIGGER_FILE = "data/monitor/trigger"
+ALERT_LOG = "data/monitor/alerts.jsonl"
+
+# metric -> (mode, tolerance): relative change for T30, absolute dB for C50
+DEFAULT_TOLERANCES = {"T30": ("relative", 0.10), "C50": ("absolute", 1.0)}
+
+
+def parse_times(text):
+    """Parse "02:00,12:30" into [(2, 0), (12, 30)]."""
+    times = []
+    for item in (text or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        hour, minute = item.split(":")
+        hour, minute = int(hour), int(minute)
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise ValueError(f"无效的时间: {item}")
+        times.append((hour, minute))
+    return sorted(times)
+
+
+def seconds_until_next(now, interval=None, times=(), last=None):
+    """Delay until the next scheduled run.
+
+    Args:
+        now: current datetime
+        interval: seconds between runs (counted from the last run)
+        times: daily (hour, minute) run times
+        last: datetime of the last run (None: an interval schedule runs at once)
+
+    Returns:
+        seconds (>= 0), or None when nothing is scheduled
+    """
+    candidates = []
+    if interval is not None:
+        candidates.append(0.0 if last is None else max(0.0, interval - (now - last).total_seconds()))
+    for hour, minute in times:
+        at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if at <= now:
+            at += datetime.timedelta(days=1)
+        candidates.append((at - now).total_seconds())
+    return min(candidates) if candidates else None
+
+
+def drift_alerts(store, metrics, room=None, position=None, exclude=None,
+                 baseline=5, tolerances=None):
+    """Compare new metrics with the median of the last `baseline` archived values.
+
+    Args:
+        store: MeasurementStore
+        metrics: {(name, band): value} of the new measurement
+        exclude: measurement id of the new measurement itself
+
+    Returns:
+        list of alert dicts (metric, band, value, baseline, delta)
+    """
+    import math
+
+    tolerances = tolerances or DEFAULT_TOLERANCES
+    alerts = []
+    for (name, band), value in sorted(metrics.items()):
+        if name not in tolerances or value is None or math.isnan(value):
+            continue
+        history = [v for _, v, mid, _, _ in store.query_metric(name, band=band, room=room, position=position)
+                   if mid != exclude and v is not None and not math.isnan(v)][-baseline:]
+        if len(history) < min(3, baseline):
+            continue
+        ref = statistics.median(history)
+        mode, tol = tolerances[name]
+        delta = value - ref
+        limit = tol * abs(ref) if mode == "relative" else tol
+        if abs(delta) > limit:
+            alerts.append({"metric": name, "band": band, "value": value,
+                           "baseline": ref, "delta": delta, "limit": limit})
+    return alerts
+
+
+class MonitorDaemon:
+    """Asyncio scheduler: triggers -> capture (thread) -> analysis (process pool) -> archive.
+
+    Triggers come from the schedule, the trigger file and SIGUSR1. Triggers
+    that arrive while a take is being recorded are merged into one.
+    """
+
+    def __init__(self, cfg=None, archive="data/archive", room=None, position=None,
+                 interval=None, times=(), workers=None, simulate=False, baseline=5,
+                 tolerances=None, max_runs=None, trigger_file=TRIGGER_FILE, alert_log=ALERT_LOG):
+        self.cfg = cfg or get_config()
+        self.archive = archive
+        self.room = room
+        self.position = position
+        self.interval = interval
+        self.times = list(times)
+        self.workers = max(1, workers or min(4, os.cpu_count() or 1))
+        self.simulate = simulate
+        self.baseline = baseline
+        self.tolerances = tolerances or DEFAULT_TOLERANCES
+        self.max_runs = max_runs
+        self.trigger_file = trigger_file
+        self.alert_log = alert_log
+        self.results = []
+        self.alerts = []
+        self.errors = []
+        self._triggers = None
+        self._stop = None
+        self._last = None
+
+    def trigger(self, reason="manual"):
+        """Request a measurement as soon as the audio device is free."""
+        if self._triggers is not None and self._triggers.empty():
+            self._triggers.put_nowait(reason)
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _schedule(self):
+        while not self._stop.is_set():
+            delay = seconds_until_next(datetime.datetime.now(), self.interval, self.times, self._last)
+            if delay is None:
+                return
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                self._last = datetime.datetime.now()
+                self.trigger("schedule")
+
+    async def _watch_trigger_file(self, poll=1.0):
+        while not self._stop.is_set():
+            if self.trigger_file and os.path.exists(self.trigger_file):
+                os.remove(self.trigger_file)
+                self.trigger("file")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=poll)
+            except asyncio.TimeoutError:
+                pass
+
+    def _store(self, take):
+        """Archive one take and log its drift alerts; blocking (SQLite, files), run off the event loop."""
+        from utils.store import MeasurementStore
+
+        with MeasurementStore(self.archive) as store:
+            store.add_measurement(room=self.room, position=self.position, cfg=self.cfg,
+                                  metrics=take["metrics"], source="daemon", kind="monitor",
+                                  measurement_id=take["measurement_id"])
+            alerts = drift_alerts(store, take["metrics"], self.room, self.position,
+                                  exclude=take["measurement_id"], baseline=self.baseline,
+                                  tolerances=self.tolerances)
+        if alerts:
+            os.makedirs(os.path.dirname(self.alert_log) or ".", exist_ok=True)
+            with open(self.alert_log, "a", encoding="utf-8") as fh:
+                for alert in alerts:
+                    record = dict(alert, timestamp=time.time(), room=self.room, position=self.position,
+                                  measurement_id=take["measurement_id"])
+                    fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return alerts
+
+    def _report(self, take, alerts):
+        t30, c50 = take["metrics"].get(("T30", 0)), take["metrics"].get(("C50", 0))
+        print(f"📊 [{datetime.datetime.now():%H:%M:%S}] T30={t30:.3f}s C50={c50:.2f}dB "
+              f"(分析 {take['seconds']:.1f}秒, id={take['measurement_id'][:8]})")
+        for _, message in take["quality"]["warnings"]:
+            print(f"⚠️ 测量质量: {message}")
+        for alert in alerts:
+            band = f"{alert['band']:g} Hz" if alert["band"] else "宽带"
+            print(f"🚨 漂移警报: {alert['metric']} @ {band} = {alert['value']:.3f}, "
+                  f"基线 {alert['baseline']:.3f} (偏差 {alert['delta']:+.3f}, 容差 ±{alert['limit']:.3f})")
+        self.results.append(take)
+        self.alerts.extend(alerts)
+
+    async def _analyze(self, pool, rec):
+        from core.analysis import analyze_take
+
+        loop = asyncio.get_running_loop()
+        try:
+            take = await loop.run_in_executor(pool, analyze_take, rec, self.cfg, self.archive)
+            alerts = await loop.run_in_executor(None, self._store, take)
+            self._report(take, alerts)
+        except Exception as e:
+            self._fail("分析", e)
+
+    def _fail(self, step, error):
+        """Log a failed take and keep monitoring; an unattended daemon must outlive device hiccups."""
+        message = f"{type(error).__name__}: {error}"
+        self.errors.append((datetime.datetime.now().isoformat(timespec="seconds"), step, message))
+        print(f"❌ {step}失败: {message}")
+
+    def _record(self, sweep):
+        """Record one take; blocking (audio device), run off the event loop."""
+        from core.record import record_take
+
+        return record_take(sweep, self.cfg, self.simulate, save=False)
+
+    async def run(self):
+        """Run until stopped (Ctrl+C / SIGTERM) or max_runs takes have been attempted.
+
+        A take that fails to record or analyze is logged in self.errors; the
+        daemon then waits for the next trigger.
+        """
+        from core.analysis import _sweep_for
+
+        loop = asyncio.get_running_loop()
+        self._triggers = asyncio.Queue(maxsize=1)
+        self._stop = asyncio.Event()
+        if os.name == "posix":
+            loop.add_signal_handler(signal.SIGUSR1, self.trigger, "signal")
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, self.stop)
+        if not self.simulate:
+            from core.device import use_devices
+            self.cfg = use_devices(self.cfg)
+        sweep, _ = _sweep_for(self.cfg)
+
+        helpers = [asyncio.ensure_future(self._schedule()), asyncio.ensure_future(self._watch_trigger_file())]
+        pending, runs = set(), 0
+        print(f"👂 监测中: 房间={self.room or '-'} 位置={self.position or '-'} "
+              f"间隔={self.interval or '-'}秒 定时={','.join(f'{h:02d}:{m:02d}' for h, m in self.times) or '-'}")
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                while not self._stop.is_set() and (self.max_runs is None or runs < self.max_runs):
+                    get = asyncio.ensure_future(self._triggers.get())
+                    stop = asyncio.ensure_future(self._stop.wait())
+                    await asyncio.wait({get, stop}, return_when=asyncio.FIRST_COMPLETED)
+                    stop.cancel()
+                    if not get.done():
+                        get.cancel()
+                        break
+                    print(f"🎙️ 开始测量 ({get.result()})")
+                    runs += 1
+                    try:
+                        rec = await loop.run_in_executor(None, self._record, sweep)
+                    except Exception as e:
+                        self._fail("录音", e)
+                        continue
+                    task = asyncio.ensure_future(self._analyze(pool, rec))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                if pending:
+                    await asyncio.gather(*pending)
+            finally:
+                self._stop.set()
+                for task in helpers:
+                    task.cancel()
+                await asyncio.gather(*helpers, return_exceptions=True)
+                if os.name == "posix":
+                    for sig in (signal.SIGUSR1, signal.SIGINT, signal.SIGTERM):
+                        loop.remove_signal_handler(sig)
+        print(f"🛑 监测结束: {len(self.results)} 次测量, {len(self.alerts)} 条警报, {len(self.errors)} 次失败")
+        return self.results
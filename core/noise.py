@@ -0,0 +1,197 @@
+"""
+背景噪声与自适应扫频长度
+
+测量前先录一小段背景噪声，用流式倍频程滤波器组 (逐块 sosfilt，保留滤波器状态，
+不保存录音) 估计各频带噪声级；再播放一个很短的探测扫频得到各频带信号能量。
+去卷积后的脉冲/噪声比 (INR) 与扫频长度成正比 (每翻倍 +3 dB)，据此选出
+满足目标 INR 的最短扫频，并按预期混响时间选择录音尾部长度。
+
+    python run.py noise                        只测噪声并给出建议
+    python run.py measure --adaptive           测量前自动选择扫频长度
+"""
+
+import math
+
+import numpy as np
+
+from core.metrics import OCTAVE_BANDS
+from utils.config import get_config
+
+
+NOISE_SECONDS = 2.0
+PROBE_SWEEP = 0.5
+TARGET_INR_DB = 60.0
+MIN_SWEEP, MAX_SWEEP = 1.0, 30.0
+
+
+class BandLevelMeter:
+    """Streaming octave-band energy meter.
+
+    Feed blocks of any size with update(); filter states are carried
+    across blocks, so the result equals filtering the whole signal at once
+    while only one block is ever held in memory.
+    """
+
+    def __init__(self, fs, bands=OCTAVE_BANDS):
+        from scipy.signal import sosfilt_zi
+        from core.metrics import octave_sos
+
+        self.fs = fs
+        self.bands = tuple(fc for fc in bands if fc * np.sqrt(2) < fs / 2)
+        self._sos = [octave_sos(fc, fs) for fc in self.bands]
+        self._zi = [np.zeros_like(sosfilt_zi(sos)) for sos in self._sos]
+        self.energy = np.zeros(len(self.bands))
+        self.broadband = 0.0
+        self.frames = 0
+
+    def update(self, block):
+        from scipy.signal import sosfilt
+
+        x = np.asarray(block, dtype=np.float64)
+        if x.ndim > 1:
+            x = x[:, 0]
+        for i, sos in enumerate(self._sos):
+            y, self._zi[i] = sosfilt(sos, x, zi=self._zi[i])
+            self.energy[i] += np.dot(y, y)
+        self.broadband += float(np.dot(x, x))
+        self.frames += len(x)
+
+    def energy_db(self):
+        """Total energy per band, in dB ({band: dB}, band 0 = broadband)."""
+        return {0: _db(self.broadband), **{fc: _db(e) for fc, e in zip(self.bands, self.energy)}}
+
+    def levels_db(self):
+        """Mean power per band in dBFS ({band: dB}, band 0 = broadband)."""
+        n = max(self.frames, 1)
+        return {band: value - 10 * math.log10(n) for band, value in self.energy_db().items()}
+
+
+def _db(energy):
+    return 10 * math.log10(max(energy, 1e-30))
+
+
+def measure_levels(blocks, fs, bands=OCTAVE_BANDS):
+    """Run a BandLevelMeter over an iterable of blocks and return it."""
+    meter = BandLevelMeter(fs, bands)
+    for block in blocks:
+        meter.update(block)
+    return meter
+
+
+def record_noise(cfg=None, seconds=NOISE_SECONDS, simulate=False, noise_db=-80.0, blocksize=4096):
+    """Measure the background noise band levels without storing the recording.
+
+    Live capture feeds the meter straight from the sounddevice input
+    callback; simulate=True feeds it white noise at noise_db instead.
+
+    Returns:
+        BandLevelMeter
+    """
+    cfg = cfg or get_config()
+    fs = cfg.fs
+    n = int(seconds * fs)
+    if simulate:
+        rng = np.random.default_rng()
+        blocks = (rng.standard_normal(min(blocksize, n - a)) * 10 ** (noise_db / 20)
+                  for a in range(0, n, blocksize))
+        return measure_levels(blocks, fs)
+
+    import sounddevice as sd
+
+    meter = BandLevelMeter(fs)
+
+    def callback(indata, frames, time_info, status):
+        meter.update(indata[:, 0])
+
+    print(f"🤫 录制背景噪声 {seconds:.1f} 秒，请保持安静...")
+    with sd.InputStream(samplerate=fs, channels=1, dtype="float32", blocksize=blocksize, callback=callback):
+        sd.sleep(int(seconds * 1000))
+    return meter
+
+
+def probe_energy(cfg=None, probe=PROBE_SWEEP, simulate=False, blocksize=1 << 16):
+    """Play a short probe sweep and return its recorded energy per band.
+
+    Returns:
+        (meter, probe_cfg): the meter holds the probe's band energies
+    """
+    from core.record import record_take
+    from core.sweep import generate_sweep
+
+    cfg = cfg or get_config()
+    probe_cfg = cfg.with_overrides(sweep_duration=probe, silence_pre=0.0, silence_post=0.0,
+                                   record_tail=min(cfg.record_tail, 0.5))
+    sig, _ = generate_sweep(probe_cfg, save=False)
+    rec = record_take(sig, probe_cfg, simulate, save=False)
+    meter = measure_levels((rec[a:a + blocksize] for a in range(0, len(rec), blocksize)), cfg.fs)
+    return meter, probe_cfg
+
+
+def plan_sweep(noise, probe, probe_duration, target_inr_db=TARGET_INR_DB, expected_rt60=None,
+               min_sweep=MIN_SWEEP, max_sweep=MAX_SWEEP):
+    """Shortest sweep and tail that reach the target INR in every band.
+
+    After deconvolution a band's IR energy E is spread over its decay,
+    so the decay starts E / (tau * fs) above zero, tau = RT60 / 13.8 being
+    the energy time constant. INR is that start level over the noise power.
+    The sweep energy in each band grows linearly with the sweep duration,
+    so INR(T) = INR(probe) + 10*log10(T / T_probe).
+
+    Args:
+        noise: BandLevelMeter of the background noise (power per sample)
+        probe: BandLevelMeter of the probe-sweep recording (total energy)
+        probe_duration: probe sweep length in seconds
+        expected_rt60: expected decay time (s), for the spread of the IR
+            energy and for the tail, which must let the decay fall by the
+            achieved INR. None: 1 s.
+
+    Returns:
+        dict with sweep_duration, record_tail, the limiting band and the
+        per-band INR of the probe and of the planned sweep
+    """
+    rt60 = 1.0 if expected_rt60 is None or not math.isfinite(expected_rt60) else expected_rt60
+    spread_db = 10 * math.log10(rt60 / (6 * math.log(10)) * probe.fs)
+    noise_db, probe_db = noise.levels_db(), probe.energy_db()
+    bands = [b for b in probe_db if b in noise_db and b != 0]
+    inr_probe = {b: probe_db[b] - spread_db - noise_db[b] for b in bands}
+    needed = {b: probe_duration * 10 ** ((target_inr_db - inr) / 10) for b, inr in inr_probe.items()}
+    limiting = max(needed, key=needed.get) if needed else None
+    raw = needed[limiting] if limiting is not None else min_sweep
+    sweep = min(max_sweep, max(min_sweep, math.ceil(raw * 2) / 2))
+    inr = {b: v + 10 * math.log10(sweep / probe_duration) for b, v in inr_probe.items()}
+
+    decay_db = min(max(inr.values(), default=target_inr_db), target_inr_db)
+    tail = max(0.5, math.ceil(1.2 * rt60 * decay_db / 60 * 10) / 10)
+    return {
+        "sweep_duration": sweep,
+        "record_tail": tail,
+        "limiting_band": limiting,
+        "target_inr_db": target_inr_db,
+        "inr_probe_db": inr_probe,
+        "inr_db": inr,
+        "reached": sweep >= raw,
+    }
+
+
+def adaptive_config(cfg=None, simulate=False, target_inr_db=TARGET_INR_DB, expected_rt60=None,
+                    noise_seconds=NOISE_SECONDS, probe=PROBE_SWEEP):
+    """Measure noise and a probe sweep, then return (cfg with the planned sweep, plan)."""
+    cfg = cfg or get_config()
+    noise = record_noise(cfg, noise_seconds, simulate)
+    meter, _ = probe_energy(cfg, probe, simulate)
+    plan = plan_sweep(noise, meter, probe, target_inr_db, expected_rt60)
+    plan["noise_db"] = noise.levels_db()
+    planned = cfg.with_overrides(sweep_duration=plan["sweep_duration"], record_tail=plan["record_tail"],
+                                 silence_pre=min(cfg.silence_pre, 0.2), silence_post=0.0)
+    return planned, plan
+
+
+def format_plan(plan):
+    lines = [f"{'频带':>8}{'噪声(dBFS)':>12}{'INR(dB)':>10}"]
+    for band, inr in plan["inr_db"].items():
+        lines.append(f"{band:>5g} Hz{plan.get('noise_db', {}).get(band, float('nan')):>12.1f}{inr:>10.1f}")
+    limiting = plan["limiting_band"]
+    lines.append(f"➡️ 扫频 {plan['sweep_duration']:.1f} 秒, 尾部 {plan['record_tail']:.1f} 秒"
+                 f" (受限频带 {limiting or 0:g} Hz, 目标 INR {plan['target_inr_db']:.0f} dB"
+                 f"{'' if plan['reached'] else ', 已达最长扫频仍未满足'})")
+    return "\n".join(lines)
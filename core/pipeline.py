@@ -0,0 +1,353 @@
+"""
+测量流程的阶段图 + 增量缓存
+
+每个阶段的产物保存在 data/cache/<stage>/<key>/ 下，key 由
+    阶段名 + 版本 + 相关配置项的摘要 + 上游阶段的 key
+组成（Merkle 式），所以修改某个配置项只会使依赖它的阶段及其下游失效。
+源数据（例如录音）的 key 是其内容哈希。
+
+缓存的磁盘占用受 cache_budget_mb 限制 (0 = 不限制)：每写入一个产物，
+就按最近使用时间删除最旧的条目，直到总大小回到预算以内。
+"""
+
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.trace import span
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One node of the stage graph.
+
+    func is called as func(cfg, workdir, **inputs) where inputs maps each
+    upstream stage name to its value; stages that write files put them in
+    workdir (which lives inside the cache). func=None marks a source stage
+    whose value is supplied to Pipeline.run().
+    """
+
+    name: str
+    func: object = None
+    inputs: tuple = ()
+    config_keys: tuple = ()
+    version: int = 1
+
+    @property
+    def is_source(self):
+        return self.func is None
+
+
+def content_hash(value):
+    """Hash of an array's (or picklable object's) content."""
+    h = hashlib.sha1()
+    if isinstance(value, np.ndarray):
+        h.update(str((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).data)
+    else:
+        h.update(pickle.dumps(value, protocol=4))
+    return h.hexdigest()[:16]
+
+
+_MB = 2 ** 20
+
+
+class ArtifactCache:
+    """Content-addressed artifact store on disk.
+
+    With a budget (MB, 0 = unlimited) commit() prunes the least recently
+    used entries until the cache fits. Entries this instance has written or
+    read are never pruned, so a running measurement keeps its inputs.
+    """
+
+    def __init__(self, root="data/cache", budget_mb=0.0):
+        self.root = root
+        self.budget_mb = budget_mb
+        self._used = set()
+
+    def dir(self, stage, key):
+        return os.path.join(self.root, stage, key)
+
+    def _value_path(self, stage, key):
+        d = self.dir(stage, key)
+        for name in ("value.npy", "value.pkl"):
+            path = os.path.join(d, name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def has(self, stage, key):
+        return self._value_path(stage, key) is not None
+
+    def load(self, stage, key):
+        path = self._value_path(stage, key)
+        if path is None:
+            raise KeyError(f"{stage}/{key}")
+        self.touch(stage, key)
+        if path.endswith(".npy"):
+            # memory-mapped: a cached recording or IR is paged in on demand
+            return np.load(path, mmap_mode="r")
+        with open(path, "rb") as fh:
+            return pickle.load(fh)
+
+    def begin(self, stage, key):
+        """Directory a stage writes its files into while it is computed.
+
+        The artifact only counts as cached once commit() has written the
+        value file, so an interrupted stage is simply recomputed.
+        """
+        d = self.dir(stage, key)
+        os.makedirs(d, exist_ok=True)
+        self._used.add((stage, key))
+        return d
+
+    def commit(self, stage, key, value):
+        d = self.dir(stage, key)
+        is_array = isinstance(value, np.ndarray)
+        final = os.path.join(d, "value.npy" if is_array else "value.pkl")
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=d)
+        with os.fdopen(fd, "wb") as fh:
+            if is_array:
+                np.save(fh, value)
+            else:
+                pickle.dump(value, fh, protocol=4)
+        os.replace(tmp, final)
+        self.touch(stage, key)
+        if self.budget_mb > 0:
+            self.prune()
+
+    def touch(self, stage, key):
+        """Mark an entry as used now (its directory mtime is the LRU clock)."""
+        self._used.add((stage, key))
+        try:
+            os.utime(self.dir(stage, key))
+        except OSError:
+            pass
+
+    def entries(self):
+        """[(last use, bytes, stage, key)] of every entry, least recently used first."""
+        result = []
+        if not os.path.isdir(self.root):
+            return result
+        for stage in os.listdir(self.root):
+            stage_dir = os.path.join(self.root, stage)
+            if not os.path.isdir(stage_dir):
+                continue
+            for key in os.listdir(stage_dir):
+                d = os.path.join(stage_dir, key)
+                try:
+                    size = sum(os.path.getsize(os.path.join(base, name))
+                               for base, _, names in os.walk(d) for name in names)
+                    result.append((os.path.getmtime(d), size, stage, key))
+                except OSError:  # removed concurrently
+                    continue
+        return sorted(result)
+
+    def prune(self, budget_mb=None):
+        """Delete least recently used entries until the cache fits the budget; returns the bytes freed."""
+        budget = (self.budget_mb if budget_mb is None else budget_mb) * _MB
+        entries = self.entries()
+        total = sum(size for _, size, _, _ in entries)
+        freed = 0
+        for _, size, stage, key in entries:
+            if total - freed <= budget:
+                break
+            if (stage, key) in self._used:
+                continue
+            shutil.rmtree(self.dir(stage, key), ignore_errors=True)
+            freed += size
+        return freed
+
+
+class Pipeline:
+    """Evaluate a stage graph, recomputing only stages whose key changed."""
+
+    def __init__(self, stages, cfg, cache=None, verbose=True):
+        self.stages = {s.name: s for s in stages}
+        self.cfg = cfg
+        self.cache = cache or ArtifactCache(budget_mb=cfg.cache_budget_mb)
+        self.verbose = verbose
+        self.computed = []
+        self._keys = {}
+        self._values = {}
+
+    def key(self, name):
+        if name in self._keys:
+            return self._keys[name]
+        stage = self.stages[name]
+        if stage.is_source:
+            raise KeyError(f"source stage {name!r} has no value")
+        h = hashlib.sha1()
+        h.update(f"{name}:v{stage.version}:{self.cfg.digest(stage.config_keys)}".encode())
+        for dep in stage.inputs:
+            h.update(f"|{dep}={self.key(dep)}".encode())
+        self._keys[name] = h.hexdigest()[:16]
+        return self._keys[name]
+
+    def workdir(self, name):
+        """Cache directory holding the files written by a stage."""
+        return self.cache.dir(name, self.key(name))
+
+    def _value(self, name):
+        if name in self._values:
+            return self._values[name]
+        stage = self.stages[name]
+        key = self.key(name)
+        if self.cache.has(name, key):
+            value = self.cache.load(name, key)
+            if self.verbose:
+                print(f"   ↺ {name}: 使用缓存 ({key})")
+        else:
+            inputs = {dep: self._value(dep) for dep in stage.inputs}
+            workdir = self.cache.begin(name, key)
+            start = time.perf_counter()
+            with span(f"stage:{name}"):
+                value = stage.func(self.cfg, workdir, **inputs)
+            self.cache.commit(name, key, value)
+            self.computed.append(name)
+            if self.verbose:
+                print(f"   ▶ {name}: 已计算 ({time.perf_counter() - start:.2f}秒, {key})")
+        self._values[name] = value
+        return value
+
+    def release(self, *names):
+        """Drop in-memory values; a later run() reloads them (memory-mapped) from the cache."""
+        for name in names:
+            self._values.pop(name, None)
+
+    def run(self, targets=None, sources=None):
+        """Evaluate targets (default: every stage) and return {name: value}.
+
+        sources supplies the values of source stages, keyed by name; they
+        are stored in the cache as well, so a later run can reuse them.
+        """
+        for name, value in (sources or {}).items():
+            if not self.stages[name].is_source:
+                raise ValueError(f"{name!r} is not a source stage")
+            key = content_hash(value)
+            if not self.cache.has(name, key):
+                self.cache.begin(name, key)
+                self.cache.commit(name, key, value)
+            else:
+                self.cache.touch(name, key)
+            self._values[name] = value
+            self._keys[name] = key
+        targets = list(targets or [n for n, s in self.stages.items() if not s.is_source])
+        return {name: self._value(name) for name in targets}
+
+
+# ---------------------------------------------------------------------------
+# run.py 的测量流程
+# ---------------------------------------------------------------------------
+
+SWEEP_KEYS = ("fs", "sweep_duration", "sweep_freq_min", "sweep_freq_max", "silence_pre", "silence_post", "dtype")
+
+
+def _mono(ir):
+    """Channel 0 of a multichannel IR; the single-channel stages work on it."""
+    return ir if ir.ndim == 1 else ir[:, 0]
+
+
+def _stage_sweep(cfg, workdir):
+    from core.sweep import generate_sweep
+
+    return generate_sweep(cfg, save=False)
+
+
+def _stage_sync(cfg, workdir, rec, sweep):
+    from core.drift import correct_drift
+    from core.sync import sync_and_trim, sync_window
+
+    rec, _ = correct_drift(rec, sweep[0], cfg)
+    return sync_and_trim(rec, sweep[0], sync_window(cfg))
+
+
+def _stage_ir(cfg, workdir, sync, sweep):
+    import soundfile as sf
+    from core.ir import extract_ir
+    from utils.irfile import write_ir
+
+    ir = extract_ir(sync, sweep[1], cfg, save=False)
+    sf.write(os.path.join(workdir, "ir.wav"), ir, cfg.fs)
+    write_ir(os.path.join(workdir, "ir.scir"), ir, cfg.fs, config_hash=cfg.digest())
+    return ir
+
+
+def _stage_metrics(cfg, workdir, ir):
+    from core.metrics import RT60, C50, sti
+
+    def metrics(x):
+        return {"rt60": RT60(x, cfg=cfg), "c50": C50(x, cfg=cfg), "sti": sti(x, cfg=cfg)["sti"]}
+
+    if ir.ndim == 2:
+        channels = [metrics(ir[:, ch]) for ch in range(ir.shape[1])]
+        return dict(channels[0], channels=channels)
+    return metrics(ir)
+
+
+def _stage_quality(cfg, workdir, ir, rec, sweep):
+    from core.quality import assess_take
+
+    return assess_take(_mono(ir), rec, cfg, inv_length=len(sweep[1]))
+
+
+def _stage_bands(cfg, workdir, ir, sweep):
+    from core.metrics import band_metrics
+
+    ir = _mono(ir)
+    return band_metrics(ir, cfg, valid=len(ir) - len(sweep[1]) + 1)
+
+
+def _stage_reflections(cfg, workdir, ir):
+    from core.reflections import reflections
+
+    return reflections(_mono(ir), cfg)
+
+
+def _stage_plot_ir(cfg, workdir, ir, reflections):
+    from utils.plot import plot_ir
+
+    path = os.path.join(workdir, "ir.png")
+    plot_ir(_mono(ir), cfg.fs, reflections, path=path, cfg=cfg)
+    return path
+
+
+def _stage_separate(cfg, workdir, ir):
+    from core.separate import separate_ir_components, export_ir_comparison
+
+    paths = separate_ir_components(_mono(ir), output_dir=workdir, cfg=cfg)
+    paths["comparison"] = export_ir_comparison(_mono(ir), output_path=os.path.join(workdir, "comparison.wav"), cfg=cfg)
+    return paths
+
+
+def _stage_report(cfg, workdir, metrics, plot_ir):
+    from utils.report import generate_report
+
+    path = os.path.join(workdir, "report.pdf")
+    generate_report(metrics["rt60"], metrics["c50"], img=plot_ir, out=path, sti=metrics.get("sti"))
+    return path
+
+
+def measurement_stages():
+    """Stage graph of the run.py measurement (everything after the recording)."""
+    return [
+        Stage("sweep", _stage_sweep, config_keys=SWEEP_KEYS, version=2),
+        Stage("rec"),
+        Stage("sync", _stage_sync, inputs=("rec", "sweep"), config_keys=("drift_correction", "sync_latency")),
+        Stage("ir", _stage_ir, inputs=("sync", "sweep"), config_keys=("fs", "dtype", "chain_response")),
+        Stage("metrics", _stage_metrics, inputs=("ir",), config_keys=("fs", "min_energy"), version=2),
+        Stage("quality", _stage_quality, inputs=("ir", "rec", "sweep"), config_keys=SWEEP_KEYS),
+        Stage("bands", _stage_bands, inputs=("ir", "sweep"), config_keys=("fs", "min_energy"), version=2),
+        Stage("reflections", _stage_reflections, inputs=("ir",),
+              config_keys=("fs", "min_peak_db", "min_peak_distance_ms")),
+        Stage("plot_ir", _stage_plot_ir, inputs=("ir", "reflections"),
+              config_keys=("fs", "early_reflection_time")),
+        Stage("separate", _stage_separate, inputs=("ir",), config_keys=("fs", "early_reflection_time")),
+        Stage("report", _stage_report, inputs=("metrics", "plot_ir")),
+    ]
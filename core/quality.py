@@ -0,0 +1,264 @@
+"""
+测量质量评估 - 取代 diagnose.py / debug_rt60.py / analyze_ir_problem.py / check_real_ir.py / fix_ir.py
+
+    python run.py check                           检查最近一次测量的IR
+    python run.py check ir.wav --recording rec.wav --reference ir2.wav
+
+assess() 在测量流程内自动运行 (pipeline 的 quality 阶段、守护进程/会话/服务的分析)，
+直接使用已经算好的IR和录音，全部按 10 ms 块向量化计算，只需几毫秒。检查项：
+
+    INR            衰减起点与噪声地板之差 (ISO 18233)
+    峰值噪声比      直达声峰值与噪声 RMS 之差
+    起点前能量      直达声前 5~25 ms 相对直达声后 20 ms 的能量 (同步/时间混叠问题)
+    削波            录音中接近满幅的采样数
+    非单调衰减      衰减段 50 ms 平滑包络的最大回升
+    谐波失真        扫频的 2、3 次谐波IR (出现在线性IR之前) 相对线性IR的能量
+    时变性          与另一次测量的IR之差 (需要 reference)
+"""
+
+import math
+import time
+
+import numpy as np
+
+from utils.config import get_config
+
+
+BLOCK = 0.01            # envelope block length, seconds
+PRE_WINDOW = 0.02       # pre-onset / direct windows, seconds
+PRE_GUARD = 0.005       # gap before the peak left out of the pre-onset window (band-limit ringing)
+HARMONIC_WINDOW = 0.05  # window around each harmonic IR, seconds
+CLIP_LEVEL = 0.999      # |sample| at or above this counts as clipped (full scale = 1)
+LUNDEBY_PASSES = 5      # noise floor re-estimates in decay_fit()
+LUNDEBY_MARGIN = 10.0   # dB below the noise floor (along the decay line) where its re-estimate starts
+
+# name -> (limit, "min" | "max", warning)
+THRESHOLDS = {
+    "inr_db": (45.0, "min", "INR 偏低，衰减曲线下端被噪声淹没，T30/T20 可能偏大"),
+    "peak_to_noise_db": (45.0, "min", "峰值噪声比偏低，请提高播放音量或延长扫频"),
+    "pre_onset_db": (-20.0, "max", "直达声之前有明显能量 (同步错误、时间混叠或声卡延迟不稳)"),
+    "clipped_samples": (0, "max", "录音削波，请降低播放音量或输入增益"),
+    "decay_rise_db": (3.0, "max", "衰减曲线不单调 (测量期间有干扰噪声或录音中断)"),
+    "harmonic_db": (-30.0, "max", "谐波失真较大，请降低播放音量"),
+    "time_variance_db": (-20.0, "max", "两次测量差异较大 (房间或设备在测量期间发生变化)"),
+}
+
+
+def _db(x):
+    return 10 * math.log10(x) if x > 0 else float("-inf")
+
+
+def block_levels(x, fs, block=BLOCK):
+    """Mean power per block (block seconds) in dB; the last partial block is dropped."""
+    n = max(1, int(block * fs))
+    frames = len(x) // n
+    power = np.square(np.asarray(x[:frames * n], dtype=np.float64)).reshape(frames, n).mean(axis=1)
+    return 10 * np.log10(np.maximum(power, 1e-30))
+
+
+def decay_fit(levels, block=BLOCK, passes=LUNDEBY_PASSES):
+    """Lundeby noise floor and decay line of block levels starting at the onset.
+
+    The first noise estimate is the mean power of the loudest window of
+    10 % of the blocks in the second half (the deconvolution noise of a
+    sweep measurement often keeps sinking towards the end, so the last
+    blocks alone would put the floor too low); the decay line is fitted to
+    the blocks before the envelope first drops to 10 dB above it. Each
+    further pass re-estimates the noise from LUNDEBY_MARGIN dB (along the
+    line) past the point where the line meets the noise.
+
+    Returns:
+        (noise_db, slope dB/s, intercept dB at the onset, index of the first noise block)
+    """
+    tail = max(1, len(levels) // 10)
+    power = 10 ** (levels / 10)
+    windows = np.convolve(power[len(levels) // 2:], np.ones(tail) / tail, mode="valid")
+    noise = 10 * np.log10(np.max(windows) if len(windows) else np.mean(power[-tail:]))
+
+    def crossing(noise):
+        below = np.flatnonzero(levels < noise + 10)
+        return int(below[0]) if len(below) else len(levels)
+
+    end = crossing(noise)
+    for _ in range(passes):
+        if end < 3:
+            break
+        slope, intercept = np.polyfit(np.arange(end) * block, levels[:end], 1)
+        if slope >= 0:
+            break
+        start = int(((noise - LUNDEBY_MARGIN - intercept) / slope) / block)
+        start = max(end, min(start, len(levels) - tail))
+        noise = 10 * np.log10(np.mean(power[start:]))
+        new_end = crossing(noise)
+        if new_end == end:
+            break
+        end = new_end
+    if end < 3:
+        return noise, float("nan"), float(levels[0]) if len(levels) else float("nan"), end
+    t = np.arange(end) * block
+    slope, intercept = np.polyfit(t, levels[:end], 1)
+    return noise, float(slope), float(intercept), end
+
+
+def truncation(x, fs, onset=None, valid=None):
+    """Lundeby truncation of the decay of x (from onset, default its peak).
+
+    valid limits the samples considered (see assess()).
+
+    Returns:
+        (end, tail): the sample index where the decay meets the noise floor
+        (valid or len(x) when the decay is too short to fit), and the
+        energy the fitted decay line would still carry beyond it, to be
+        added to the Schroeder integral of x[:end]
+    """
+    x = np.asarray(x)
+    onset = int(np.argmax(np.abs(x))) if onset is None else onset
+    end = len(x) if valid is None else max(onset + 1, min(len(x), int(valid)))
+    levels = block_levels(x[onset:end], fs)
+    if len(levels) < 10:
+        return end, 0.0
+    _, slope, intercept, stop = decay_fit(levels)
+    n = max(1, int(BLOCK * fs))
+    if not slope < 0:
+        return onset + stop * n, 0.0
+    # power per sample on the line at the cut, times the energy time constant in samples
+    power = 10 ** ((intercept + slope * stop * n / fs) / 10)
+    return onset + stop * n, float(power * fs * 10 / (-slope * math.log(10)))
+
+
+def harmonic_offsets(cfg, orders=(2, 3)):
+    """Seconds by which the n-th harmonic IR precedes the linear IR of an exponential sweep."""
+    rate = math.log(cfg.sweep_freq_max / cfg.sweep_freq_min)
+    return {n: cfg.sweep_duration * math.log(n) / rate for n in orders}
+
+
+def time_variance(ir, reference, fs, length=0.2):
+    """Energy of the difference of two peak-aligned, level-matched IRs over `length` s, dB re the IR."""
+    a, b = np.asarray(ir, dtype=np.float64), np.asarray(reference, dtype=np.float64)
+    ia, ib = int(np.argmax(np.abs(a))), int(np.argmax(np.abs(b)))
+    pre, n = int(0.001 * fs), int(length * fs)
+    start = min(ia, ib, pre)
+    n = min(n, len(a) - ia, len(b) - ib)
+    x, y = a[ia - start:ia + n], b[ib - start:ib + n]
+    y = y * (np.dot(x, y) / max(np.dot(y, y), 1e-30))
+    return _db(np.sum((x - y) ** 2) / max(np.sum(x * x), 1e-30))
+
+
+def assess(ir, cfg=None, rec=None, valid=None, reference=None):
+    """Quality indicators of one measurement.
+
+    Args:
+        ir: impulse response (1-D; channel 0 is used otherwise)
+        rec: raw recording, for the clipping check
+        valid: number of leading IR samples that are fully deconvolved
+            (len(ir) - len(inv) + 1 for extract_ir() output); the rest,
+            where the deconvolution tapers off, is ignored. None: all.
+        reference: IR of a repeated take, for the time-variance check
+
+    Returns:
+        dict of indicators (None when not available), the valid length
+        "valid_s", the time "decay_end_s" where the decay meets the noise
+        floor (Lundeby truncation point), "warnings"
+        [(name, message)], "ok" and the processing "seconds"
+    """
+    start = time.perf_counter()
+    cfg = cfg or get_config()
+    fs = cfg.fs
+    ir = np.asarray(ir)
+    ir = ir if ir.ndim == 1 else ir[:, 0]
+    onset = int(np.argmax(np.abs(ir)))
+    peak_power = float(ir[onset]) ** 2
+    end = len(ir) if valid is None else max(onset + 1, min(len(ir), int(valid)))
+
+    levels = block_levels(ir[onset:end], fs)
+    result = {"onset_s": onset / fs, "length_s": len(ir) / fs, "valid_s": end / fs}
+    if len(levels) >= 10:
+        noise, slope, intercept, noise_start = decay_fit(levels)
+        peak_db = _db(peak_power)
+        result["noise_floor_db"] = noise - peak_db
+        result["peak_to_noise_db"] = peak_db - noise
+        result["inr_db"] = intercept - noise
+        result["decay_rate_db_s"] = slope
+        result["decay_end_s"] = (onset + noise_start * int(BLOCK * fs)) / fs
+        # rises of the 50 ms smoothed envelope within the decay
+        smooth = np.convolve(10 ** (levels[:noise_start] / 10), np.ones(5) / 5, mode="valid")
+        steps = np.diff(10 * np.log10(np.maximum(smooth, 1e-30))[::5]) if len(smooth) > 5 else np.zeros(0)
+        result["decay_rise_db"] = float(max(0.0, steps.max())) if len(steps) else 0.0
+    else:
+        result.update(noise_floor_db=None, peak_to_noise_db=None, inr_db=None,
+                      decay_rate_db_s=None, decay_end_s=None, decay_rise_db=None)
+
+    w = int(PRE_WINDOW * fs)
+    gap = int(PRE_GUARD * fs)
+    direct = np.sum(np.square(ir[onset:onset + w], dtype=np.float64))
+    if onset - gap - w >= 0:
+        before = np.sum(np.square(ir[onset - gap - w:onset - gap], dtype=np.float64))
+        result["pre_onset_db"] = _db(before / max(direct, 1e-30)) if before > 0 else -300.0
+    else:
+        result["pre_onset_db"] = None
+
+    hw = int(HARMONIC_WINDOW * fs)
+    guard = int(0.001 * fs)
+    start = max(0, onset - guard)
+    linear = np.sum(np.square(ir[start:start + hw], dtype=np.float64))
+    harmonics = {}
+    for n, dt in harmonic_offsets(cfg).items():
+        pos = onset - int(round(dt * fs)) - guard
+        if pos >= 0 and dt * fs > hw:
+            e = np.sum(np.square(ir[pos:pos + hw], dtype=np.float64))
+            harmonics[n] = _db(e / max(linear, 1e-30)) if e > 0 else -300.0
+    result["harmonics_db"] = harmonics
+    result["harmonic_db"] = max(harmonics.values()) if harmonics else None
+
+    if rec is not None:
+        x = np.asarray(rec)
+        peak = float(np.max(np.abs(x))) if x.size else 0.0
+        result["rec_peak_db"] = 20 * math.log10(peak) if peak > 0 else float("-inf")
+        result["clipped_samples"] = int(np.count_nonzero(np.abs(x) >= CLIP_LEVEL))
+    else:
+        result["rec_peak_db"] = result["clipped_samples"] = None
+    result["time_variance_db"] = time_variance(ir, reference, fs) if reference is not None else None
+
+    warnings = []
+    for name, (limit, kind, message) in THRESHOLDS.items():
+        value = result.get(name)
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        if (kind == "min" and value < limit) or (kind == "max" and value > limit):
+            warnings.append((name, message))
+    result["warnings"] = warnings
+    result["ok"] = not warnings
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def assess_take(ir, rec, cfg=None, inv_length=None, reference=None):
+    """assess() for extract_ir() output: the inverse filter length gives the valid part."""
+    cfg = cfg or get_config()
+    if inv_length is None:
+        from core.analysis import _sweep_for
+        inv_length = len(_sweep_for(cfg)[1])
+    valid = len(ir) - inv_length + 1 if len(ir) > inv_length else None
+    return assess(ir, cfg, rec=rec, valid=valid, reference=reference)
+
+
+def format_quality(q):
+    """Human-readable quality summary (one line per indicator plus warnings)."""
+    def fmt(value, spec, unit=""):
+        return "N/A" if value is None or (isinstance(value, float) and math.isnan(value)) else f"{value:{spec}}{unit}"
+
+    lines = [
+        f"   直达声位置:   {q['onset_s']:.3f} 秒 (IR 长 {q['length_s']:.2f} 秒)",
+        f"   INR:          {fmt(q['inr_db'], '.1f', ' dB')}",
+        f"   峰值噪声比:   {fmt(q['peak_to_noise_db'], '.1f', ' dB')}",
+        f"   起点前能量:   {fmt(q['pre_onset_db'], '.1f', ' dB')}",
+        f"   衰减回升:     {fmt(q['decay_rise_db'], '.1f', ' dB')}",
+        f"   谐波失真:     " + (", ".join(f"{n}次 {v:.1f} dB" for n, v in q["harmonics_db"].items()) or "N/A"),
+        f"   录音峰值:     {fmt(q['rec_peak_db'], '.1f', ' dBFS')}  削波 {fmt(q['clipped_samples'], 'd')} 个采样",
+        f"   时变性:       {fmt(q['time_variance_db'], '.1f', ' dB')}",
+    ]
+    for _, message in q["warnings"]:
+        lines.append(f"   ⚠️ {message}")
+    if q["ok"]:
+        lines.append("   ✅ 测量质量良好")
+    return "\n".join(lines)
@@ -0,0 +1,77 @@
+"""
+快速检查 - 短扫频、只计算需要的指标、不写任何文件
+
+    python run.py quick                     2 秒扫频，宽带 RT60/C50
+    python run.py quick --stages metrics,bands --sweep 3
+    python run.py quick --loop              一个房间测完按回车测下一个
+
+扫频信号在进程内缓存，录音结束后只做同步、去卷积和所选阶段的计算，
+不导入 matplotlib/reportlab，也不写 WAV/图表/PDF。
+"""
+
+import time
+
+from utils.config import get_config
+
+
+QUICK_STAGES = ("metrics", "bands", "sti", "reflections", "quality")
+DEFAULT_STAGES = ("metrics",)
+QUICK_SWEEP = 2.0
+
+
+def quick_config(cfg=None, sweep=QUICK_SWEEP, tail=None):
+    """Config for a quick check: short sweep, no silences, optional tail override."""
+    cfg = cfg or get_config()
+    overrides = {"sweep_duration": sweep, "silence_pre": 0.0, "silence_post": 0.0}
+    if tail is not None:
+        overrides["record_tail"] = tail
+    return cfg.with_overrides(**overrides)
+
+
+def parse_stages(text):
+    """"metrics,bands" -> ("metrics", "bands"); unknown names raise ValueError."""
+    stages = tuple(s.strip() for s in (text or "").split(",") if s.strip()) or DEFAULT_STAGES
+    unknown = [s for s in stages if s not in QUICK_STAGES]
+    if unknown:
+        raise ValueError(f"未知阶段: {', '.join(unknown)} (可选: {', '.join(QUICK_STAGES)})")
+    return stages
+
+
+def quick_check(rec, cfg=None, stages=DEFAULT_STAGES):
+    """Recording -> IR -> the requested stages only; nothing is written to disk.
+
+    Returns:
+        dict with the stage results (rt60/c50, bands, sti, reflections, quality)
+        and the processing time in seconds
+    """
+    import contextlib
+    import io
+
+    from core.analysis import ir_from_recording
+
+    cfg = cfg or get_config()
+    start = time.perf_counter()
+    result = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        ir = ir_from_recording(rec, cfg)
+        ir = ir if ir.ndim == 1 else ir[:, 0]
+        if "metrics" in stages:
+            from core.metrics import RT60, C50
+            result["rt60"] = RT60(ir, cfg=cfg)
+            result["c50"] = C50(ir, cfg=cfg)
+        if "bands" in stages:
+            from core.analysis import _sweep_for
+            from core.metrics import band_metrics
+            result["bands"] = band_metrics(ir, cfg, valid=len(ir) - len(_sweep_for(cfg)[1]) + 1)
+        if "sti" in stages:
+            from core.metrics import sti
+            result["sti"] = sti(ir, cfg)["sti"]
+        if "reflections" in stages:
+            from core.reflections import reflections
+            result["reflections"] = reflections(ir, cfg).tolist()
+        if "quality" in stages:
+            from core.analysis import _sweep_for
+            from core.quality import assess_take
+            result["quality"] = assess_take(ir, rec, cfg, inv_length=len(_sweep_for(cfg)[1]))
+    result["seconds"] = time.perf_counter() - start
+    return result
@@ -1,42 +1,95 @@
 import os
 
 import numpy as np
-import sounddevice as sd
-import soundfile as sf
 
-from utils.config import load_config
+from utils.config import get_config
+from utils.trace import traced
 
 
-cfg = load_config()
-FS = int(float(cfg.get("fs", 48000)))
-RECORD_TAIL = float(cfg.get("record_tail", 0.0))
+@traced()
+def play_and_record(sig, cfg=None, save=True, progress=None):
+    """Play sweep signal and simultaneously record response.
 
+    sig may be (frames,) or (frames, outputs) to drive several output
+    channels at once. Records cfg.input_channels channels in cfg.dtype;
+    returns (frames,) for one channel, (frames, channels) otherwise. Large captures are recorded
+    straight into a disk-backed buffer when they exceed the memory budget.
+    With save=False the recording is not written to data/raw.
+    progress(block) is called from this thread about every 0.1 s with the
+    frames recorded since the previous call (live level metering).
+    """
+    import sounddevice as sd
+    from utils.memory import empty, work_dtype
 
-def play_and_record(sig):
-    """Play sweep signal and simultaneously record response."""
+    cfg = cfg or get_config()
+    FS = cfg.fs
+    dtype = work_dtype(cfg)
     try:
-        tail_samples=int(RECORD_TAIL*FS)
+        tail_samples=int(cfg.record_tail*FS)
         sd.wait()
-        playback=np.concatenate([sig, np.zeros(tail_samples, dtype=sig.dtype)])
+        playback=empty((len(sig)+tail_samples,)+sig.shape[1:], dtype, cfg, name="playback")
+        playback[:len(sig)]=sig
+        playback[len(sig):]=0
 
         print(f"🎵 播放并录制中... ({len(playback)/FS:.1f}秒)")
-        rec=sd.playrec(playback,FS,channels=1)
-        sd.wait()
+        out=empty((len(playback), cfg.input_channels), dtype, cfg, name="rec")
+        rec=sd.playrec(playback,FS,channels=cfg.input_channels,dtype=dtype.name,out=out)
+        if progress is None:
+            sd.wait()
+        else:
+            _watch(out, FS, progress)
+        del playback
 
         if rec is None or len(rec) == 0:
             raise ValueError("录制失败：没有录制到音频数据")
 
-        rec=rec.squeeze()
+        rec=rec[:,0] if rec.shape[1] == 1 else rec
 
         # Check if recording is too quiet (potential hardware issue)
         max_level = np.max(np.abs(rec))
         if max_level < 1e-6:
             print("⚠️ 警告：录制音量过低，可能存在硬件问题")
 
-        os.makedirs("data/raw",exist_ok=True)
-        sf.write("data/raw/rec.wav",rec,FS)
+        if save:
+            import soundfile as sf
+            os.makedirs("data/raw",exist_ok=True)
+            sf.write("data/raw/rec.wav",rec,FS)
         print(f"✅ 录制完成，峰值: {20*np.log10(max_level):.1f} dB")
         return rec
     except Exception as e:
         print(f"❌ 录制错误: {e}")
         raise
+
+
+def _watch(out, fs, progress, interval=0.1):
+    """Wait for the running playrec() while handing newly filled frames of out to progress."""
+    import time
+    import sounddevice as sd
+
+    start = time.perf_counter()
+    done = 0
+    while sd.get_stream().active:
+        sd.sleep(int(interval * 1000))
+        pos = min(len(out), int((time.perf_counter() - start) * fs))
+        if pos > done:
+            progress(out[done:pos])
+            done = pos
+    sd.wait()
+    if done < len(out):
+        progress(out[done:])
+
+
+def record_take(sig, cfg=None, simulate=False, save=True, progress=None):
+    """Play the sweep and record one take; simulate=True uses core.simulate instead of a sound card.
+
+    progress: see play_and_record(); a simulated take is fed to it in 0.1 s blocks.
+    """
+    if simulate:
+        from core.simulate import simulate_recording
+        rec = simulate_recording(sig, cfg)
+        if progress is not None:
+            step = int(0.1 * (cfg or get_config()).fs)
+            for a in range(0, len(rec), step):
+                progress(rec[a:a + step])
+        return rec
+    return play_and_record(sig, cfg, save=save, progress=progress)
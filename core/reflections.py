@@ -1,17 +1,17 @@
 
 import numpy as np
-from scipy.signal import find_peaks
 
-from utils.config import load_config
+from utils.config import get_config
+from utils.trace import traced
 
 
-p=load_config()
-fs=float(p.get("fs", 48000))
-db=float(p.get("min_peak_db", -25))
-dist=float(p.get("min_peak_distance_ms", 1.0))
-
-def reflections(ir):
+@traced()
+def reflections(ir, cfg=None):
     """Detect reflection peaks in impulse response."""
+    from scipy.signal import find_peaks
+
+    cfg = cfg or get_config()
+    fs, db, dist = cfg.fs, cfg.min_peak_db, cfg.min_peak_distance_ms
     th=np.max(np.abs(ir))*10**(db/20)
     min_dist=max(1,int(fs*dist/1000))
     peaks,_=find_peaks(np.abs(ir),height=th,distance=min_dist)
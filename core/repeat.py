@@ -0,0 +1,259 @@
+"""
+重复测量的可重复性与时变性跟踪 - 多次扫频取平均前剔除被干扰的测量
+
+    python run.py repeat --takes 5                      测量 5 次，剔除异常后平均
+    python run.py repeat --takes 5 --simulate --disturb 3   模拟第 3 次测量时房间发生变化
+
+气流、人员走动会让两次测量之间的IR发生变化，直接平均会得到错误的IR和T30。
+每次测量的IR先与当前平均IR按直达声对齐，再逐个倍频程比较：
+
+    相干性      直达声后 (到衰减进入噪声为止) 的频谱与平均IR的归一化互谱
+    衰减偏差    Schroeder 能量衰减曲线 (0 ~ -25 dB) 与平均IR的均方根差
+
+超过绝对门限，或 (已比较并接受 3 次以上时) 偏离已接受测量的均值超过 3 个标准差的测量被剔除，
+不进入平均。平均值和方差用 Welford 算法逐采样增量更新，只保留这两个缓冲区。
+"""
+
+import math
+
+import numpy as np
+
+from core.metrics import OCTAVE_BANDS
+from core.session import RunningStats
+from utils.config import get_config
+
+
+BANDS = OCTAVE_BANDS + (8000,)
+MIN_COHERENCE = 0.9         # per band
+MAX_EDC_DEVIATION = 1.0     # dB rms, per band
+EDC_FLOOR = -25.0           # dB; the decay curves are compared down to here
+OUTLIER_SIGMA = 3.0
+MIN_SPREAD = {"coherence": 0.01, "edc_db": 0.1}  # floor of the standard deviation in the statistical test
+MIN_STATS = 3               # accepted comparisons before the statistical test applies
+MIN_WINDOW = 0.1            # seconds; shortest comparison window after the direct sound
+PRE = 0.001                 # seconds before the direct sound included in the comparison
+
+
+def _db(x):
+    return 10 * math.log10(x) if x > 0 else float("-inf")
+
+
+def band_coherence(x, y, fs, bands=BANDS):
+    """Normalised cross-spectrum |sum X Y*| / sqrt(sum |X|² sum |Y|²) of x and y per octave band.
+
+    1 when y is a scaled copy of x within the band; phase changes (moving
+    air) and additive differences both lower it.
+    """
+    n = 1 << int(np.ceil(np.log2(max(len(x), len(y)))))
+    X, Y = np.fft.rfft(x, n), np.fft.rfft(y, n)
+    f = np.fft.rfftfreq(n, 1 / fs)
+    result = {}
+    for fc in bands:
+        if fc * math.sqrt(2) >= fs / 2:
+            continue
+        sel = (f >= fc / math.sqrt(2)) & (f < fc * math.sqrt(2))
+        a, b = X[sel], Y[sel]
+        den = math.sqrt(float(np.sum(np.abs(a) ** 2) * np.sum(np.abs(b) ** 2)))
+        result[fc] = float(np.abs(np.sum(a * np.conj(b))) / den) if den > 0 else float("nan")
+    return result
+
+
+def _edc_db(x):
+    """Schroeder energy decay curve in dB re its start."""
+    energy = np.cumsum(np.square(x[::-1], dtype=np.float64))[::-1]
+    return 10 * np.log10(np.maximum(energy / max(energy[0], 1e-300), 1e-30))
+
+
+def edc_deviation(x, y, fs, bands=BANDS, floor=EDC_FLOOR):
+    """RMS difference (dB) of the octave-band decay curves of x and y, down to `floor` dB of y's."""
+    from core.metrics import octave_filter
+
+    result = {}
+    for fc in bands:
+        if fc * math.sqrt(2) >= fs / 2:
+            continue
+        a, b = _edc_db(octave_filter(x, fc, fs)), _edc_db(octave_filter(y, fc, fs))
+        keep = b >= floor
+        result[fc] = float(np.sqrt(np.mean((a[keep] - b[keep]) ** 2))) if keep.any() else float("nan")
+    return result
+
+
+class TakeAverage:
+    """Outlier-rejecting running average of repeated, synchronised IRs.
+
+    Every take is shifted so its direct sound lines up with the mean's,
+    then compared with the running mean over the window from just before
+    the direct sound to where the first take's decay meets its noise floor
+    (core.quality.decay_fit). A take is rejected when, in any band, the
+    coherence is below min_coherence or the decay curve deviates by more
+    than max_edc_db, or, once MIN_STATS takes have been compared and
+    accepted, when the value lies more than sigma standard deviations (at
+    least MIN_SPREAD) beyond the mean of the accepted ones. The first take
+    is the reference and is always accepted.
+
+    Only the Welford mean and M2 buffers (one IR each) are kept, plus
+    RunningStats of the per-band indicators and the per-take RT60.
+    """
+
+    def __init__(self, cfg=None, bands=BANDS, min_coherence=MIN_COHERENCE, max_edc_db=MAX_EDC_DEVIATION,
+                 sigma=OUTLIER_SIGMA):
+        self.cfg = cfg or get_config()
+        self.bands = bands
+        self.min_coherence, self.max_edc_db, self.sigma = min_coherence, max_edc_db, sigma
+        self.n = 0          # accepted takes
+        self.takes = 0      # all takes
+        self.mean = self._m2 = None
+        self.onset = None
+        self.window = None  # (start, end) samples of the comparison window
+        self.stats = {}     # (indicator, band) -> RunningStats over the accepted comparisons
+        self.rt60 = RunningStats()
+
+    def _align(self, ir):
+        """ir shifted (zero-filled) so its peak lies on the mean's onset."""
+        shift = self.onset - int(np.argmax(np.abs(ir)))
+        if shift == 0:
+            return ir, 0
+        out = np.zeros_like(ir)
+        if shift > 0:
+            out[shift:] = ir[:len(ir) - shift]
+        else:
+            out[:shift] = ir[-shift:]
+        return out, shift
+
+    def _outliers(self, indicators):
+        """[(indicator, band, value)] outside the absolute limits or the accepted takes' spread."""
+        bad = []
+        for (name, band), value in indicators.items():
+            if math.isnan(value):
+                continue
+            limit = value < self.min_coherence if name == "coherence" else value > self.max_edc_db
+            stats = self.stats.get((name, band))
+            spread = False
+            if stats is not None and stats.n >= MIN_STATS:
+                z = (value - stats.mean) / max(stats.std, MIN_SPREAD[name])
+                spread = (z < -self.sigma) if name == "coherence" else (z > self.sigma)
+            if limit or spread:
+                bad.append((name, band, value))
+        return bad
+
+    def add(self, ir):
+        """Compare one take with the running mean and add it unless it is an outlier.
+
+        Returns:
+            dict with take (1-based), accepted, shift (samples), coherence
+            and edc_db ({band: value}), rt60 and reasons (Chinese messages)
+        """
+        from core.metrics import RT60
+        from utils.memory import empty
+
+        cfg = self.cfg
+        fs = cfg.fs
+        ir = np.asarray(ir, dtype=np.float64)
+        ir = ir if ir.ndim == 1 else ir[:, 0]
+        self.takes += 1
+        result = {"take": self.takes, "shift": 0, "coherence": {}, "edc_db": {}, "reasons": []}
+        if self.mean is None:
+            from core.quality import block_levels, decay_fit, BLOCK
+
+            self.onset = int(np.argmax(np.abs(ir)))
+            levels = block_levels(ir[self.onset:], fs)
+            end = decay_fit(levels)[3] if len(levels) >= 10 else len(levels)
+            length = max(int(MIN_WINDOW * fs), end * int(BLOCK * fs))
+            self.window = (max(0, self.onset - int(PRE * fs)), min(len(ir), self.onset + length))
+            self.mean = empty(len(ir), np.float64, cfg, name="repeat-mean")
+            self.mean[:] = 0
+            self._m2 = empty(len(ir), np.float64, cfg, name="repeat-m2")
+            self._m2[:] = 0
+        else:
+            if len(ir) != len(self.mean):
+                raise ValueError(f"IR 长度 ({len(ir)}) 与之前的测量 ({len(self.mean)}) 不同，请使用相同的配置")
+            ir, result["shift"] = self._align(ir)
+            a, b = self.window
+            x, m = ir[a:b], self.mean[a:b]
+            result["coherence"] = band_coherence(x, m, fs, self.bands)
+            result["edc_db"] = edc_deviation(x, m, fs, self.bands)
+            indicators = {("coherence", band): v for band, v in result["coherence"].items()}
+            indicators.update({("edc_db", band): v for band, v in result["edc_db"].items()})
+            for name, band, value in self._outliers(indicators):
+                if name == "coherence":
+                    result["reasons"].append(f"{band} Hz 相干性 {value:.3f}")
+                else:
+                    result["reasons"].append(f"{band} Hz 衰减曲线偏差 {value:.2f} dB")
+        result["rt60"] = RT60(ir, cfg=cfg)
+        result["accepted"] = not result["reasons"]
+        if not result["accepted"]:
+            return result
+
+        if self.n:
+            for band, value in result["coherence"].items():
+                self.stats.setdefault(("coherence", band), RunningStats()).update(value)
+            for band, value in result["edc_db"].items():
+                self.stats.setdefault(("edc_db", band), RunningStats()).update(value)
+        self.n += 1
+        delta = ir - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (ir - self.mean)
+        self.rt60.update(result["rt60"])
+        return result
+
+    @property
+    def variance(self):
+        """Per-sample sample variance of the accepted takes (None below two)."""
+        return self._m2 / (self.n - 1) if self.n > 1 else None
+
+    def residual_db(self):
+        """Variance energy of the accepted takes re the mean IR within the comparison window, dB."""
+        if self.n < 2:
+            return float("nan")
+        a, b = self.window
+        return _db(float(np.sum(self._m2[a:b]) / (self.n - 1)) / max(float(np.sum(self.mean[a:b] ** 2)), 1e-30))
+
+    def summary(self):
+        """takes, accepted, rejected, rt60 mean/std of the accepted takes, residual_db."""
+        return {"takes": self.takes, "accepted": self.n, "rejected": self.takes - self.n,
+                "rt60_mean": self.rt60.mean if self.rt60.n else float("nan"), "rt60_std": self.rt60.std,
+                "residual_db": self.residual_db()}
+
+
+def format_take(result):
+    """One line per take: status, worst coherence and decay deviation, RT60."""
+    coh = [v for v in result["coherence"].values() if not math.isnan(v)]
+    edc = [v for v in result["edc_db"].values() if not math.isnan(v)]
+    rt = "N/A" if result["rt60"] is None or math.isnan(result["rt60"]) else f"{result['rt60']:.3f}s"
+    if not coh:
+        detail = "参考测量"
+    else:
+        detail = f"最低相干性 {min(coh):.3f}, 最大衰减偏差 {max(edc):.2f} dB"
+    line = f"   #{result['take']}: {'✅ 接受' if result['accepted'] else '❌ 剔除'}  {detail}  RT60={rt}"
+    if result["reasons"]:
+        line += "  (" + "; ".join(result["reasons"]) + ")"
+    return line
+
+
+def measure_repeated(cfg=None, takes=5, simulate=False, disturb=()):
+    """Record `takes` sweeps, deconvolve each and average them with TakeAverage.
+
+    disturb: 1-based take numbers simulated in a changed room (a different
+    room response), to try out the rejection without a sound card.
+
+    Returns:
+        (TakeAverage, [per-take results])
+    """
+    from core.analysis import _sweep_for, ir_from_recording
+    from core.record import record_take
+
+    cfg = cfg or get_config()
+    sig, _ = _sweep_for(cfg)
+    average = TakeAverage(cfg)
+    results = []
+    for n in range(1, takes + 1):
+        if simulate and n in disturb:
+            from core.simulate import simulate_recording
+            rec = simulate_recording(sig, cfg, room_seed=n)
+        else:
+            rec = record_take(sig, cfg, simulate, save=False)
+        result = average.add(ir_from_recording(rec, cfg))
+        del rec
+        print(format_take(result))
+        results.append(result)
+    return average, results
@@ -0,0 +1,268 @@
+"""
+长录音扫频检测 - 从独立录音机录下的整场录音中找出每一次扫频并提取IR
+
+    python run.py scan session.wav --room A            每次扫频提取一个IR，写入测量档案
+    python run.py scan session.wav --no-archive        只列出找到的扫频和指标
+
+录音按块 (默认 10 秒) 用 soundfile 流式读取，内存占用与文件长度无关：
+    1. 低通 + 抽取 (默认 8 倍，滤波器状态跨块保留)
+    2. 与同样抽取后的扫频做匹配滤波 (重叠保留法 FFT 相关)，
+       按局部能量归一化，超过门限的局部最大值即为一次扫频 (相距至少一个扫频长度)
+    3. 每次扫频从文件中读出一段录音，在检测位置附近做全采样率同步
+       (见 core.sync.sync_window)，再去卷积、计算指标 (core.analysis.analyze_take)
+
+扫频参数 (sweep_duration, sweep_freq_min/max, silence_pre) 必须与播放时一致；
+采样率取文件本身的采样率。
+"""
+
+import contextlib
+import io
+import os
+
+import numpy as np
+
+from utils.config import get_config
+
+
+DECIMATE = 8
+BLOCK = 10.0            # seconds read per block
+THRESHOLD = 0.1         # normalised matched-filter output counted as a sweep (noise: < 0.08)
+PRE = 0.1               # seconds of recording kept before the detected position
+EARLY = 0.05            # the fine synchronisation also searches this far before it
+SILENCE = 1e-6          # rms below which the recording counts as digital silence (no detections)
+
+
+def _lowpass(decimate):
+    """Anti-aliasing filter for decimation by `decimate`."""
+    import scipy.signal as sps
+
+    return sps.cheby1(8, 0.05, 0.8 / decimate, output="sos")
+
+
+def matched_template(sig, decimate=DECIMATE):
+    """Non-silent part of the played signal, low-passed and decimated; and its offset in sig."""
+    import scipy.signal as sps
+
+    loud = np.flatnonzero(sig)
+    if not len(loud):
+        raise ValueError("扫频信号为空")
+    a, b = int(loud[0]), int(loud[-1]) + 1
+    x = sps.sosfilt(_lowpass(decimate), np.asarray(sig[a:b], dtype=np.float64))[::decimate]
+    return x, a
+
+
+class SweepDetector:
+    """Streaming matched filter for one known sweep.
+
+    Feed consecutive blocks of the full-rate recording (any lengths) to
+    push(); it returns the detections completed so far as
+    (sample, score): the recording position (full rate) where the
+    template's first sample, i.e. the direct sound of the sweep, arrives,
+    and the normalised matched-filter output there (1 for a clean copy).
+
+    The filter and decimation state carry over between blocks, and the
+    correlation uses overlap-save with FFT length `fft`, so the state is
+    O(template) whatever the recording length.
+    """
+
+    def __init__(self, template, decimate=DECIMATE, threshold=THRESHOLD):
+        import scipy.signal as sps
+
+        self.template = np.asarray(template, dtype=np.float64)
+        self.m = len(self.template)
+        self.decimate, self.threshold = decimate, threshold
+        self.norm = float(np.sqrt(np.sum(self.template ** 2)))
+        self.floor = self.m * SILENCE ** 2
+        self.fft = 1 << int(np.ceil(np.log2(4 * self.m)))
+        self.spectrum = np.conj(np.fft.rfft(self.template, self.fft))
+        self.sos = _lowpass(decimate)
+        self.zi = sps.sosfilt_zi(self.sos) * 0.0
+        self.phase = 0          # full-rate samples to skip before the next kept one
+        self.buffer = np.zeros(0)
+        self.base = 0           # decimated index of buffer[0]
+        self.best = None        # pending (decimated index, score)
+
+    def _decimated(self, block):
+        import scipy.signal as sps
+
+        y, self.zi = sps.sosfilt(self.sos, np.asarray(block, dtype=np.float64), zi=self.zi)
+        kept = y[self.phase::self.decimate]
+        self.phase = (self.phase - len(y)) % self.decimate
+        return kept
+
+    def _peaks(self, score, first):
+        """Advance the pending detection over score (decimated index first...); returns finished ones."""
+        done = []
+        above = np.flatnonzero(score >= self.threshold)
+        if len(above):
+            # local maxima among the samples above the threshold
+            s = score[above]
+            left = np.concatenate([[-np.inf], score])[above]
+            right = np.concatenate([score, [-np.inf]])[above + 1]
+            peaks = above[(s >= left) & (s >= right)]
+        else:
+            peaks = above
+        for i in peaks:
+            k, value = first + int(i), float(score[i])
+            if self.best is None:
+                self.best = (k, value)
+            elif k - self.best[0] < self.m:
+                if value > self.best[1]:
+                    self.best = (k, value)
+            else:
+                done.append(self.best)
+                self.best = (k, value)
+        end = first + len(score)
+        if self.best is not None and end - self.best[0] >= self.m:
+            done.append(self.best)
+            self.best = None
+        return done
+
+    def _emit(self, found):
+        return [(k * self.decimate, value) for k, value in found]
+
+    def push(self, block):
+        """Process one full-rate block; returns [(sample, score)] of the detections completed."""
+        self.buffer = np.concatenate([self.buffer, self._decimated(block)])
+        found = []
+        step = self.fft - self.m + 1
+        while len(self.buffer) >= self.fft:
+            x = self.buffer[:self.fft]
+            c = np.fft.irfft(np.fft.rfft(x) * self.spectrum, self.fft)[:step]
+            energy = np.concatenate([[0.0], np.cumsum(x * x)])
+            local = np.sqrt(np.maximum(energy[self.m:self.m + step] - energy[:step], self.floor))
+            found += self._peaks(c / (self.norm * local), self.base)
+            self.buffer = self.buffer[step:]
+            self.base += step
+        return self._emit(found)
+
+    def flush(self):
+        """Detections left at the end of the recording (a sweep cut short is not reported)."""
+        found = []
+        if len(self.buffer) >= self.m:
+            x = np.concatenate([self.buffer, np.zeros(self.fft - len(self.buffer))])
+            n = len(self.buffer) - self.m + 1
+            c = np.fft.irfft(np.fft.rfft(x) * self.spectrum, self.fft)[:n]
+            energy = np.concatenate([[0.0], np.cumsum(x * x)])
+            local = np.sqrt(np.maximum(energy[self.m:self.m + n] - energy[:n], self.floor))
+            found += self._peaks(c / (self.norm * local), self.base)
+        if self.best is not None:
+            found.append(self.best)
+            self.best = None
+        self.buffer = np.zeros(0)
+        return self._emit(found)
+
+
+def scan_file(path, cfg=None, channel=0, block=BLOCK, decimate=DECIMATE, threshold=THRESHOLD):
+    """Yield (start, score) for every occurrence of the configured sweep in a long recording.
+
+    start is the recording position (samples) of the played signal's first
+    sample (silence_pre included) as seen through the latency and the
+    acoustic path, accurate to about `decimate` samples. cfg.fs is
+    replaced by the file's sample rate.
+    """
+    import soundfile as sf
+    from core.analysis import _sweep_for
+
+    cfg = cfg or get_config()
+    with sf.SoundFile(path) as f:
+        cfg = cfg.with_overrides(fs=f.samplerate)
+        sig, _ = _sweep_for(cfg)
+        template, offset = matched_template(sig, decimate)
+        detector = SweepDetector(template, decimate, threshold)
+        frames = max(decimate, int(block * f.samplerate))
+        while True:
+            x = f.read(frames, dtype="float64", always_2d=True)
+            if not len(x):
+                break
+            for sample, score in detector.push(x[:, channel]):
+                yield sample - offset, score
+        for sample, score in detector.flush():
+            yield sample - offset, score
+
+
+def read_take(path, start, cfg, channel=0, pre=PRE):
+    """Recording of one sweep: `pre` seconds before start to the end of its record_tail (zero-padded)."""
+    import soundfile as sf
+    from core.analysis import _sweep_for
+
+    sig, _ = _sweep_for(cfg)
+    a = start - int(pre * cfg.fs)
+    n = int(pre * cfg.fs) + len(sig) + int(cfg.record_tail * cfg.fs)
+    out = np.zeros(n, dtype=cfg.dtype)
+    with sf.SoundFile(path) as f:
+        lo = max(0, a)
+        if lo < f.frames:
+            f.seek(lo)
+            x = f.read(min(n - (lo - a), f.frames - lo), dtype="float64", always_2d=True)[:, channel]
+            out[lo - a:lo - a + len(x)] = x
+    return out
+
+
+def extract_takes(path, cfg=None, archive=None, room=None, position=None, channel=0,
+                  block=BLOCK, decimate=DECIMATE, threshold=THRESHOLD, start_time=None):
+    """Find every sweep in a long recording and analyze each one (analyze_take()).
+
+    With an archive directory every IR is stored there as a "scan"
+    measurement. Its timestamp is start_time (the recording's start, epoch
+    seconds) plus the sweep's position; by default the recording is taken
+    to have ended at the file's modification time.
+
+    Returns:
+        list of dicts: take (1-based), start_s (refined at full rate), score
+        and the analyze_take() result, or error
+    """
+    import soundfile as sf
+    from core.analysis import _sweep_for, analyze_take
+    from core.sync import sync_and_trim, sync_window
+
+    cfg = cfg or get_config()
+    info = sf.info(path)
+    cfg = cfg.with_overrides(fs=info.samplerate)
+    sig, _ = _sweep_for(cfg)
+    if start_time is None:
+        start_time = os.path.getmtime(path) - info.frames / info.samplerate
+    # the fine synchronisation searches around the detected position
+    take_cfg = cfg.with_overrides(sync_latency=PRE - EARLY)
+    results = []
+    if archive:
+        from utils.store import MeasurementStore
+        store = MeasurementStore(archive)
+    else:
+        store = contextlib.nullcontext()
+    with store:
+        for n, (start, score) in enumerate(scan_file(path, cfg, channel, block, decimate, threshold), 1):
+            row = {"take": n, "start_s": start / cfg.fs, "score": score}
+            try:
+                rec = read_take(path, start, take_cfg, channel)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    # the matched filter runs below decimated Nyquist and may lock onto a strong early reflection
+                    offset = len(rec) - len(sync_and_trim(rec, sig, sync_window(take_cfg)))
+                start += offset - int(PRE * cfg.fs)
+                row["start_s"] = start / cfg.fs
+                take = analyze_take(rec, take_cfg, archive)
+                del rec
+                if archive:
+                    store.add_measurement(room=room, position=position, cfg=cfg, metrics=take["metrics"],
+                                          timestamp=start_time + start / cfg.fs,
+                                          source=f"scan:{os.path.basename(path)}@{start / cfg.fs:.2f}s",
+                                          kind="scan", measurement_id=take["measurement_id"])
+                row.update(take)
+            except Exception as e:
+                row["error"] = f"{type(e).__name__}: {e}"
+            results.append(row)
+            print(format_take(row))
+    return results
+
+
+def format_take(row):
+    """One line per detected sweep."""
+    minutes, seconds = divmod(row["start_s"], 60)
+    head = f"   #{row['take']}: {int(minutes):3d}:{seconds:05.2f}  匹配度 {row['score']:.2f}"
+    if row.get("error"):
+        return f"{head}  ❌ {row['error']}"
+    line = f"{head}  T30={row['rt60']:.3f}s  C50={row['c50']:.2f}dB"
+    warnings = row["quality"]["warnings"]
+    if warnings:
+        line += "  ⚠️ " + "; ".join(message for _, message in warnings)
+    return line
@@ -2,15 +2,53 @@
 import os
 import numpy as np
 import soundfile as sf
-from utils.config import load_config
+from utils.config import get_config
+from utils.trace import traced
 
 
-cfg = load_config()
-FS = int(float(cfg.get("fs", 48000)))
-EARLY_REFL_TIME = float(cfg.get("early_reflection_time", 0.08))
+# Frames written per block when exporting the components
+_CHUNK = 1 << 18
 
 
-def separate_ir_components(ir, output_dir="data/separated"):
+def _energy(ir, a, b):
+    """Energy of ir[a:b], accumulated in float64."""
+    return float(np.sum(np.square(ir[a:b], dtype=np.float64))) if a < b else 0.0
+
+
+def _component_chunks(ir, a, b, scale):
+    """Blocks of an IR that is zero outside [a, b), for streaming to a file."""
+    for start in range(0, len(ir), _CHUNK):
+        stop = min(start + _CHUNK, len(ir))
+        block = np.zeros(stop - start)
+        lo, hi = max(a, start), min(b, stop)
+        if lo < hi:
+            block[lo - start:hi - start] = ir[lo:hi]
+        block *= scale
+        yield block
+
+
+def component_spans(ir, cfg=None):
+    """Sample ranges of the direct sound (±5 ms around the peak), early reflections and late reverb.
+
+    Returns:
+        {"direct": (a, b), "early": (a, b), "late": (a, b)}
+    """
+    cfg = cfg or get_config()
+    fs = cfg.fs
+    direct_idx = int(np.argmax(np.abs(ir)))
+    window = int(0.005 * fs)
+    direct_start = max(0, direct_idx - window)
+    direct_end = min(len(ir), direct_idx + window)
+    early_end = min(len(ir), direct_idx + int(cfg.early_reflection_time * fs))
+    return {
+        'direct': (direct_start, direct_end),
+        'early': (direct_end, max(direct_end, early_end)),
+        'late': (early_end, len(ir)),
+    }
+
+
+@traced()
+def separate_ir_components(ir, output_dir="data/separated", cfg=None):
     """
     将脉冲响应分离为三个部分并保存为单独的wav文件：
     1. 直达声 (Direct Sound)
@@ -20,44 +58,24 @@ def separate_ir_components(ir, output_dir="data/separated"):
     Args:
         ir: 脉冲响应数组
         output_dir: 输出目录
+        cfg: 配置 (Config)，默认使用 get_config()
 
     Returns:
         dict: 包含三个部分的文件路径
     """
+    cfg = cfg or get_config()
+    FS = cfg.fs
     os.makedirs(output_dir, exist_ok=True)
 
-    # 找到直达声位置（最大峰值）
-    direct_idx = np.argmax(np.abs(ir))
-
-    # 计算时间边界
-    # 直达声窗口：峰值前后各5ms
-    direct_window_samples = int(0.005 * FS)  # 5ms
-    direct_start = max(0, direct_idx - direct_window_samples)
-    direct_end = min(len(ir), direct_idx + direct_window_samples)
-
-    # 早反射窗口：直达声结束到EARLY_REFL_TIME之后
-    early_end_idx = min(len(ir), direct_idx + int(EARLY_REFL_TIME * FS))
-
-    # === 1. 直达声 (Direct Sound) ===
-    direct_sound = np.zeros_like(ir)
-    direct_sound[direct_start:direct_end] = ir[direct_start:direct_end]
-
-    # === 2. 早反射 (Early Reflections) ===
-    early_reflections = np.zeros_like(ir)
-    if direct_end < early_end_idx:
-        early_reflections[direct_end:early_end_idx] = ir[direct_end:early_end_idx]
-
-    # === 3. 混响尾声 (Late Reverb) ===
-    late_reverb = np.zeros_like(ir)
-    if early_end_idx < len(ir):
-        late_reverb[early_end_idx:] = ir[early_end_idx:]
+    # 时间边界：直达声为峰值前后各5ms，早反射到 early_reflection_time 为止
+    spans = component_spans(ir, cfg)
+    (direct_start, direct_end), (_, early_end_idx) = spans['direct'], spans['early']
 
     # 归一化（保持相对能量比例）
     max_val = np.max(np.abs(ir))
-    if max_val > 0:
-        direct_sound = direct_sound / max_val
-        early_reflections = early_reflections / max_val
-        late_reverb = late_reverb / max_val
+    scale = 1.0 / max_val if max_val > 0 else 1.0
+
+    # 三个部分只在各自的窗口内非零，按块写出，不生成完整长度的副本
 
     # 保存文件
     paths = {
@@ -65,15 +83,14 @@ def separate_ir_components(ir, output_dir="data/separated"):
         'early': os.path.join(output_dir, 'early_reflections.wav'),
         'late': os.path.join(output_dir, 'late_reverb.wav'),
     }
-
-    sf.write(paths['direct'], direct_sound, FS)
-    sf.write(paths['early'], early_reflections, FS)
-    sf.write(paths['late'], late_reverb, FS)
+    for name, (a, b) in spans.items():
+        with sf.SoundFile(paths[name], 'w', FS, 1) as fh:
+            for block in _component_chunks(ir, a, b, scale):
+                fh.write(block)
 
     # 计算各部分能量
-    direct_energy = np.sum(direct_sound ** 2)
-    early_energy = np.sum(early_reflections ** 2)
-    late_energy = np.sum(late_reverb ** 2)
+    direct_energy, early_energy, late_energy = (
+        _energy(ir, a, b) * scale ** 2 for a, b in spans.values())
     total_energy = direct_energy + early_energy + late_energy
 
     # 输出信息
@@ -96,7 +113,8 @@ def separate_ir_components(ir, output_dir="data/separated"):
     return paths
 
 
-def export_ir_comparison(ir, output_path="data/separated/comparison.wav"):
+@traced()
+def export_ir_comparison(ir, output_path="data/separated/comparison.wav", cfg=None):
     """
     导出一个包含4个通道的对比文件：
     通道1: 完整IR
@@ -106,42 +124,26 @@ def export_ir_comparison(ir, output_path="data/separated/comparison.wav"):
 
     这样可以在DAW中直接对比各部分
     """
+    cfg = cfg or get_config()
+    FS = cfg.fs
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    # 找到直达声位置
-    direct_idx = np.argmax(np.abs(ir))
-
-    # 计算时间边界
-    direct_window_samples = int(0.005 * FS)
-    direct_start = max(0, direct_idx - direct_window_samples)
-    direct_end = min(len(ir), direct_idx + direct_window_samples)
-    early_end_idx = min(len(ir), direct_idx + int(EARLY_REFL_TIME * FS))
-
-    # 创建分离信号
-    direct_sound = np.zeros_like(ir)
-    direct_sound[direct_start:direct_end] = ir[direct_start:direct_end]
-
-    early_reflections = np.zeros_like(ir)
-    if direct_end < early_end_idx:
-        early_reflections[direct_end:early_end_idx] = ir[direct_end:early_end_idx]
-
-    late_reverb = np.zeros_like(ir)
-    if early_end_idx < len(ir):
-        late_reverb[early_end_idx:] = ir[early_end_idx:]
-
     # 归一化
     max_val = np.max(np.abs(ir))
-    if max_val > 0:
-        ir_norm = ir / max_val
-        direct_sound = direct_sound / max_val
-        early_reflections = early_reflections / max_val
-        late_reverb = late_reverb / max_val
-
-    # 合并为多通道
-    multichannel = np.column_stack([ir_norm, direct_sound, early_reflections, late_reverb])
-
-    # 保存
-    sf.write(output_path, multichannel, FS)
+    scale = 1.0 / max_val if max_val > 0 else 1.0
+    spans = [(0, len(ir)), *component_spans(ir, cfg).values()]
+
+    # 合并为多通道并保存，按块写出
+    with sf.SoundFile(output_path, 'w', FS, 4) as fh:
+        for start in range(0, len(ir), _CHUNK):
+            stop = min(start + _CHUNK, len(ir))
+            block = np.zeros((stop - start, 4))
+            for ch, (a, b) in enumerate(spans):
+                lo, hi = max(a, start), min(b, stop)
+                if lo < hi:
+                    block[lo - start:hi - start, ch] = ir[lo:hi]
+            block *= scale
+            fh.write(block)
 
     print(f"💾 对比文件已保存: {output_path}")
     print(f"   通道1: 完整IR")
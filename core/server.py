@@ -0,0 +1,544 @@
+"""
+本地测量服务 - HTTP/WebSocket API
+
+    python run.py serve                       http://127.0.0.1:8765
+    python run.py serve --simulate            使用模拟音频后端 (无需声卡)
+
+    GET  /                    web/ 查看器
+    GET  /api/devices         音频设备列表
+    GET  /api/config          当前配置
+    POST /api/measure         {"overrides": {"sweep_duration": 4}, "fresh": true} -> 任务
+    GET  /api/jobs            所有任务
+    GET  /api/jobs/<id>       任务状态与结果
+    GET  /api/jobs/<id>/ir    IR (float32 小端二进制, 采样率见 X-Sample-Rate; 旧任务的IR已释放: 410)
+    GET  /ws                  WebSocket: 推送 job/level/result/ir 消息；
+                              也可发送 {"type": "measure", "overrides": {...}}
+
+只接受本机同源请求: Host 必须是 localhost、IP 地址或监听地址 (防 DNS 重绑定)，
+带 Origin 的请求 (浏览器) 必须与 Host 同源，POST 请求体必须是 application/json。
+
+采集在专用的音频线程中逐个执行 (声卡同一时间只服务一个测量)，分析在进程池中
+执行，事件循环本身从不阻塞。相同配置的请求共享进行中的任务；默认总是重新测量，
+请求 fresh=false 时才直接返回已完成任务的缓存结果。只保留最近 max_jobs 个任务，
+其中最近 keep_irs 个已完成任务保留 IR 数组 (其余只保留指标，IR 见测量档案)。
+只使用标准库 asyncio，不需要额外的 web 框架。
+"""
+
+import asyncio
+import base64
+import hashlib
+import ipaddress
+import json
+import math
+import os
+import struct
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from utils.config import get_config
+
+
+WEB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web")
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_BODY = 1 << 20
+CLIENT_QUEUE = 256
+MAX_JOBS = 100   # finished jobs beyond this are forgotten, oldest first
+KEEP_IRS = 4     # finished jobs whose IR stays in memory
+CLOSE_TIMEOUT = 5.0
+
+OP_CONT, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+_STATUS = {200: "OK", 202: "Accepted", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 410: "Gone", 413: "Payload Too Large", 415: "Unsupported Media Type",
+           500: "Internal Server Error"}
+_TYPES = {".html": "text/html; charset=utf-8", ".js": "application/javascript",
+          ".css": "text/css", ".json": "application/json"}
+
+
+def _key(key):
+    if isinstance(key, tuple):
+        name, band = key
+        return name if not band else f"{name}@{band:g}"
+    return f"{key:g}" if isinstance(key, (int, float, np.number)) else str(key)
+
+
+def _jsonable(value):
+    """NaN/inf -> None (JSON has no NaN), numpy scalars -> Python, (name, band) keys -> "name@band"."""
+    if isinstance(value, dict):
+        return {_key(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _is_ip(name):
+    try:
+        ipaddress.ip_address(name)
+        return True
+    except ValueError:
+        return False
+
+
+def _mask(data, key):
+    data = np.frombuffer(data, dtype=np.uint8)
+    return (data ^ np.resize(np.frombuffer(key, dtype=np.uint8), len(data))).tobytes()
+
+
+def encode_frame(payload, opcode=OP_TEXT, mask=False):
+    """One unfragmented WebSocket frame; clients must mask, the server must not."""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    n = len(payload)
+    bit = 0x80 if mask else 0
+    header = bytearray([0x80 | opcode])
+    if n < 126:
+        header.append(bit | n)
+    elif n < 1 << 16:
+        header += bytes([bit | 126]) + struct.pack("!H", n)
+    else:
+        header += bytes([bit | 127]) + struct.pack("!Q", n)
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = _mask(payload, key)
+    return bytes(header) + payload
+
+
+async def read_frame(reader):
+    """Read one WebSocket message (continuation frames joined).
+
+    Returns:
+        (opcode, payload bytes)
+    """
+    opcode, chunks = None, []
+    while True:
+        b0, b1 = await reader.readexactly(2)
+        n = b1 & 0x7F
+        if n == 126:
+            n, = struct.unpack("!H", await reader.readexactly(2))
+        elif n == 127:
+            n, = struct.unpack("!Q", await reader.readexactly(8))
+        if n > MAX_BODY:
+            raise ValueError("WebSocket 帧过大")
+        key = await reader.readexactly(4) if b1 & 0x80 else None
+        data = await reader.readexactly(n)
+        if key:
+            data = _mask(data, key)
+        op = b0 & 0x0F
+        if op >= OP_CLOSE:  # control frames may arrive between fragments
+            return op, data
+        opcode = op if op != OP_CONT else opcode
+        chunks.append(data)
+        if b0 & 0x80:
+            return opcode, b"".join(chunks)
+
+
+def _level(block):
+    """(peak, rms) of a block in dBFS."""
+    x = np.asarray(block, dtype=np.float64)
+    peak = float(np.max(np.abs(x))) if x.size else 0.0
+    rms = float(np.sqrt(np.mean(x * x))) if x.size else 0.0
+    return 20 * math.log10(max(peak, 1e-10)), 20 * math.log10(max(rms, 1e-10))
+
+
+def capture(cfg, simulate=False, progress=None):
+    """Audio-thread entry point: select the device and record one sweep take."""
+    from core.analysis import _sweep_for
+    from core.record import record_take
+
+    if not simulate:
+        from core.device import select_devices
+        select_devices(cfg)
+    sweep, _ = _sweep_for(cfg)
+    return record_take(sweep, cfg, simulate, save=False, progress=progress)
+
+
+class Job:
+    """One measurement request and its state: queued -> recording -> analyzing -> done | error."""
+
+    def __init__(self, cfg, overrides):
+        self.id = uuid.uuid4().hex[:12]
+        self.cfg = cfg
+        self.key = cfg.digest()
+        self.overrides = overrides
+        self.state = "queued"
+        self.created = time.time()
+        self.error = None
+        self.take = None
+        self.ir = None
+        self.done = asyncio.Event()
+
+    def describe(self, result=True):
+        info = {"type": "job", "job": self.id, "state": self.state, "config_hash": self.key,
+                "overrides": self.overrides, "created": self.created, "error": self.error}
+        if result and self.take is not None:
+            info["result"] = _jsonable({k: v for k, v in self.take.items() if k != "ir"})
+        return info
+
+
+class _Client:
+    """A WebSocket connection with a bounded send queue.
+
+    Level messages are dropped when a slow client's queue is full; losing
+    anything else closes the connection instead of blocking the broadcast.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=CLIENT_QUEUE)
+        self.closed = False
+
+    def send(self, frame, droppable=False):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            if not droppable:
+                self.closed = True
+                self.writer.close()
+
+    async def pump(self):
+        try:
+            while not self.closed:
+                self.writer.write(await self.queue.get())
+                await self.writer.drain()
+                self.queue.task_done()
+        except (ConnectionError, asyncio.CancelledError):
+            self.closed = True
+
+    async def flush(self, timeout=CLOSE_TIMEOUT):
+        """Wait until the pump has written everything queued, then mark the client closed."""
+        if not self.closed:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.closed = True
+
+
+class MeasurementServer:
+    """HTTP/WebSocket front end for measurements.
+
+    Args:
+        archive: measurement archive directory (None: do not archive)
+        workers: analysis processes
+        simulate: use core.simulate instead of a sound card
+        max_jobs: jobs kept for /api/jobs; the oldest finished ones are dropped
+        keep_irs: finished jobs, newest first, whose IR is kept in memory
+    """
+
+    def __init__(self, cfg=None, host="127.0.0.1", port=8765, archive=None, room=None,
+                 workers=None, simulate=False, web_dir=WEB_DIR, max_jobs=MAX_JOBS, keep_irs=KEEP_IRS):
+        self.cfg = cfg or get_config()
+        self.host = host
+        self.port = port
+        self.archive = archive
+        self.room = room
+        self.workers = max(1, workers or min(4, os.cpu_count() or 1))
+        self.simulate = simulate
+        self.web_dir = web_dir
+        self.max_jobs = max_jobs
+        self.keep_irs = keep_irs
+        self.jobs = {}
+        self._by_config = {}
+        self._clients = set()
+        self._audio = None
+        self._pool = None
+        self._server = None
+        self._loop = None
+
+    # -- jobs ---------------------------------------------------------------
+
+    def submit(self, overrides=None, fresh=True):
+        """Job for the configuration: joins a running one, reuses a finished one only if not fresh.
+
+        Returns:
+            (job, shared): shared is True when an existing job was returned
+        """
+        overrides = dict(overrides or {})
+        cfg = self.cfg.with_overrides(**overrides) if overrides else self.cfg
+        job = self._by_config.get(cfg.digest())
+        if job is not None and job.state != "error" and not (fresh and job.done.is_set()):
+            return job, True
+        job = Job(cfg, overrides)
+        self.jobs[job.id] = job
+        self._by_config[job.key] = job
+        self._evict()
+        self._broadcast(job.describe())
+        asyncio.ensure_future(self._run(job))
+        return job, False
+
+    def _evict(self):
+        """Drop the IRs of all but the newest keep_irs finished jobs, then jobs beyond max_jobs."""
+        finished = [job for job in self.jobs.values() if job.done.is_set()]
+        for job in finished[:max(0, len(finished) - self.keep_irs)]:
+            job.ir = None
+        for job in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job.id]
+            if self._by_config.get(job.key) is job:
+                del self._by_config[job.key]
+
+    def _set_state(self, job, state, **extra):
+        job.state = state
+        for key, value in extra.items():
+            setattr(job, key, value)
+        self._broadcast(job.describe(result=False))
+
+    async def _run(self, job):
+        from core.analysis import analyze_take
+
+        loop = asyncio.get_running_loop()
+
+        def progress(block):
+            peak, rms = _level(block)
+            loop.call_soon_threadsafe(self._broadcast, {"type": "level", "job": job.id,
+                                                        "peak_db": peak, "rms_db": rms}, True)
+
+        try:
+            self._set_state(job, "recording")
+            rec = await loop.run_in_executor(self._audio, capture, job.cfg, self.simulate, progress)
+            self._set_state(job, "analyzing")
+            take = await loop.run_in_executor(self._pool, analyze_take, rec, job.cfg, self.archive, True)
+            del rec
+            job.ir = np.asarray(take.pop("ir"), dtype="<f4")
+            if self.archive:
+                from utils.store import MeasurementStore
+                with MeasurementStore(self.archive) as store:
+                    store.add_measurement(room=self.room, cfg=job.cfg, metrics=take["metrics"],
+                                          source="server", kind="sweep", measurement_id=take["measurement_id"])
+            job.take = take
+            job.state = "done"
+            self._broadcast(dict(job.describe(), type="result"))
+            self._send_ir(job)
+            print(f"📊 任务 {job.id}: T30={take['rt60']:.3f}s C50={take['c50']:.2f}dB")
+        except Exception as e:
+            self._set_state(job, "error", error=f"{type(e).__name__}: {e}")
+            print(f"❌ 任务 {job.id} 失败: {job.error}")
+        finally:
+            job.done.set()
+            self._evict()
+
+    # -- WebSocket ------------------------------------------------------------
+
+    def _broadcast(self, message, droppable=False, clients=None):
+        frame = encode_frame(json.dumps(_jsonable(message), ensure_ascii=False))
+        for client in list(clients or self._clients):
+            client.send(frame, droppable)
+
+    def _send_ir(self, job, clients=None):
+        """IR header as JSON, then the samples as one binary frame."""
+        self._broadcast({"type": "ir", "job": job.id, "fs": job.cfg.fs, "frames": len(job.ir),
+                         "dtype": "float32"}, clients=clients)
+        frame = encode_frame(job.ir.tobytes(), OP_BINARY)
+        for client in list(clients or self._clients):
+            client.send(frame)
+
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            return self._respond(writer, 400, {"error": "missing Sec-WebSocket-Key"})
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        client = _Client(writer)
+        self._clients.add(client)
+        pump = asyncio.ensure_future(client.pump())
+        # a late subscriber gets the state of every job, and finished IRs from the cache
+        for job in self.jobs.values():
+            self._broadcast(job.describe(), clients=[client])
+            if job.ir is not None:
+                self._send_ir(job, clients=[client])
+        try:
+            while not client.closed:
+                opcode, data = await read_frame(reader)
+                if opcode == OP_CLOSE:
+                    break
+                if opcode == OP_PING:
+                    client.send(encode_frame(data, OP_PONG))
+                elif opcode == OP_TEXT:
+                    self._on_message(client, data)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._clients.discard(client)
+            client.closed = True
+            pump.cancel()
+            try:
+                writer.write(encode_frame(struct.pack("!H", 1000), OP_CLOSE))
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    def _on_message(self, client, data):
+        try:
+            message = json.loads(data)
+            if message.get("type") != "measure":
+                raise ValueError(f"未知的消息类型: {message.get('type')!r}")
+            job, shared = self.submit(message.get("overrides"), message.get("fresh", True))
+            self._broadcast(dict(job.describe(), shared=shared), clients=[client])
+            if shared and job.ir is not None:
+                self._send_ir(job, clients=[client])
+        except (ValueError, KeyError, TypeError) as e:
+            self._broadcast({"type": "error", "error": f"{type(e).__name__}: {e}"}, clients=[client])
+
+    # -- HTTP -----------------------------------------------------------------
+
+    def _respond(self, writer, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(_jsonable(body), ensure_ascii=False).encode("utf-8")
+        lines = [f"HTTP/1.1 {status} {_STATUS.get(status, '')}", f"Content-Type: {content_type}",
+                 f"Content-Length: {len(body)}", "Connection: close"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+
+    def _trusted(self, headers):
+        """Same-origin check against DNS rebinding and cross-site pages.
+
+        The Host header must name this machine by IP address, as localhost or
+        as the listening address; a browser's Origin, when sent, must match it.
+        """
+        host = headers.get("host", "").lower()
+        name = urlsplit("//" + host).hostname or ""
+        if not (name in ("localhost", self.host.lower()) or _is_ip(name)):
+            return False
+        origin = headers.get("origin")
+        return origin is None or urlsplit(origin.lower()).netloc == host
+
+    def _devices(self):
+        if self.simulate:
+            return [{"id": 0, "name": "simulated", "inputs": self.cfg.input_channels, "outputs": 1,
+                     "samplerate": self.cfg.fs, "default_input": True, "default_output": True}]
+        from core.device import list_devices
+        return list_devices()
+
+    async def _route(self, method, path, body, headers=None):
+        """(status, body[, content type, headers]) for an API request."""
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if method == "GET" and parts in ([], ["index.html"]):
+            try:
+                with open(os.path.join(self.web_dir, "index.html"), "rb") as fh:
+                    return 200, fh.read(), _TYPES[".html"]
+            except FileNotFoundError:
+                return 404, {"error": "web/index.html not found"}
+        if parts[:1] != ["api"]:
+            return 404, {"error": f"not found: {path}"}
+        route = parts[1:]
+        if route == ["devices"] and method == "GET":
+            return 200, await asyncio.get_running_loop().run_in_executor(self._audio, self._devices)
+        if route == ["config"] and method == "GET":
+            return 200, {"config": {k: self.cfg.get(k) for k in self.cfg.keys()}, "config_hash": self.cfg.digest()}
+        if route == ["measure"]:
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            content_type = (headers or {}).get("content-type", "").split(";")[0].strip().lower()
+            if content_type != "application/json":
+                return 415, {"error": "Content-Type must be application/json"}
+            try:
+                request = json.loads(body or b"{}")
+                job, shared = self.submit(request.get("overrides"), request.get("fresh", True))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                return 400, {"error": f"{type(e).__name__}: {e}"}
+            return (200 if job.done.is_set() else 202), dict(job.describe(), shared=shared)
+        if route == ["jobs"] and method == "GET":
+            return 200, [job.describe(result=False) for job in self.jobs.values()]
+        if len(route) in (2, 3) and route[0] == "jobs" and method == "GET":
+            job = self.jobs.get(route[1])
+            if job is None:
+                return 404, {"error": f"no job {route[1]}"}
+            if len(route) == 2:
+                return 200, job.describe()
+            if route[2] == "ir":
+                if job.ir is None and job.state == "done":
+                    return 410, {"error": f"IR of job {job.id} is no longer held (see the archive)"}
+                if job.ir is None:
+                    return 404, {"error": f"job {job.id} has no IR yet ({job.state})"}
+                return 200, job.ir.tobytes(), "application/octet-stream", {"X-Sample-Rate": job.cfg.fs}
+        return 404, {"error": f"not found: {method} {path}"}
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            method, path, _ = request.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if not self._trusted(headers):
+                self._respond(writer, 403, {"error": "cross-origin request refused"})
+                await writer.drain()
+                return
+            if headers.get("upgrade", "").lower() == "websocket":
+                return await self._websocket(reader, writer, headers)
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY:
+                self._respond(writer, 413, {"error": "request body too large"})
+            else:
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    self._respond(writer, *await self._route(method.upper(), path, body, headers))
+                except Exception as e:
+                    self._respond(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+            await writer.drain()
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # -- lifecycle ------------------------------------------------------------
+
+    async def start(self):
+        """Open the pools and the listening socket; returns the bound port."""
+        self._loop = asyncio.get_running_loop()
+        if not self.simulate:
+            # calibrated latency / chain response of the devices, shared by every job
+            from core.device import use_devices
+            self.cfg = use_devices(self.cfg)
+        self._audio = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio")
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+        clients = list(self._clients)
+        for client in clients:
+            client.send(encode_frame(struct.pack("!H", 1001), OP_CLOSE))
+        await asyncio.gather(*(client.flush() for client in clients))
+        if self._server is not None:
+            await self._server.wait_closed()
+        pending = [job.done.wait() for job in self.jobs.values()]
+        if pending:
+            await asyncio.gather(*pending)
+        self._audio.shutdown()
+        self._pool.shutdown()
+
+    async def serve_forever(self):
+        import signal
+
+        await self.start()
+        stop = asyncio.Event()
+        if os.name == "posix":
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                self._loop.add_signal_handler(sig, stop.set)
+        print(f"🌐 测量服务已启动: http://{self.host}:{self.port}/"
+              f" ({'模拟音频' if self.simulate else '声卡'}, {self.workers} 个分析进程)")
+        try:
+            await stop.wait()
+        finally:
+            await self.close()
+        print(f"🛑 测量服务已停止: {len(self.jobs)} 个任务")
@@ -0,0 +1,316 @@
+"""
+多位置测量会话 - 依次测量 config/room.yaml 中的每个麦克风位置
+
+    python run.py session --room A            每个位置前按回车确认
+    python run.py session --room A --auto     自动依次测量 (可用 --pause 留出移动话筒的时间)
+
+每个位置的结果单独保存 (data/sessions/<会话>/<位置>/ 下的 ir.scir、图表和报告，
+并写入测量档案)，同时用 Welford 算法增量更新各倍频程 T30/C50 的空间平均值和标准差，最后一个位置测完即可得到汇总。
+
+录音与处理是流水线式的：主线程录制下一个位置时，进程池在处理上一个位置
+(同步、去卷积、指标、图表、分离导出、报告)。未处理完的录音最多
+workers + queue_size 个，处理跟不上时录音会等待 (背压)。--workers 0 为顺序执行。
+"""
+
+import datetime
+import json
+import math
+import os
+import threading
+import time
+
+from utils.config import get_config
+
+
+class RunningStats:
+    """Welford's online mean and variance; NaN values are ignored."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value):
+        if value is None or math.isnan(value):
+            return
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """Sample variance (ddof=1); nan below two values."""
+        return self._m2 / (self.n - 1) if self.n > 1 else float("nan")
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.n > 1 else float("nan")
+
+
+class SpatialAverage:
+    """Running mean/std of every (metric, band) across measurement positions."""
+
+    def __init__(self):
+        self.stats = {}
+        self.positions = 0
+
+    def add(self, metrics):
+        """Add one position's {(name, band): value} metrics."""
+        self.positions += 1
+        for key, value in metrics.items():
+            self.stats.setdefault(key, RunningStats()).update(value)
+
+    def summary(self):
+        """{(name, band): {"mean", "std", "n"}}, bands in ascending order."""
+        return {key: {"mean": s.mean if s.n else float("nan"), "std": s.std, "n": s.n}
+                for key, s in sorted(self.stats.items(), key=lambda kv: (kv[0][0], kv[0][1]))}
+
+
+def configured_positions(cfg=None):
+    """Microphone positions from room.yaml as [(label, [x, y, z]), ...], labels "1", "2", ..."""
+    cfg = cfg or get_config()
+    positions = cfg.section("microphones").get("positions") or []
+    return [(str(i + 1), list(p)) for i, p in enumerate(positions)]
+
+
+def _fmt(value, spec):
+    return "  N/A " if value is None or math.isnan(value) else f"{value:{spec}}"
+
+
+def format_summary(summary):
+    """Table of spatially averaged T30/C50 per band and broadband STI (mean ± std, n)."""
+    bands = sorted({band for _, band in summary})
+    lines = [f"{'频带':>8}  {'T30 (s)':>18}  {'C50 (dB)':>18}  {'n':>3}"]
+    for band in bands:
+        t30, c50 = summary.get(("T30", band)), summary.get(("C50", band))
+        label = f"{band:g} Hz" if band else "宽带"
+        cells = []
+        for s, spec in ((t30, ".3f"), (c50, ".2f")):
+            cells.append(f"{_fmt(s['mean'], spec)} ± {_fmt(s['std'], spec)}" if s else "")
+        n = max(s["n"] for s in (t30, c50) if s)
+        lines.append(f"{label:>8}  {cells[0]:>18}  {cells[1]:>18}  {n:>3}")
+    s = summary.get(("STI", 0))
+    if s:
+        lines.append(f"{'STI':>8}  {_fmt(s['mean'], '.2f')} ± {_fmt(s['std'], '.2f')}  (n={s['n']})")
+    return "\n".join(lines)
+
+
+def process_position(rec, cfg, archive=None, outdir=None):
+    """Worker entry point: analysis of one position, plus plot/exports/report into outdir."""
+    import contextlib
+    import io
+
+    from core.analysis import analyze_take
+
+    take = analyze_take(rec, cfg, archive, return_ir=True)
+    ir = take.pop("ir")
+    if outdir:
+        from core.reflections import reflections
+        from core.separate import export_ir_comparison, separate_ir_components
+        from utils.plot import plot_ir
+        from utils.report import generate_report
+
+        from utils.irfile import write_ir
+
+        start = time.perf_counter()
+        os.makedirs(outdir, exist_ok=True)
+        path = write_ir(os.path.join(outdir, "ir.scir"), ir, cfg.fs, config_hash=cfg.digest())
+        with contextlib.redirect_stdout(io.StringIO()):
+            plot = os.path.join(outdir, "ir.png")
+            plot_ir(ir, cfg.fs, reflections(ir, cfg), path=plot, cfg=cfg)
+            files = separate_ir_components(ir, output_dir=outdir, cfg=cfg)
+            files["ir"] = path
+            files["comparison"] = export_ir_comparison(ir, os.path.join(outdir, "comparison.wav"), cfg=cfg)
+            files["plot"] = plot
+            files["report"] = os.path.join(outdir, "report.pdf")
+            generate_report(take["rt60"], take["c50"], img=plot, out=files["report"], sti=take["sti"])
+        take["files"] = files
+        take["seconds"] += time.perf_counter() - start
+    return take
+
+
+class Session:
+    """Walk through the configured microphone positions and average the results.
+
+    Args:
+        auto: move on to the next position without asking
+        pause: seconds to wait before each position in auto mode
+        archive: measurement archive directory (None: do not archive)
+        only: position labels to measure (default: all)
+        workers: processes analysing earlier positions while the next one is
+            recorded (0: record and process strictly in turn)
+        queue_size: recordings allowed to wait for a free worker
+        exports: write plot, separated components and report per position
+        input_func: prompt function (input() by default; replaced in tests)
+    """
+
+    def __init__(self, cfg=None, room=None, archive="data/archive", auto=False, pause=0.0,
+                 simulate=False, only=None, workers=None, queue_size=1, exports=True, input_func=input):
+        self.cfg = cfg or get_config()
+        self.room = room
+        self.archive = archive
+        self.auto = auto
+        self.pause = pause
+        self.simulate = simulate
+        self.positions = [p for p in configured_positions(self.cfg) if not only or p[0] in only]
+        self.input = input_func
+        self.workers = min(4, os.cpu_count() or 1) if workers is None else workers
+        self.queue_size = queue_size
+        self.exports = exports
+        self.average = SpatialAverage()
+        self.results = []
+        self.errors = []
+        self.audio_seconds = 0.0
+        self.wall_seconds = None
+        self.session_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self._lock = threading.Lock()
+
+    def _ready(self, label, coords):
+        """Wait until the microphone is at the position; False to skip it, None to stop."""
+        where = f"位置 {label} {tuple(coords)}"
+        if self.auto:
+            if self.pause > 0:
+                print(f"⏳ {self.pause:.0f} 秒后测量{where}")
+                time.sleep(self.pause)
+            return True
+        answer = self.input(f"🎤 将麦克风放到{where}，回车开始 (s=跳过, q=结束): ").strip().lower()
+        if answer == "q":
+            return None
+        return answer != "s"
+
+    def _outdir(self, label):
+        return os.path.join("data/sessions", self.session_id, label) if self.exports else None
+
+    def _add(self, label, coords, take):
+        """Record one position's result and update the running spatial average.
+
+        The position's catalog row is written right away: its arrays are
+        already in the archive, and an interrupted session must not leave
+        them without a row.
+        """
+        with self._lock:
+            if self.archive:
+                from utils.store import MeasurementStore
+
+                with MeasurementStore(self.archive) as store:
+                    store.add_measurement(room=self.room, position=label, cfg=self.cfg,
+                                          metrics=take["metrics"], source=f"session:{self.session_id}",
+                                          kind="session", measurement_id=take["measurement_id"])
+            self.average.add(take["metrics"])
+            self.results.append({"position": label, "coords": coords, **take})
+            self.results.sort(key=lambda r: [p[0] for p in self.positions].index(r["position"]))
+            print(f"📊 位置 {label}: T30={_fmt(take['rt60'], '.3f')}s C50={_fmt(take['c50'], '.2f')}dB"
+                  f"  | 空间平均 ({self.average.positions} 个位置): "
+                  f"T30={_fmt(self.average.stats[('T30', 0)].mean, '.3f')}s")
+            for _, message in take["quality"]["warnings"]:
+                print(f"⚠️ 位置 {label} 测量质量: {message}")
+
+    def _collect(self, label, coords, future, slots):
+        """Done-callback of a pooled position: merge the result, free its slot."""
+        try:
+            self._add(label, coords, future.result())
+        except Exception as e:
+            self.errors.append((label, f"{type(e).__name__}: {e}"))
+            print(f"❌ 位置 {label} 处理失败: {type(e).__name__}: {e}")
+        finally:
+            slots.release()
+
+    def _archive(self, summary):
+        from utils.store import MeasurementStore
+
+        with MeasurementStore(self.archive) as store:
+            store.add_measurement(room=self.room, position="mean", cfg=self.cfg,
+                                  metrics={k: v["mean"] for k, v in summary.items()},
+                                  source=f"session:{self.session_id}", kind="spatial_mean")
+
+    def run(self):
+        """Measure every position in turn; returns the spatial summary."""
+        from core.analysis import _sweep_for
+
+        if not self.positions:
+            raise ValueError("config/room.yaml 中没有配置麦克风位置 (microphones.positions)")
+        if not self.simulate:
+            from core.device import use_devices
+            self.cfg = use_devices(self.cfg)
+        sweep, _ = _sweep_for(self.cfg)
+
+        print(f"🗺️ 多位置测量: {len(self.positions)} 个位置"
+              f" ({'流水线, ' + str(self.workers) + ' 个处理进程' if self.workers else '顺序执行'})")
+        start = time.perf_counter()
+        if self.workers:
+            self._run_pipelined(sweep)
+        else:
+            for label, coords, rec in self._takes(sweep):
+                self._add(label, coords, process_position(rec, self.cfg, self.archive, self._outdir(label)))
+        self.wall_seconds = time.perf_counter() - start
+        return self.finish()
+
+    def _takes(self, sweep):
+        """Yield (label, coords, recording) for each position the user confirms."""
+        from core.record import record_take
+
+        for label, coords in self.positions:
+            ready = self._ready(label, coords)
+            if ready is None:
+                break
+            if not ready:
+                continue
+            t0 = time.perf_counter()
+            rec = record_take(sweep, self.cfg, self.simulate)
+            self.audio_seconds += time.perf_counter() - t0
+            yield label, coords, rec
+
+    def _run_pipelined(self, sweep):
+        """Record in this thread while a process pool works on earlier positions.
+
+        A semaphore bounds the recordings in flight (being processed or
+        queued), so the audio side blocks instead of piling up recordings
+        in memory when processing is slower than capture.
+        """
+        from concurrent.futures import ProcessPoolExecutor, wait
+
+        slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        futures = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for label, coords, rec in self._takes(sweep):
+                slots.acquire()
+                future = pool.submit(process_position, rec, self.cfg, self.archive, self._outdir(label))
+                future.add_done_callback(lambda f, l=label, c=coords: self._collect(l, c, f, slots))
+                futures.append(future)
+                del rec
+            wait(futures)
+
+    def finish(self):
+        summary = self.average.summary()
+        if self.archive and self.results:
+            self._archive(summary)
+        print("\n" + "=" * 60)
+        print(f"🗺️ 空间平均 ({self.average.positions} 个位置)")
+        if self.wall_seconds:
+            print(f"⏱️ 总用时 {self.wall_seconds:.1f}秒，其中录音 {self.audio_seconds:.1f}秒")
+        print("=" * 60)
+        print(format_summary(summary))
+        return summary
+
+    def save(self, path=None):
+        """Write per-position results and the spatial summary as JSON."""
+        path = path or os.path.join("data/sessions", f"{self.session_id}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        def band_key(name, band):
+            return name if not band else f"{name}@{band:g}"
+
+        data = {
+            "session": self.session_id,
+            "room": self.room,
+            "config_hash": self.cfg.digest(),
+            "positions": [{"position": r["position"], "coords": r["coords"],
+                           "measurement_id": r["measurement_id"],
+                           "metrics": {band_key(*k): v for k, v in r["metrics"].items()}}
+                          for r in self.results],
+            "spatial": {band_key(*k): v for k, v in self.average.summary().items()},
+        }
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False, indent=2)
+        return path
@@ -0,0 +1,121 @@
+"""
+模拟音频后端 - 不需要声卡也能跑完整测量流程
+
+用合成房间IR (指数衰减噪声 + 直达声) 卷积扫频信号并叠加背景噪声，
+返回值与 play_and_record() 相同，可用于守护进程演示、测试和基准测试。
+
+    python run.py daemon --simulate --interval 60
+"""
+
+import numpy as np
+
+from utils.config import get_config
+
+
+PEAK_DBFS = -6.0  # level the room signal is set to when no gain is given, like a recording engineer would
+
+
+def synthetic_ir(fs, rt60=0.6, length=1.5, seed=0):
+    """Exponentially decaying noise with a direct-sound spike."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(length * fs)) / fs
+    ir = rng.standard_normal(len(t)) * np.exp(-6.9 * t / rt60) * 0.1
+    ir[:int(0.004 * fs)] = 0  # nothing arrives before the direct sound, then a short gap
+    ir[int(0.002 * fs)] = 1.0
+    return ir
+
+
+def simulate_recording(sig, cfg=None, rt60=0.6, delay=0.05, noise_db=-80.0, gain=None, room_seed=0, seed=None,
+                       drift_ppm=0.0, loopback=None):
+    """Stand-in for play_and_record(): the sweep as heard through a synthetic room.
+
+    Args:
+        sig: played sweep (as returned by generate_sweep), or (frames, speakers)
+            for several loudspeakers; each speaker gets its own room response
+        rt60: reverberation time of the simulated room, seconds
+        delay: playback/capture latency in seconds
+        noise_db: background noise RMS relative to full scale
+        gain: level of the direct sound at the microphone; None scales the
+            room signal so its peak sits at PEAK_DBFS (no clipping for any rt60)
+        room_seed: seed of the room response (the same room for every take)
+        seed: seed of the background noise (None: different on every take)
+        drift_ppm: clock drift of the capture device against the playback
+            device (positive: the recording has more samples)
+        loopback: input channel wired straight to the output (the played
+            signal, delayed, without the room); cfg.input_channels must include it
+
+    Returns:
+        recording in cfg.dtype, (frames,) or (frames, cfg.input_channels)
+    """
+    import scipy.signal as sps
+
+    cfg = cfg or get_config()
+    fs = cfg.fs
+    rng = np.random.default_rng(seed)
+    frames = int(delay * fs) + len(sig) + int(cfg.record_tail * fs)
+    channels = cfg.input_channels
+    noise = np.empty((frames, channels), dtype=cfg.dtype)
+    wet = np.zeros((frames, channels))
+    speakers = sig.reshape(len(sig), -1)
+    offset = int(delay * fs)
+    for ch in range(channels):
+        noise[:, ch] = rng.standard_normal(frames) * 10 ** (noise_db / 20)
+        if ch == loopback:
+            y = speakers.sum(axis=1)[:frames - offset]
+            wet[offset:offset + len(y), ch] = y
+            continue
+        for k in range(speakers.shape[1]):
+            h = synthetic_ir(fs, rt60=rt60, length=max(0.5, 1.5 * rt60), seed=room_seed + ch + 1000 * k)
+            y = sps.oaconvolve(speakers[:, k], h)[:frames - offset]
+            wet[offset:offset + len(y), ch] += y
+    room = [ch for ch in range(channels) if ch != loopback]
+    if gain is None:
+        peak = np.max(np.abs(wet[:, room])) if room else 0.0
+        gain = 10 ** (PEAK_DBFS / 20) / peak if peak > 0 else 1.0
+    wet[:, room] *= gain
+    rec = noise
+    rec += wet
+    del wet
+    if drift_ppm:
+        # band-limited (FFT) resampling onto the faster or slower capture clock
+        pad = np.zeros((frames // 2, channels), dtype=rec.dtype)
+        x = np.concatenate([rec, pad])
+        rec = sps.resample(x, int(round(len(x) * (1 + drift_ppm * 1e-6))), axis=0)[:frames].astype(cfg.dtype)
+    return rec[:, 0] if channels == 1 else rec
+
+
+def simulate_impulses(cfg=None, times=(0.5, 1.8, 3.1), duration=None, rt60=0.6, levels=None, noise_db=-70.0,
+                      room_seed=0, seed=None):
+    """Stand-in for a continuous capture of impulsive excitations (claps, balloons, a starter pistol).
+
+    Each event is a short random click (about 0.3 ms, a different one per
+    event) heard through the same synthetic room.
+
+    Args:
+        times: event times in seconds
+        duration: length of the capture (default: last event + 1.5 * rt60 + 0.5 s)
+        levels: peak level of each event's click (default 0.5 each); values
+            that drive the room response past full scale are clipped as a
+            recorder would
+        noise_db: background noise RMS relative to full scale
+
+    Returns:
+        (frames,) capture in cfg.dtype
+    """
+    import scipy.signal as sps
+
+    cfg = cfg or get_config()
+    fs = cfg.fs
+    rng = np.random.default_rng(seed)
+    duration = duration if duration is not None else max(times, default=0.0) + 1.5 * rt60 + 0.5
+    out = rng.standard_normal(int(duration * fs)) * 10 ** (noise_db / 20)
+    h = synthetic_ir(fs, rt60=rt60, length=max(0.5, 1.5 * rt60), seed=room_seed)
+    n = max(2, int(0.0003 * fs))
+    for k, t in enumerate(times):
+        click = rng.standard_normal(n) * np.hanning(n)
+        click *= (levels[k] if levels is not None else 0.5) / np.max(np.abs(click))
+        y = sps.oaconvolve(click, h)
+        a = int(t * fs)
+        y = y[:max(0, len(out) - a)]
+        out[a:a + len(y)] += y
+    return np.clip(out, -1.0, 1.0).astype(cfg.dtype)
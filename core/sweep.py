@@ -2,35 +2,56 @@
 import os
 
 import numpy as np
-import soundfile as sf
 
-from utils.config import load_config
+from utils.config import get_config
+from utils.trace import traced
 
 
-cfg = load_config()
-FS = int(float(cfg.get("fs", 48000)))
-SWEEP_DURATION = float(cfg.get("sweep_duration", 8.0))
-SILENCE_PRE = float(cfg.get("silence_pre", 0.0))
-SILENCE_POST = float(cfg.get("silence_post", 0.0))
-FREQ_MIN = float(cfg.get("sweep_freq_min", 20.0))
-FREQ_MAX = float(cfg.get("sweep_freq_max", 20000.0))
+# Samples computed per chunk; the phase is always evaluated in float64
+_CHUNK = 1 << 20
 
 
-def generate_sweep():
-    """Generate exponential sweep signal and inverse filter for IR extraction."""
-    t=np.arange(0, SWEEP_DURATION, 1/FS)
-    f1,f2=FREQ_MIN,FREQ_MAX
-    sweep=np.sin(2*np.pi*f1*(SWEEP_DURATION/np.log(f2/f1))*(np.exp(t*np.log(f2/f1)/SWEEP_DURATION)-1))
-    w=2*np.pi*f1*np.exp(t*(np.log(f2/f1)/SWEEP_DURATION))
-    inv=sweep[::-1]*w
+@traced()
+def generate_sweep(cfg=None, save=True):
+    """Generate exponential sweep signal and inverse filter for IR extraction.
+
+    Both are returned in cfg.dtype. The sweep is computed in float64 chunks
+    and written straight into the output buffer, so a float32 run never
+    holds a full-length float64 copy.
+
+    With save=False the sweep and inverse filter are not written to data/raw.
+    """
+    from utils.memory import empty, work_dtype
+
+    cfg = cfg or get_config()
+    FS, T = cfg.fs, cfg.sweep_duration
+    dtype = work_dtype(cfg)
+    step = 1/FS
+    n = int(np.ceil(T/step))  # == len(np.arange(0, T, 1/FS))
+    f1,f2=cfg.sweep_freq_min,cfg.sweep_freq_max
+    k = np.log(f2/f1)/T
+
+    pre, post = int(cfg.silence_pre*FS), int(cfg.silence_post*FS)
+    sig = empty(pre+n+post, dtype, cfg, name="sweep")
+    sig[:pre] = 0
+    sig[pre+n:] = 0
+    sweep = sig[pre:pre+n]
+    inv = empty(n, dtype, cfg, name="inv")
+    for a in range(0, n, _CHUNK):
+        t = np.arange(a, min(a+_CHUNK, n))*step
+        sweep[a:a+len(t)] = np.sin(2*np.pi*f1*(T/np.log(f2/f1))*(np.exp(t*np.log(f2/f1)/T)-1))
+    for a in range(0, n, _CHUNK):
+        b = min(a+_CHUNK, n)
+        # the reversed sweep runs from f2 down to f1; its amplitude has to
+        # fall by 6 dB/octave as the frequency falls to undo the sweep's
+        # pink spectrum, so the envelope decays with time
+        w = np.exp(-np.arange(a, b)*step*k)
+        inv[a:b] = sweep[n-b:n-a][::-1]*w
     inv_max=np.max(np.abs(inv))
     if inv_max>0:
         inv/=inv_max
-    sig=np.concatenate([
-        np.zeros(int(SILENCE_PRE*FS)),
-        sweep,
-        np.zeros(int(SILENCE_POST*FS)),
-    ])
-    os.makedirs("data/raw",exist_ok=True)
-    sf.write("data/raw/sweep.wav",sig,FS); np.save("data/raw/inv.npy",inv)
+    if save:
+        import soundfile as sf
+        os.makedirs("data/raw",exist_ok=True)
+        sf.write("data/raw/sweep.wav",sig,FS); np.save("data/raw/inv.npy",inv)
     return sig,inv
@@ -1,12 +1,82 @@
 
-import numpy as np, scipy.signal as sig
+import numpy as np
+
+from utils.trace import traced
+
+# calibrated latency search window (core.device profiles): before / after the latency, seconds
+SYNC_MARGIN = 0.005
+SYNC_WINDOW = 0.1   # acoustic path of up to ~34 m
+SYNC_OCTAVES = 2.0  # top of the sweep correlated within the window
+SYNC_PROMINENCE = 8.0  # correlation peak / rms within the window; below it the window missed
+
+
+def sync_window(cfg):
+    """(first, last, segment) search window implied by cfg.sync_latency, or None when it is unknown.
+
+    first/last bound the recording position of the played signal's first
+    sample; segment is the number of samples at the end of the sweep (its
+    top SYNC_OCTAVES) that are correlated within that range.
+    """
+    if cfg.sync_latency < 0:
+        return None
+    import math
+
+    octaves = math.log2(cfg.sweep_freq_max / cfg.sweep_freq_min)
+    segment = int(cfg.sweep_duration * min(1.0, SYNC_OCTAVES / octaves) * cfg.fs) if octaves > 0 else 0
+    return (max(0, int((cfg.sync_latency - SYNC_MARGIN) * cfg.fs)),
+            int((cfg.sync_latency + SYNC_WINDOW) * cfg.fs), segment)
+
+
+def _windowed_start(ref, sweep, window):
+    """Sweep start searched only within window (see sync_window()), using the end of the sweep.
+
+    Returns None when the peak lies on the edge of the window or does not
+    stand out of the correlation by SYNC_PROMINENCE (the latency changed
+    since the calibration), so the caller falls back to a full search.
+    """
+    import scipy.signal as sig
+
+    lo, hi, segment = window
+    loud = np.flatnonzero(sweep)
+    if not len(loud) or segment <= 0:
+        return None
+    end = int(loud[-1]) + 1
+    a = max(0, end - segment)
+    seg = ref[lo + a:min(len(ref), hi + end)]
+    if len(seg) < end - a + 2:
+        return None
+    xc = sig.correlate(seg, sweep[a:end].astype(ref.dtype, copy=False), mode='valid', method='fft')
+    peak = int(np.argmax(xc))
+    if peak == 0 or peak == len(xc) - 1 or xc[peak] < SYNC_PROMINENCE * np.sqrt(np.mean(np.square(xc))):
+        return None
+    return lo + peak
+
+
+@traced()
+def sync_and_trim(rec, sweep, window=None):
+    """Synchronize recording with sweep signal using cross-correlation.
+
+    Multichannel recordings (frames, channels) are aligned on channel 0 and
+    trimmed as a whole. The result is a view of rec, not a copy.
+
+    window: sync_window() of a calibrated device latency; only that range
+    of start samples is searched, with the top of the sweep, instead of a
+    full-length correlation.
+    """
+    import scipy.signal as sig
 
-def sync_and_trim(rec, sweep):
-    """Synchronize recording with sweep signal using cross-correlation."""
     if len(rec) < len(sweep):
         raise ValueError(f"录音长度 ({len(rec)}) 短于扫频信号 ({len(sweep)})")
 
-    xc=sig.correlate(rec, sweep, mode='full')
+    ref = rec if rec.ndim == 1 else rec[:, 0]
+    start = _windowed_start(ref, sweep, window) if window is not None else None
+    if start is not None:
+        result = rec[start:]
+        print(f"✅ 同步完成，起始点: {start} (按设备延迟在 {window[0]}-{window[1]} 内搜索)")
+        return result
+    if window is not None:
+        print("⚠️ 设备延迟与校准不符，改用完整互相关同步")
+    xc=sig.correlate(ref, sweep.astype(ref.dtype, copy=False), mode='full')
     peak=np.argmax(xc)
     start = peak - (len(sweep)-1)
 
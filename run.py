@@ -2,89 +2,826 @@
 """
 SoundCheck - 室内声学测量系统
 自动扫频测量 + IR提取 + RT60/C50计算
+
+子命令:
+    measure              完整测量流程（默认），各阶段结果按内容哈希缓存在 data/cache
+    analyze FILE...      离线分析IR或录音文件，只加载 numpy/scipy
+    check [FILE]         评估测量质量 (INR、峰值噪声比、起点前能量、削波、谐波、时变性)，默认检查最近一次的IR
+    plot FILE            绘制IR波形和ETC曲线
+    report FILE          分析IR并生成PDF报告
+    batch GLOB...        用进程池批量分析大量文件，结果汇总为CSV
+    query METRIC         查询测量档案，例如 query T30 --band 500 --room A --days 90
+    noise                测量背景噪声，按目标 INR 建议扫频/尾部长度 (measure/quick --adaptive 自动使用)
+    calibrate            校准设备组合的延迟、电平和 (回环通道) 测量链频响；之后的测量不再询问设备，
+                         只在延迟附近同步，并从IR中除去测量链频响
+    quick                快速检查：短扫频，只算所选指标，不写任何文件
+    eq IR...             由一个或多个IR (空间平均) 自动设计房间均衡 (峰值滤波器组或FIR)，导出 DSP 系数
+    auralize FILE        用测得的IR (或其直达声/早反射/混响部分) 渲染或实时播放一段干声
+    mess                 多扫频法：一次录音测量多个扬声器 (各扬声器扫频错开 Δ 重叠播放)
+    scan FILE            从独立录音机录下的长录音中流式检测每一次扫频 (抽取后的匹配滤波)，逐个提取IR写入档案
+    repeat               重复测量：逐次与平均IR比较各倍频程相干性和衰减曲线，剔除被干扰的测量后平均
+    impulse              脉冲声源测量 (拍手/气球/发令枪)：连续录音中检测脉冲，对齐平均后直接计算指标
+    session              多位置测量会话：依次测量 room.yaml 中的麦克风位置并做空间平均
+    daemon               无人值守监测：按计划/触发自动测量，写入档案并发出漂移警报
+    serve                本地测量服务：HTTP/WebSocket API，向 web/ 查看器推送进度、电平和结果
+
+各子命令只在需要时导入 sounddevice / matplotlib / reportlab，
+因此在无声卡、无显示的服务器上也能快速启动。
 """
 
-from core.device import choose_device
-from core.sweep import generate_sweep
-from core.record import play_and_record
-from core.sync import sync_and_trim
-from core.ir import extract_ir
-from core.metrics import RT60, C50
-from core.reflections import reflections
-from core.separate import separate_ir_components, export_ir_comparison
-from utils.plot import plot_ir
-from utils.report import generate_report
-from utils.config import load_config
-
-def main():
+import argparse
+import json
+import math
+import os
+import sys
+
+from utils.config import build_config, parse_overrides
+
+
+def _fmt(value, spec, unit=""):
+    return "N/A" if value is None or math.isnan(value) else f"{value:{spec}}{unit}"
+
+
+def cmd_measure(args, cfg):
+    from core.metrics import sti_rating
+    from core.pipeline import Pipeline, measurement_stages
+    from core.quality import format_quality
+
+    from utils.memory import check_budget
+
+    # Step 1: Choose audio device
+    print("\n[1/9] 选择音频设备...")
+    if args.recording:
+        print(f"   使用已有录音: {args.recording}")
+    else:
+        from core.device import use_devices
+        cfg = use_devices(cfg, interactive=True)
+        if args.adaptive:
+            cfg = _adaptive(cfg, args)
+
+    fs = cfg.fs
+    pipe = Pipeline(measurement_stages(), cfg)
+    check_budget(cfg)
+
+    # Step 2: Generate sweep signal
+    print("\n[2/9] 生成扫频信号...")
+    sig, inv = pipe.run(["sweep"])["sweep"]
+    print(f"✅ 扫频信号生成完成 ({len(sig)/fs:.1f}秒)")
+
+    # Step 3: Play and record
+    print("\n[3/9] 播放并录制...")
+    if args.recording:
+        rec = _load_recording(args.recording, fs, cfg.dtype)
+    else:
+        from core.record import play_and_record
+        rec = play_and_record(sig, cfg)
+    pipe.run(["sweep"], sources={"rec": rec})
+    print(f"   录音缓存: {pipe.cache.dir('rec', pipe.key('rec'))}")
+    del rec  # 之后按需从缓存 (memmap) 读取
+
+    # Step 4: Synchronize and trim
+    print("\n[4/9] 同步和裁剪录音...")
+    pipe.run(["sync"])
+
+    # Step 5: Extract impulse response
+    print("\n[5/9] 提取脉冲响应 (IR)...")
+    pipe.run(["ir"])
+    pipe.release("rec", "sync", "ir")
+    from utils.irfile import record_latest_ir
+    record_latest_ir(os.path.join(pipe.workdir("ir"), "ir.scir"))  # check/auralize 的默认IR
+
+    # Step 6: Calculate acoustic metrics
+    print("\n[6/9] 计算声学指标...")
+    out = pipe.run(["metrics", "bands", "quality"])
+    metrics, bands, quality = out["metrics"], out["bands"], out["quality"]
+    rt, c = metrics["rt60"], metrics["c50"]
+    print(f"   RT60: {_fmt(rt, '.3f', ' 秒')}")
+    print(f"   C50: {_fmt(c, '.2f', ' dB')}")
+    print(f"   STI: {_fmt(metrics['sti'], '.2f')} ({sti_rating(metrics['sti'])})")
+    for band, values in bands.items():
+        print(f"   {band:>5} Hz: T30={_fmt(values['T30'], '.3f', 's')}, C50={_fmt(values['C50'], '.2f', ' dB')}")
+    print(f"   测量质量 ({quality['seconds'] * 1000:.1f} ms):")
+    print(format_quality(quality))
+
+    # Step 7: Detect reflections and plot
+    print("\n[7/9] 检测反射并绘制图表...")
+    out = pipe.run(["reflections", "plot_ir"])
+    ref, plot_path = out["reflections"], out["plot_ir"]
+
+    # Step 8: Separate IR components
+    print("\n[8/9] 分离IR成分并导出WAV文件...")
+    separated_paths = pipe.run(["separate"])["separate"]
+
+    # Step 9: Generate report
+    print("\n[9/9] 生成PDF报告...")
+    report_path = pipe.run(["report"])["report"]
+    print("✅ PDF报告生成完成")
+
+    archive_id = None
+    if not args.no_archive:
+        from utils.store import MeasurementStore, flatten_metrics
+        with MeasurementStore(args.archive) as store:
+            archive_id = store.add_measurement(
+                room=args.room, position=args.position, cfg=cfg,
+                metrics=flatten_metrics(metrics, bands),
+                arrays={"ir": pipe.run(["ir"])["ir"], "rec": pipe.cache.load("rec", pipe.key("rec"))},
+                source=args.recording,
+            )
+
+    # Summary
+    print("\n" + "=" * 60)
+    print("✅ 测量完成！")
     print("=" * 60)
-    print("🔊 SoundCheck - 室内声学测量系统")
+    print(f"📊 RT60 (混响时间):  {_fmt(rt, '.3f', ' 秒')}")
+    print(f"📊 C50 (清晰度):     {_fmt(c, '.2f', ' dB')}")
+    print(f"📊 STI (语言清晰度): {_fmt(metrics['sti'], '.2f')} ({sti_rating(metrics['sti'])})")
+    print(f"🔍 检测到反射:       {len(ref)} 个")
+    print(f"♻️ 重新计算的阶段:   {', '.join(pipe.computed) or '无 (全部命中缓存)'}")
+    print(f"\n📁 输出文件:")
+    print(f"   IR:         {os.path.join(pipe.workdir('ir'), 'ir.wav')}")
+    print(f"   波形图:     {plot_path}")
+    print(f"   报告:       {report_path}")
+    print(f"   直达声:     {separated_paths['direct']}")
+    print(f"   早反射:     {separated_paths['early']}")
+    print(f"   混响尾声:   {separated_paths['late']}")
+    print(f"   对比文件:   {separated_paths['comparison']}")
+    if archive_id:
+        print(f"   档案:       {args.archive} (id={archive_id})")
     print("=" * 60)
 
+    return 0
+
+
+def cmd_query(args, cfg):
+    import datetime
+    from utils.store import MeasurementStore
+
+    with MeasurementStore(args.archive) as store:
+        rows = store.query_metric(args.metric, band=args.band, room=args.room,
+                                  position=args.position, days=args.days)
+    if args.json:
+        for ts, value, mid, room, position in rows:
+            print(json.dumps({"timestamp": ts, "value": value, "id": mid, "room": room, "position": position},
+                             ensure_ascii=False))
+        return 0
+    band = f"{args.band:g} Hz" if args.band else "宽带"
+    print(f"{args.metric} @ {band}: {len(rows)} 条记录")
+    for ts, value, mid, room, position in rows:
+        when = datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
+        print(f"  {when}  {room or '-':<12} {position or '-':<6} {_fmt(value, '.3f')}  ({mid[:8]})")
+    return 0
+
+
+def _adaptive(cfg, args, simulate=False):
+    """Measure background noise + a probe sweep and return cfg with the planned sweep length."""
+    from core.noise import adaptive_config, format_plan
+
+    rt60 = args.rt60
+    if rt60 is None and args.room:
+        from utils.store import MeasurementStore
+        with MeasurementStore(args.archive) as store:
+            history = store.query_metric("T30", room=args.room)
+        rt60 = history[-1][1] if history else None
+    cfg, plan = adaptive_config(cfg, simulate=simulate, target_inr_db=args.target_inr, expected_rt60=rt60)
+    print("🔇 背景噪声与自适应扫频:")
+    print(format_plan(plan))
+    return cfg
+
+
+def _load_recording(path, fs, dtype="float64"):
+    """Load a raw recording saved as WAV or as a cached .npy array, in the working dtype."""
+    import numpy as np
+    if path.endswith(".npy"):
+        return np.load(path).astype(dtype, copy=False)
+    from core.analysis import load_audio
+    rec, file_fs = load_audio(path)
+    if file_fs != fs:
+        raise ValueError(f"录音采样率 {file_fs} Hz 与配置 fs={fs} Hz 不一致 (可用 --set fs={file_fs})")
+    return rec.astype(dtype, copy=False)
+
+
+def cmd_analyze(args, cfg):
+    from core.analysis import analyze_file
+
+    status = 0
+    for path in args.files:
+        try:
+            result, _, _ = analyze_file(path, cfg, recording=args.recording,
+                                        with_reflections=args.reflections)
+        except Exception as e:
+            print(f"❌ {path}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        if "reflections" in result:
+            result["reflections"] = len(result["reflections"])
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            line = (f"{path}: fs={result['fs']} Hz, RT60={_fmt(result['rt60'], '.3f', 's')}, "
+                    f"C50={_fmt(result['c50'], '.2f', ' dB')}, STI={_fmt(result['sti'], '.2f')}")
+            if "reflections" in result:
+                line += f", 反射={result['reflections']}"
+            print(line)
+    return status
+
+
+def cmd_check(args, cfg):
+    import numpy as np
+    from core.analysis import load_audio
+    from core.quality import assess, assess_take, format_quality
+    from utils.irfile import latest_ir_path
+
+    path = args.file or latest_ir_path()
+    ir, fs = load_audio(path)
+    cfg = cfg.with_overrides(fs=fs)
+    ir = np.asarray(ir, dtype=np.float64)
+    rec = _load_recording(args.recording, fs) if args.recording else None
+    reference = np.asarray(load_audio(args.reference)[0], dtype=np.float64) if args.reference else None
+    if args.whole:
+        quality = assess(ir, cfg, rec=rec, reference=reference)
+    else:
+        quality = assess_take(ir, rec, cfg, reference=reference)
+    if args.json:
+        print(json.dumps(dict(quality, file=path), ensure_ascii=False, default=float))
+        return 0 if quality["ok"] else 1
+    print(f"🔍 {path} ({quality['seconds'] * 1000:.1f} ms)")
+    print(format_quality(quality))
+    if args.verbose:
+        import contextlib
+        import io
+        from core.metrics import band_metrics
+        slope = quality.get("decay_rate_db_s")
+        if slope is not None and slope < 0:
+            print(f"   衰减斜率: {slope:.1f} dB/秒 (推算 RT60 ≈ {-60 / slope:.3f} 秒)")
+        end = quality["decay_end_s"] or quality["valid_s"]
+        print(f"   截断点: {end:.3f} 秒 (衰减到噪声地板；各倍频程按各自的噪声地板截断)")
+        with contextlib.redirect_stdout(io.StringIO()):
+            bands = band_metrics(ir, cfg, valid=int(round(quality["valid_s"] * fs)))
+        for band, values in bands.items():
+            print(f"   {band:>5} Hz: T30={_fmt(values['T30'], '.3f', 's')}, C50={_fmt(values['C50'], '.2f', ' dB')}")
+    return 0 if quality["ok"] else 1
+
+
+def cmd_plot(args, cfg):
+    from core.analysis import load_audio
+    from core.reflections import reflections
+    from utils.plot import plot_ir
+
+    ir, fs = load_audio(args.file)
+    cfg = cfg.with_overrides(fs=fs)
+    plot_ir(ir, fs, reflections(ir, cfg), path=args.output, cfg=cfg)
+    return 0
+
+
+def cmd_report(args, cfg):
+    from core.analysis import analyze_file
+    from core.reflections import reflections
+    from utils.plot import plot_ir
+    from utils.report import generate_report
+
+    result, ir, cfg = analyze_file(args.file, cfg)
+    plot_ir(ir, cfg.fs, reflections(ir, cfg), path=args.plot, cfg=cfg)
+    generate_report(result["rt60"], result["c50"], img=args.plot, out=args.output, sti=result["sti"])
+    print(f"✅ PDF报告生成完成: {args.output}")
+    return 0
+
+
+def cmd_batch(args, cfg):
+    from core.batch import run_batch
+
+    rows = run_batch(args.patterns, cfg, workers=args.jobs, chunksize=args.chunksize,
+                     recording=args.recording, plots_dir=args.plots, output=args.output,
+                     archive=args.archive if args.to_archive else None, room=args.room)
+    return 1 if not rows or any(r.get("error") for r in rows) else 0
+
+
+def cmd_noise(args, cfg):
+    if not args.simulate:
+        from core.device import use_devices
+        cfg = use_devices(cfg)
+    cfg = _adaptive(cfg, args, simulate=args.simulate)
+    print(f"💡 建议: --set sweep_duration={cfg.sweep_duration:g} --set record_tail={cfg.record_tail:g}")
+    return 0
+
+
+def cmd_calibrate(args, cfg):
+    from core.device import calibrate, format_profile, load_profiles
+
+    if args.list:
+        data = load_profiles(args.profiles)
+        if not data["profiles"]:
+            print(f"📭 没有已保存的设备档案 ({args.profiles})")
+        for key, profile in data["profiles"].items():
+            print(f"{'*' if key == data['last'] else ' '} {format_profile(profile)}")
+        return 0
+    profile = calibrate(cfg, loopback=args.loopback, takes=args.takes, simulate=args.simulate, path=args.profiles)
+    print(f"📐 {format_profile(profile)}")
+    return 0
+
+
+def cmd_quick(args, cfg):
+    from core.analysis import _sweep_for
+    from core.quick import parse_stages, quick_check, quick_config
+
+    stages = parse_stages(args.stages)
+    cfg = quick_config(cfg, sweep=args.sweep, tail=args.tail)
+    if not args.recording and not args.simulate:
+        from core.device import use_devices
+        cfg = use_devices(cfg)
+    if args.adaptive and not args.recording:
+        cfg = _adaptive(cfg, args, simulate=args.simulate)
+    if args.recording:
+        takes = [(args.recording, _load_recording(args.recording, cfg.fs, cfg.dtype))]
+    else:
+        from core.record import record_take
+        sweep, _ = _sweep_for(cfg)
+
+        def live():
+            n = 0
+            while True:
+                n += 1
+                yield f"#{n}", record_take(sweep, cfg, args.simulate, save=False)
+                if not args.loop or input("回车测量下一个房间 (q=结束): ").strip().lower() == "q":
+                    return
+        takes = live()
+
+    for label, rec in takes:
+        result = quick_check(rec, cfg, stages)
+        if args.json:
+            print(json.dumps(dict(result, take=label), ensure_ascii=False, default=float))
+            continue
+        line = [f"⚡ {label}"]
+        if "metrics" in stages:
+            line.append(f"RT60={_fmt(result['rt60'], '.3f', 's')}  C50={_fmt(result['c50'], '.2f', ' dB')}")
+        if "sti" in stages:
+            line.append(f"STI={_fmt(result['sti'], '.2f')}")
+        if "reflections" in stages:
+            line.append(f"反射 {len(result['reflections'])} 个")
+        if "quality" in stages:
+            q = result["quality"]
+            line.append(f"INR={_fmt(q['inr_db'], '.1f', ' dB')}" + ("" if q["ok"] else f" ⚠️{len(q['warnings'])}"))
+        print("  ".join(line) + f"  ({result['seconds']:.2f}秒)")
+        for band, values in result.get("bands", {}).items():
+            print(f"   {band:>5} Hz: T30={_fmt(values['T30'], '.3f', 's')}, C50={_fmt(values['C50'], '.2f', ' dB')}")
+        for _, message in result.get("quality", {}).get("warnings", []):
+            print(f"   ⚠️ {message}")
+    return 0
+
+
+def cmd_eq(args, cfg):
+    import glob
+    import time
+    from core.eq import design, export, load_irs
+
+    paths = sorted({p for pattern in args.files for p in (glob.glob(pattern) or [pattern])})
+    irs, fs = load_irs(paths)
+    lo, hi = (float(v) for v in args.range.split(","))
+    start = time.perf_counter()
+    result = design(irs, fs, bands=args.bands, fraction=args.smoothing, fit_range=(lo, hi),
+                    fir_taps=args.fir, max_cut_db=-abs(args.max_cut), max_boost_db=args.max_boost)
+    elapsed = time.perf_counter() - start
+    print(f"🎛️ 均衡设计: {len(irs)} 个IR空间平均, 1/{args.smoothing} 倍频程平滑, {lo:g}-{hi:g} Hz"
+          f" (用时 {elapsed:.2f}秒)")
+    if "fir" in result:
+        print(f"   FIR: {len(result['fir'])} 阶 (线性相位)")
+    for i, f in enumerate(result.get("filters", []), 1):
+        print(f"   {i:2d}. PK {f['fc']:7.1f} Hz  {f['gain_db']:+5.1f} dB  Q {f['q']:.2f}")
+    print(f"   频响起伏 (标准差): {result['response_spread_db']:.1f} dB -> {result['corrected_spread_db']:.1f} dB")
+    for fmt, path in export(result, args.output, [f.strip() for f in args.format.split(",") if f.strip()]).items():
+        print(f"📁 {fmt}: {path}")
+    return 0
+
+
+def cmd_auralize(args, cfg):
+    import time
+    import numpy as np
+    from core.analysis import load_audio
+    from core.convolve import ir_part, load_source, play, render
+
+    from utils.irfile import latest_ir_path
+
+    args.ir = args.ir or latest_ir_path()
+    ir, fs = load_audio(args.ir)
+    cfg = cfg.with_overrides(fs=fs)
+    h = ir_part(np.asarray(ir, dtype=np.float64), args.part, cfg)
+    x = load_source(args.file, fs)
+    print(f"🎧 {args.file} ({len(x)/fs:.1f}秒) ⊛ {args.ir} [{args.part}, {len(h)/fs:.2f}秒]")
+    if args.play:
+        print(f"🔊 实时播放 (块长 {args.block} 采样, 延迟 {args.block/fs*1000:.1f} ms)...")
+        play(x, h, fs, block=args.block)
+        return 0
+
+    import soundfile as sf
+    start = time.perf_counter()
+    y = render(x, h)
+    peak = np.max(np.abs(y))
+    if peak > 0:
+        y *= 10 ** (-1 / 20) / peak
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    sf.write(args.output, y, fs)
+    print(f"✅ 渲染完成: {args.output} ({len(y)/fs:.1f}秒音频, 用时 {time.perf_counter() - start:.2f}秒)")
+    return 0
+
+
+def cmd_mess(args, cfg):
+    import numpy as np
+    from core.mess import measure_mess, mess_durations, sweep_offset
+    from core.metrics import RT60, C50
+    from utils.irfile import write_ir
+
+    if args.speakers < 1:
+        raise ValueError("--speakers 至少为 1")
+    if not args.simulate:
+        from core.device import use_devices
+        cfg = use_devices(cfg)
+    total, separate = mess_durations(cfg, args.speakers, args.ir_length)
+    print(f"🔊 多扫频法: {args.speakers} 个扬声器, 错开 {sweep_offset(cfg, args.ir_length):.2f} 秒, "
+          f"录音 {total:.1f} 秒 (逐个测量需 {separate:.1f} 秒)")
+    irs, rec = measure_mess(cfg, args.speakers, args.ir_length, simulate=args.simulate)
+    layout = [f"spk{k + 1}" for k in range(args.speakers)]
+    write_ir(args.output, irs, cfg.fs, config_hash=cfg.digest(), channel_layout=layout, method="mess")
+
+    rows = []
+    for k, name in enumerate(layout):
+        ir = np.ascontiguousarray(irs[:, k])
+        rt, c = RT60(ir, cfg=cfg), C50(ir, cfg=cfg)
+        rows.append((name, ir, rt, c))
+        level = 20 * np.log10(np.max(np.abs(ir)) or 1e-12)
+        print(f"   {name}: RT60={_fmt(rt, '.3f', 's')}  C50={_fmt(c, '.2f', ' dB')}  峰值 {level:.1f} dB")
+    if not args.no_archive:
+        from utils.store import MeasurementStore, flatten_metrics
+        with MeasurementStore(args.archive) as store:
+            for name, ir, rt, c in rows:
+                store.add_measurement(room=args.room, position=args.position, cfg=cfg, kind="mess",
+                                      source=f"mess:{name}", arrays={"ir": ir},
+                                      metrics=flatten_metrics({"rt60": rt, "c50": c}))
+    print(f"📁 IR: {args.output} ({args.speakers} 通道)")
+    return 0
+
+
+def cmd_repeat(args, cfg):
+    import contextlib
+    import io
+    import numpy as np
+    from core.metrics import C50, band_metrics
+    from core.quality import assess_take
+    from core.repeat import measure_repeated
+    from utils.irfile import write_ir
+
+    if args.takes < 2:
+        raise ValueError("--takes 至少为 2")
+    if not args.simulate:
+        from core.device import use_devices
+        cfg = use_devices(cfg)
+    print(f"🔁 重复测量 {args.takes} 次，剔除被干扰的测量后平均")
+    average, _ = measure_repeated(cfg, args.takes, simulate=args.simulate, disturb=set(args.disturb or ()))
+    summary = average.summary()
+    ir = np.asarray(average.mean)
+    print(f"📊 接受 {summary['accepted']}/{summary['takes']} 次, "
+          f"各次 RT60 {_fmt(summary['rt60_mean'], '.3f', 's')} ± {_fmt(summary['rt60_std'], '.3f', 's')}, "
+          f"残余差异 {_fmt(summary['residual_db'], '.1f', ' dB')}")
+    if summary["rejected"] * 2 >= summary["takes"]:
+        print("⚠️ 半数以上的测量被剔除：房间在测量期间不稳定，或第一次测量 (参考) 本身受到干扰")
+    peak = np.max(np.abs(ir))
+    if peak > 0:
+        ir = ir / peak
+    quality = assess_take(ir, None, cfg)
+    with contextlib.redirect_stdout(io.StringIO()):
+        bands = band_metrics(ir, cfg, valid=int(round(quality["valid_s"] * cfg.fs)))
+    print(f"   平均IR: C50={_fmt(C50(ir, cfg=cfg), '.2f', ' dB')}, INR {_fmt(quality['inr_db'], '.1f', ' dB')}")
+    for band, values in bands.items():
+        print(f"   {band:>5} Hz: T30={_fmt(values['T30'], '.3f', 's')}")
+    write_ir(args.output, ir, cfg.fs, config_hash=cfg.digest(), method="repeat")
+    print(f"📁 平均IR: {args.output}")
+    return 0
+
+
+def cmd_impulse(args, cfg):
+    from core.impulse import measure_impulse
+    from utils.irfile import write_ir
+
+    if args.events < 1:
+        raise ValueError("--events 至少为 1")
+    if not args.simulate:
+        from core.device import use_devices
+        cfg = use_devices(cfg)
+    print(f"💥 脉冲声源测量: {args.events} 次事件，每次保留 {args.length:.1f} 秒")
+    result = measure_impulse(cfg, args.events, args.length, args.trigger_db, args.timeout, simulate=args.simulate)
+    quality = result["quality"]
+    print(f"📊 平均 {len(result['events'])} 次" + (f" (丢弃 {result['rejected']} 次削波)" if result["rejected"] else "")
+          + f": RT60={_fmt(result['rt60'], '.3f', 's')}, C50={_fmt(result['c50'], '.2f', ' dB')}, "
+          f"INR {_fmt(quality['inr_db'], '.1f', ' dB')}")
+    for band, values in result["bands"].items():
+        print(f"   {band:>5} Hz: T30={_fmt(values['T30'], '.3f', 's')}  C50={_fmt(values['C50'], '.2f', ' dB')}")
+    for _, message in quality["warnings"]:
+        print(f"⚠️ {message}")
+    write_ir(args.output, result["ir"], cfg.fs, config_hash=cfg.digest(), method="impulse")
+    if not args.no_archive:
+        from utils.store import MeasurementStore, flatten_metrics
+        with MeasurementStore(args.archive) as store:
+            store.add_measurement(room=args.room, position=args.position, cfg=cfg, kind="impulse",
+                                  source="impulse", arrays={"ir": result["ir"]},
+                                  metrics=flatten_metrics({"rt60": result["rt60"], "c50": result["c50"]},
+                                                          result["bands"]))
+    print(f"📁 IR: {args.output}")
+    return 0
+
+
+def cmd_scan(args, cfg):
+    from core.scan import extract_takes
+
+    print(f"🔎 扫描长录音: {args.file}")
+    rows = extract_takes(args.file, cfg, archive=None if args.no_archive else args.archive, room=args.room,
+                         position=args.position, channel=args.channel, block=args.block,
+                         threshold=args.threshold)
+    failed = sum(1 for r in rows if r.get("error"))
+    print(f"✅ 找到 {len(rows)} 次扫频" + (f"，{failed} 次处理失败" if failed else ""))
+    return 1 if not rows or failed else 0
+
+
+def cmd_session(args, cfg):
+    from core.session import Session
+
+    only = [p.strip() for p in args.positions.split(",")] if args.positions else None
+    session = Session(cfg, room=args.room, archive=None if args.no_archive else args.archive,
+                      auto=args.auto, pause=args.pause, simulate=args.simulate, only=only,
+                      workers=args.jobs, exports=not args.no_exports)
+    session.run()
+    print(f"📁 会话结果: {session.save(args.output)}")
+    return 0 if session.results else 1
+
+
+def cmd_daemon(args, cfg):
+    import asyncio
+    from core.monitor import DEFAULT_TOLERANCES, MonitorDaemon, parse_times
+
+    times = parse_times(args.at)
+    interval = args.interval if args.interval is not None or times else 3600.0
+    tolerances = dict(DEFAULT_TOLERANCES, T30=("relative", args.t30_tol), C50=("absolute", args.c50_tol))
+    daemon = MonitorDaemon(cfg, archive=args.archive, room=args.room, position=args.position,
+                           interval=interval, times=times, workers=args.jobs, simulate=args.simulate,
+                           baseline=args.baseline, tolerances=tolerances, max_runs=args.count)
+    asyncio.run(daemon.run())
+    return 0
+
+
+def cmd_serve(args, cfg):
+    import asyncio
+    from core.server import MeasurementServer
+
+    server = MeasurementServer(cfg, host=args.host, port=args.port,
+                               archive=None if args.no_archive else args.archive, room=args.room,
+                               workers=args.jobs, simulate=args.simulate)
+    asyncio.run(server.serve_forever())
+    return 0
+
+
+def parse_args(argv=None):
+    def add_set(p, default):
+        p.add_argument("--set", dest="overrides", action="append", default=default, metavar="KEY=VALUE",
+                       help="覆盖配置项，例如 --set fs=96000 (可重复；优先级高于环境变量 SOUNDCHECK_*)")
+
+    def add_archive(p):
+        p.add_argument("--archive", default="data/archive", metavar="DIR", help="测量档案目录")
+        p.add_argument("--room", default=None, help="房间名称（写入/查询档案）")
+
+    def add_adaptive(p, flag=True):
+        if flag:
+            p.add_argument("--adaptive", action="store_true",
+                           help="先测背景噪声和探测扫频，自动选择最短的扫频/尾部长度")
+        p.add_argument("--target-inr", type=float, default=60.0, metavar="DB", help="目标脉冲噪声比 (默认 60 dB)")
+        p.add_argument("--rt60", type=float, default=None, metavar="SEC",
+                       help="预期混响时间 (默认取档案中该房间最近的 T30，否则 1 秒)")
+
+    # Subcommands must not reset overrides given before the subcommand name
+    common = argparse.ArgumentParser(add_help=False)
+    add_set(common, argparse.SUPPRESS)
+
+    parser = argparse.ArgumentParser(description="SoundCheck - 室内声学测量系统")
+    add_set(parser, [])
+    parser.add_argument("--trace", default=os.environ.get("SOUNDCHECK_TRACE"), metavar="JSON",
+                        help="记录各阶段耗时/内存并导出 Chrome trace (也可用环境变量 SOUNDCHECK_TRACE)")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("measure", parents=[common], help="完整测量流程（默认）")
+    p.add_argument("--recording", default=None, metavar="FILE",
+                   help="不录音，改用已有录音 (WAV 或缓存中的 value.npy)，只重算失效的阶段")
+    add_archive(p)
+    p.add_argument("--position", default=None, help="麦克风位置编号/名称")
+    p.add_argument("--no-archive", action="store_true", help="不写入测量档案")
+    add_adaptive(p)
+    p.set_defaults(func=cmd_measure)
+
+    p = sub.add_parser("analyze", parents=[common], help="离线分析IR或录音文件")
+    p.add_argument("files", nargs="+", help="WAV文件")
+    p.add_argument("-r", "--recording", action="store_true", help="输入为原始扫频录音（先同步并提取IR）")
+    p.add_argument("--reflections", action="store_true", help="同时检测反射")
+    p.add_argument("--json", action="store_true", help="每个文件输出一行JSON")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("check", parents=[common], help="评估测量质量 (INR、削波、谐波、时变性等)")
+    p.add_argument("file", nargs="?", help="IR 文件 (默认: 最近一次测量的IR)")
+    p.add_argument("--recording", help="对应的原始录音 (用于削波检查)")
+    p.add_argument("--reference", help="同一位置另一次测量的IR (用于时变性检查)")
+    p.add_argument("--whole", action="store_true",
+                   help="整段IR参与评估 (已裁剪或其他软件导出的IR；默认按当前扫频配置去掉去卷积的尾部)")
+    p.add_argument("--json", action="store_true", help="输出JSON")
+    p.add_argument("-v", "--verbose", action="store_true", help="同时显示衰减拟合和各频带 T30")
+    p.set_defaults(func=cmd_check)
+
+    p = sub.add_parser("plot", parents=[common], help="绘制IR图表")
+    p.add_argument("file", help="IR WAV文件")
+    p.add_argument("-o", "--output", default="data/plots/ir.png")
+    p.set_defaults(func=cmd_plot)
+
+    p = sub.add_parser("report", parents=[common], help="分析IR并生成PDF报告")
+    p.add_argument("file", help="IR WAV文件")
+    p.add_argument("-o", "--output", default="data/reports/report.pdf")
+    p.add_argument("--plot", default="data/plots/ir.png", help="报告中使用的图表路径")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("batch", parents=[common], help="批量离线分析")
+    p.add_argument("patterns", nargs="+", help="文件通配符，例如 'data/raw/**/*.wav'")
+    p.add_argument("-r", "--recording", action="store_true", help="输入为原始扫频录音")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="进程数（默认CPU核数）")
+    p.add_argument("--chunksize", type=int, default=None, help="每个任务块的文件数")
+    p.add_argument("--plots", default=None, metavar="DIR", help="为每个文件生成图表")
+    p.add_argument("-o", "--output", default="data/batch/results.csv")
+    p.add_argument("--to-archive", action="store_true", help="同时把结果和IR写入测量档案")
+    add_archive(p)
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("query", parents=[common], help="查询测量档案中的指标")
+    p.add_argument("metric", help="指标名，例如 T30 或 C50")
+    p.add_argument("--band", type=float, default=0, help="倍频程中心频率 (Hz)，0 为宽带")
+    p.add_argument("--days", type=float, default=None, help="只看最近N天")
+    p.add_argument("--position", default=None)
+    p.add_argument("--json", action="store_true")
+    add_archive(p)
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("quick", parents=[common], help="快速检查 (短扫频, 不写文件)")
+    p.add_argument("--stages", default="metrics", metavar="A,B",
+                   help="要计算的阶段: metrics, bands, sti, reflections, quality (默认 metrics)")
+    p.add_argument("--sweep", type=float, default=2.0, metavar="SEC", help="扫频长度 (默认 2 秒)")
+    p.add_argument("--tail", type=float, default=None, metavar="SEC", help="录音尾部长度 (默认取配置)")
+    p.add_argument("--recording", default=None, metavar="FILE", help="分析已有的快速检查录音")
+    p.add_argument("--loop", action="store_true", help="连续检查多个房间")
+    p.add_argument("--simulate", action="store_true", help="使用模拟音频后端 (无需声卡)")
+    p.add_argument("--json", action="store_true", help="每次结果输出一行JSON")
+    add_adaptive(p)
+    add_archive(p)
+    p.set_defaults(func=cmd_quick)
+
+    p = sub.add_parser("noise", parents=[common], help="测量背景噪声并建议扫频长度")
+    p.add_argument("--simulate", action="store_true", help="使用模拟音频后端 (无需声卡)")
+    add_adaptive(p, flag=False)
+    add_archive(p)
+    p.set_defaults(func=cmd_noise)
+
+    p = sub.add_parser("calibrate", parents=[common], help="校准设备延迟/电平/测量链频响 (之后自动使用)")
+    p.add_argument("--loopback", type=int, default=None, metavar="CH",
+                   help="接了输出回环线的输入通道 (从 0 开始)，用于测量声卡本身的频响")
+    p.add_argument("--takes", type=int, default=3, help="校准扫频次数 (默认 3)")
+    p.add_argument("--simulate", action="store_true", help="使用模拟音频后端 (无需声卡)")
+    p.add_argument("--list", action="store_true", help="列出已保存的设备档案 (* 为最近校准)")
+    p.add_argument("--profiles", default="data/devices/profiles.json", metavar="PATH", help="设备档案文件")
+    p.set_defaults(func=cmd_calibrate)
+
+    p = sub.add_parser("eq", parents=[common], help="自动设计房间均衡")
+    p.add_argument("files", nargs="+", help="IR 文件或通配符 (多个位置做空间平均)")
+    p.add_argument("--bands", type=int, default=10, help="峰值滤波器个数")
+    p.add_argument("--range", default="20,300", metavar="LO,HI", help="均衡的频率范围 (Hz)")
+    p.add_argument("--smoothing", type=int, default=6, metavar="N", help="1/N 倍频程平滑")
+    p.add_argument("--max-cut", type=float, default=15.0, metavar="DB", help="单个滤波器最大衰减")
+    p.add_argument("--max-boost", type=float, default=0.0, metavar="DB", help="最大提升 (默认只衰减)")
+    p.add_argument("--fir", type=int, default=None, metavar="TAPS", help="改为设计线性相位FIR")
+    p.add_argument("--format", default="json,csv,minidsp,apo", help="导出格式: json, csv, minidsp, apo")
+    p.add_argument("-o", "--output", default="data/eq/eq", help="输出文件名前缀")
+    p.set_defaults(func=cmd_eq)
+
+    p = sub.add_parser("auralize", parents=[common], help="用测得的IR试听房间效果")
+    p.add_argument("file", help="干声音频文件 (如语音录音)")
+    p.add_argument("--ir", default=None, help="IR 文件 (WAV 或 .scir, 默认: 最近一次测量的IR)")
+    p.add_argument("--part", default="full", choices=("full", "direct", "early", "late"),
+                   help="使用完整IR或其中一部分 (同 separate_ir_components)")
+    p.add_argument("-o", "--output", default="data/processed/auralized.wav")
+    p.add_argument("--play", action="store_true", help="通过声卡实时播放 (分段卷积, 低延迟)")
+    p.add_argument("--block", type=int, default=256, help="实时播放的块长 (2的幂)")
+    p.set_defaults(func=cmd_auralize)
+
+    p = sub.add_parser("mess", parents=[common], help="多扫频法 (一次录音测多个扬声器)")
+    p.add_argument("--speakers", type=int, default=2, help="扬声器 (输出通道) 数")
+    p.add_argument("--ir-length", type=float, default=1.5, metavar="SEC",
+                   help="每个IR保留的长度，决定扫频错开的时间 (默认 1.5 秒)")
+    p.add_argument("--position", default=None)
+    p.add_argument("-o", "--output", default="data/processed/mess.scir", help="多通道IR文件")
+    p.add_argument("--simulate", action="store_true", help="使用模拟音频后端 (无需声卡)")
+    p.add_argument("--no-archive", action="store_true", help="不写入测量档案")
+    add_archive(p)
+    p.set_defaults(func=cmd_mess)
+
+    p = sub.add_parser("scan", parents=[common], help="从长录音中找出每次扫频并提取IR")
+    p.add_argument("file", help="独立录音机录下的长录音 (soundfile 支持的格式)")
+    p.add_argument("--channel", type=int, default=0, help="使用的通道 (默认 0)")
+    p.add_argument("--block", type=float, default=10.0, metavar="SEC", help="每次读取的长度 (默认 10 秒)")
+    p.add_argument("--threshold", type=float, default=0.1, help="归一化匹配滤波门限 (默认 0.1)")
+    p.add_argument("--position", default=None)
+    p.add_argument("--no-archive", action="store_true", help="不写入测量档案")
+    add_archive(p)
+    p.set_defaults(func=cmd_scan)
+
+    p = sub.add_parser("repeat", parents=[common], help="重复测量并平均 (自动剔除被干扰的测量)")
+    p.add_argument("--takes", type=int, default=5, help="测量次数 (默认 5)")
+    p.add_argument("-o", "--output", default="data/processed/ir_mean.scir", help="平均IR文件")
+    p.add_argument("--simulate", action="store_true", help="使用模拟音频后端 (无需声卡)")
+    p.add_argument("--disturb", type=int, action="append", metavar="N",
+                   help="(--simulate) 第 N 次测量模拟房间发生变化，可重复")
+    p.set_defaults(func=cmd_repeat)
+
+    p = sub.add_parser("impulse", parents=[common], help="脉冲声源测量 (拍手/气球/发令枪，无需扫频)")
+    p.add_argument("--events", type=int, default=3, help="平均的脉冲次数 (默认 3)")
+    p.add_argument("--length", type=float, default=1.0, metavar="SEC", help="每次保留的IR长度 (默认 1 秒)")
+    p.add_argument("--trigger-db", type=float, default=25.0, help="STA/LTA 能量比门限 (默认 25 dB)")
+    p.add_argument("--timeout", type=float, default=60.0, metavar="SEC", help="最长等待时间 (默认 60 秒)")
+    p.add_argument("-o", "--output", default="data/processed/ir_impulse.scir", help="平均IR文件")
+    p.add_argument("--simulate", action="store_true", help="使用模拟脉冲声源 (无需声卡)")
+    p.add_argument("--position", default=None)
+    p.add_argument("--no-archive", action="store_true", help="不写入测量档案")
+    add_archive(p)
+    p.set_defaults(func=cmd_impulse)
+
+    p = sub.add_parser("session", parents=[common], help="多位置测量与空间平均")
+    p.add_argument("--auto", action="store_true", help="不等待确认，自动测量下一个位置")
+    p.add_argument("--pause", type=float, default=0.0, metavar="SEC", help="自动模式下每个位置前的等待秒数")
+    p.add_argument("--positions", default=None, metavar="1,3,...", help="只测量这些位置 (默认全部)")
+    p.add_argument("-j", "--jobs", type=int, default=None,
+                   help="录下一个位置时处理上一个位置的进程数 (0 = 顺序执行)")
+    p.add_argument("--no-exports", action="store_true", help="不生成每个位置的图表/分离文件/报告")
+    p.add_argument("--simulate", action="store_true", help="使用模拟音频后端 (无需声卡)")
+    p.add_argument("-o", "--output", default=None, metavar="JSON", help="会话结果文件 (默认 data/sessions/<时间>.json)")
+    p.add_argument("--no-archive", action="store_true", help="不写入测量档案")
+    add_archive(p)
+    p.set_defaults(func=cmd_session)
+
+    p = sub.add_parser("daemon", parents=[common], help="无人值守的定时监测")
+    p.add_argument("--interval", type=float, default=None, metavar="SEC",
+                   help="两次测量的间隔秒数 (未给出 --at 时默认 3600)")
+    p.add_argument("--at", default=None, metavar="HH:MM,...", help="每天的固定测量时间")
+    p.add_argument("--count", type=int, default=None, help="测量N次后退出")
+    p.add_argument("--position", default=None)
+    p.add_argument("-j", "--jobs", type=int, default=None, help="分析进程数")
+    p.add_argument("--baseline", type=int, default=5, help="漂移基线使用的最近测量次数")
+    p.add_argument("--t30-tol", type=float, default=0.10, help="T30 相对容差 (默认 0.10 = 10%%)")
+    p.add_argument("--c50-tol", type=float, default=1.0, help="C50 容差 (dB)")
+    p.add_argument("--simulate", action="store_true", help="使用模拟音频后端 (无需声卡)")
+    add_archive(p)
+    p.set_defaults(func=cmd_daemon)
+
+    p = sub.add_parser("serve", parents=[common], help="本地 HTTP/WebSocket 测量服务")
+    p.add_argument("--host", default="127.0.0.1", help="监听地址 (默认只接受本机连接)")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("-j", "--jobs", type=int, default=None, help="分析进程数")
+    p.add_argument("--simulate", action="store_true", help="使用模拟音频后端 (无需声卡)")
+    p.add_argument("--no-archive", action="store_true", help="不写入测量档案")
+    add_archive(p)
+    p.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        argv = list(argv if argv is not None else sys.argv[1:])
+        args = parser.parse_args(argv + ["measure"])
+    return args
+
+
+def main(argv=None):
+    # Load config: YAML -> SOUNDCHECK_* env -> --set overrides
+    args = parse_args(argv)
+    cfg = build_config(parse_overrides(args.overrides))
+    if not args.trace:
+        return _run(args, cfg)
+
+    from utils import trace
+    if not trace.is_enabled():
+        trace.enable()
     try:
-        # Load config
-        cfg = load_config()
-        fs = int(float(cfg.get("fs", 48000)))
-
-        # Step 1: Choose audio device
-        print("\n[1/9] 选择音频设备...")
-        choose_device()
-
-        # Step 2: Generate sweep signal
-        print("\n[2/9] 生成扫频信号...")
-        sig, inv = generate_sweep()
-        print(f"✅ 扫频信号生成完成 ({len(sig)/fs:.1f}秒)")
-
-        # Step 3: Play and record
-        print("\n[3/9] 播放并录制...")
-        rec = play_and_record(sig)
-
-        # Step 4: Synchronize and trim
-        print("\n[4/9] 同步和裁剪录音...")
-        rec2 = sync_and_trim(rec, sig)
-
-        # Step 5: Extract impulse response
-        print("\n[5/9] 提取脉冲响应 (IR)...")
-        ir = extract_ir(rec2, inv)
-
-        # Step 6: Calculate acoustic metrics
-        print("\n[6/9] 计算声学指标...")
-        rt = RT60(ir)
-        c = C50(ir)
-        print(f"   RT60: {rt:.3f} 秒" if not float('nan') == rt else "   RT60: N/A")
-        print(f"   C50: {c:.2f} dB" if not float('nan') == c else "   C50: N/A")
-
-        # Step 7: Detect reflections and plot
-        print("\n[7/9] 检测反射并绘制图表...")
-        ref = reflections(ir)
-        plot_ir(ir, fs, ref)
-
-        # Step 8: Separate IR components
-        print("\n[8/9] 分离IR成分并导出WAV文件...")
-        separated_paths = separate_ir_components(ir)
-        export_ir_comparison(ir)
-
-        # Step 9: Generate report
-        print("\n[9/9] 生成PDF报告...")
-        generate_report(rt, c)
-        print("✅ PDF报告生成完成")
-
-        # Summary
-        print("\n" + "=" * 60)
-        print("✅ 测量完成！")
-        print("=" * 60)
-        print(f"📊 RT60 (混响时间):  {rt:.3f} 秒" if not float('nan') == rt else "📊 RT60: N/A")
-        print(f"📊 C50 (清晰度):     {c:.2f} dB" if not float('nan') == c else "📊 C50: N/A")
-        print(f"🔍 检测到反射:       {len(ref)} 个")
-        print(f"\n📁 输出文件:")
-        print(f"   波形图:     data/plots/ir.png")
-        print(f"   报告:       data/reports/report.pdf")
-        print(f"   直达声:     {separated_paths['direct']}")
-        print(f"   早反射:     {separated_paths['early']}")
-        print(f"   混响尾声:   {separated_paths['late']}")
-        print(f"   对比文件:   data/separated/comparison.wav")
-        print("=" * 60)
+        with trace.span(f"run.py {args.command}"):
+            return _run(args, cfg)
+    finally:
+        trace.finish(args.trace)
 
+
+def _run(args, cfg):
+    if args.command != "measure":
+        return args.func(args, cfg)
+
+    print("=" * 60)
+    print("🔊 SoundCheck - 室内声学测量系统")
+    print("=" * 60)
+    print(f"⚙️ 配置: fs={cfg.fs} Hz, 配置哈希 {cfg.digest()}")
+
+    try:
+        return cmd_measure(args, cfg)
     except KeyboardInterrupt:
         print("\n\n⚠️ 用户中断")
     except Exception as e:
@@ -94,4 +831,4 @@ def main():
         raise
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
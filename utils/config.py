@@ -1,23 +1,237 @@
-from copy import deepcopy
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field, fields, replace
 from functools import lru_cache
 from pathlib import Path
 
 import yaml
 
 
-_CONFIG_PATH = Path(__file__).resolve().parents[1] / "config" / "params.yaml"
+_CONFIG_DIR = Path(__file__).resolve().parents[1] / "config"
+_CONFIG_PATH = _CONFIG_DIR / "params.yaml"
 
+# Layer order: later files override earlier ones.
+_CONFIG_FILES = ("params.yaml", "audio.yaml", "room.yaml")
 
-@lru_cache(maxsize=1)
-def _load_raw_config() -> dict:
-    """Load and cache the raw YAML configuration."""
-    with _CONFIG_PATH.open("r", encoding="utf-8") as fh:
+ENV_PREFIX = "SOUNDCHECK_"
+
+
+class _FrozenMap(tuple):
+    """A frozen mapping: sorted (key, value) pairs, tagged so _thaw() restores a dict.
+
+    Still a tuple, so it hashes and compares like the plain pairs; only its
+    type tells it apart from a frozen list of two-element lists.
+    """
+
+    __slots__ = ()
+
+
+def _freeze(value):
+    """Convert nested YAML data (dict/list) into hashable tuples."""
+    if isinstance(value, _FrozenMap):
+        return value
+    if isinstance(value, dict):
+        return _FrozenMap((str(k), _freeze(v)) for k, v in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    """Inverse of _freeze: frozen mappings become dicts, other tuples lists."""
+    if isinstance(value, _FrozenMap):
+        return {k: _thaw(v) for k, v in value}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+@dataclass(frozen=True)
+class Config:
+    """Immutable per-run configuration.
+
+    Build it once with build_config() and pass it explicitly through the
+    pipeline. Derive variants (another sample rate, another threshold) with
+    with_overrides(); the original is never mutated.
+    """
+
+    # audio.yaml
+    device_select: str = "auto"
+    drift_correction: str = "auto"
+
+    # params.yaml
+    fs: int = 48000
+    sweep_duration: float = 8.0
+    sweep_freq_min: float = 20.0
+    sweep_freq_max: float = 20000.0
+    silence_pre: float = 0.0
+    silence_post: float = 0.0
+    record_tail: float = 0.0
+    min_peak_db: float = -25.0
+    min_peak_distance_ms: float = 1.0
+    min_energy: float = 1e-9
+    early_reflection_time: float = 0.08
+
+    # low-memory mode (see utils/memory.py)
+    dtype: str = "float64"
+    memory_budget_mb: float = 0.0
+    input_channels: int = 1
+
+    # disk budget of the stage cache (see core/pipeline.py), 0 = unlimited
+    cache_budget_mb: float = 2048.0
+
+    # device profile of the selected devices (set by core.device.use_devices, see calibrate)
+    sync_latency: float = -1.0                              # seconds; < 0: unknown, full sync search
+    chain_response: tuple = field(default=(), compare=True)  # ((freq, dB), ...) divided out of the IR
+
+    # room.yaml (frozen nested sections, see section())
+    room: tuple = field(default=(), compare=True)
+    table: tuple = field(default=(), compare=True)
+    speaker: tuple = field(default=(), compare=True)
+    microphones: tuple = field(default=(), compare=True)
+
+    def __post_init__(self):
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if f.type is int:
+                value = int(float(value))
+            elif f.type is float:
+                value = float(value)
+            elif f.type is str:
+                value = str(value)
+            else:
+                value = _freeze(value)
+            object.__setattr__(self, f.name, value)
+        if self.fs <= 0:
+            raise ValueError(f"fs must be positive, got {self.fs}")
+        if self.min_energy <= 0:
+            object.__setattr__(self, "min_energy", 1e-9)
+        if self.dtype not in ("float32", "float64"):
+            raise ValueError(f"dtype must be float32 or float64, got {self.dtype!r}")
+        if self.drift_correction.strip().lower() not in ("auto", "off"):
+            try:
+                float(self.drift_correction)
+            except ValueError:
+                raise ValueError(f"drift_correction must be auto, off or a drift in ppm, got {self.drift_correction!r}")
+        if self.cache_budget_mb < 0:
+            raise ValueError(f"cache_budget_mb must be >= 0, got {self.cache_budget_mb}")
+        if self.input_channels < 1:
+            raise ValueError(f"input_channels must be >= 1, got {self.input_channels}")
+
+    @property
+    def eps(self):
+        return self.min_energy
+
+    def get(self, key, default=None):
+        """dict-style access kept for callers written against load_config()."""
+        if key in self.keys():
+            value = getattr(self, key)
+            return _thaw(value) if isinstance(value, tuple) else value
+        return default
+
+    def keys(self):
+        return [f.name for f in fields(self)]
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.get(key)
+
+    def section(self, name):
+        """Return a nested room.yaml section (room, table, speaker, ...) as a plain dict."""
+        return _thaw(getattr(self, name)) or {}
+
+    def as_dict(self):
+        return {name: self.get(name) for name in self.keys()}
+
+    def with_overrides(self, **overrides):
+        """Return a new Config with the given fields replaced."""
+        unknown = set(overrides) - set(self.keys())
+        if unknown:
+            raise KeyError(f"Unknown config keys: {', '.join(sorted(unknown))}")
+        return replace(self, **overrides)
+
+    def digest(self, keys=None):
+        """Stable content hash of the configuration (or a subset of its keys).
+
+        Unlike hash(), the digest is identical across processes and runs, so it
+        can be used as a cache key for derived artifacts.
+        """
+        names = self.keys() if keys is None else sorted(keys)
+        payload = {name: self.get(name) for name in names}
+        blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def _read_yaml(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with path.open("r", encoding="utf-8") as fh:
         data = yaml.safe_load(fh) or {}
     if not isinstance(data, dict):
         raise TypeError(f"Configuration root must be a mapping, got {type(data).__name__}")
     return data
 
 
+def _parse_value(text):
+    """Parse a CLI/env override string with YAML scalar rules ("48000" -> 48000)."""
+    return yaml.safe_load(text) if isinstance(text, str) else text
+
+
+def parse_overrides(items) -> dict:
+    """Turn ["fs=96000", "min_peak_db=-30"] into a dict of overrides."""
+    result = {}
+    for item in items or ():
+        if "=" not in item:
+            raise ValueError(f"Override must look like key=value, got {item!r}")
+        key, value = item.split("=", 1)
+        result[key.strip()] = _parse_value(value.strip())
+    return result
+
+
+def env_overrides(environ=None) -> dict:
+    """Collect SOUNDCHECK_<KEY>=value overrides from the environment."""
+    environ = os.environ if environ is None else environ
+    known = {f.name for f in fields(Config)}
+    result = {}
+    for name, value in environ.items():
+        if not name.startswith(ENV_PREFIX):
+            continue
+        key = name[len(ENV_PREFIX):].lower()
+        if key in known:
+            result[key] = _parse_value(value)
+    return result
+
+
+def build_config(overrides=None, environ=None, config_dir=None) -> Config:
+    """Build a Config from params/audio/room YAML, then environment, then CLI overrides."""
+    config_dir = Path(config_dir) if config_dir is not None else _CONFIG_DIR
+    known = {f.name for f in fields(Config)}
+    merged = {}
+    for name in _CONFIG_FILES:
+        data = _read_yaml(config_dir / name)
+        unknown = set(data) - known
+        if unknown:
+            raise KeyError(f"Unknown config keys in {config_dir / name}: {', '.join(sorted(unknown))}")
+        merged.update(data)
+    merged.update(env_overrides(environ))
+    unknown = set(overrides or {}) - known
+    if unknown:
+        raise KeyError(f"Unknown config keys: {', '.join(sorted(unknown))}")
+    merged.update(overrides or {})
+    return Config(**merged)
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Default process-wide Config, used when a caller does not pass one."""
+    return build_config()
+
+
 def load_config() -> dict:
-    """Return a copy of the cached configuration to avoid accidental mutation."""
-    return deepcopy(_load_raw_config())
+    """Return the default configuration as a plain dict (legacy helper)."""
+    return get_config().as_dict()
@@ -0,0 +1,192 @@
+"""
+SoundCheck IR 容器格式 (.scir)
+
+    [0:4)    magic  b"SCIR"
+    [4:6)    版本号 (uint16, little-endian)
+    [6:8)    保留
+    [8:12)   JSON 头长度 (uint32)
+    [12:..)  JSON 头: fs, channels, channel_layout, frames, onset, noise_floor_db,
+             config_hash 以及任意附加字段
+    对齐到 4096 字节后: float32 little-endian 采样数据, 形状 (frames, channels)
+
+数据区用 np.memmap 打开，切片只会读取实际访问到的页面，
+所以打开一个很大的多通道档案几乎不花时间。
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC = b"SCIR"
+VERSION = 1
+ALIGN = 4096
+DTYPE = np.dtype("<f4")
+_PREFIX = struct.Struct("<4sHHI")
+
+# Rows written per chunk, so writing never needs a second full-size copy
+_WRITE_CHUNK = 1 << 18
+
+
+def estimate_onset(ir):
+    """Index of the direct sound (largest absolute sample of channel 0)."""
+    x = ir if ir.ndim == 1 else ir[:, 0]
+    return int(np.argmax(np.abs(x)))
+
+
+def estimate_noise_floor_db(ir, tail=0.1):
+    """RMS level of the last `tail` fraction of channel 0, in dB re. the peak."""
+    x = ir if ir.ndim == 1 else ir[:, 0]
+    n = max(1, int(len(x) * tail))
+    peak = np.max(np.abs(x))
+    rms = np.sqrt(np.mean(np.square(x[-n:], dtype=np.float64)))
+    if peak <= 0 or rms <= 0:
+        return None
+    return float(20 * np.log10(rms / peak))
+
+
+def write_ir(path, ir, fs, onset=None, noise_floor_db=None, config_hash=None, channel_layout=None, **extra):
+    """Write an IR (frames,) or (frames, channels) to a .scir container.
+
+    onset and noise_floor_db are estimated from channel 0 when not given.
+    """
+    ir = np.asarray(ir)
+    frames = ir.shape[0]
+    channels = 1 if ir.ndim == 1 else ir.shape[1]
+    header = {
+        "fs": int(fs),
+        "channels": channels,
+        "channel_layout": list(channel_layout) if channel_layout else [f"ch{i}" for i in range(channels)],
+        "frames": int(frames),
+        "dtype": DTYPE.str,
+        "onset": int(estimate_onset(ir) if onset is None else onset),
+        "noise_floor_db": estimate_noise_floor_db(ir) if noise_floor_db is None else float(noise_floor_db),
+        "config_hash": config_hash,
+    }
+    header.update(extra)
+    blob = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_offset = -(-(_PREFIX.size + len(blob)) // ALIGN) * ALIGN
+
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(_PREFIX.pack(MAGIC, VERSION, 0, len(blob)))
+        fh.write(blob)
+        fh.write(b"\0" * (data_offset - _PREFIX.size - len(blob)))
+        for start in range(0, frames, _WRITE_CHUNK):
+            fh.write(np.ascontiguousarray(ir[start:start + _WRITE_CHUNK], dtype=DTYPE).tobytes())
+    return path
+
+
+class IRFile:
+    """A .scir file opened for zero-copy access.
+
+    data is a read-only memmap of shape (frames, channels); slicing it
+    (or calling segment()) only touches the pages that are read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            magic, version, _, length = _PREFIX.unpack(fh.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path}: 不是SCIR文件")
+            if version > VERSION:
+                raise ValueError(f"{path}: 不支持的SCIR版本 {version}")
+            self.meta = json.loads(fh.read(length).decode("utf-8"))
+        offset = -(-(_PREFIX.size + length) // ALIGN) * ALIGN
+        shape = (self.meta["frames"], self.meta["channels"])
+        if shape[0] == 0:
+            self.data = np.zeros(shape, dtype=DTYPE)
+        else:
+            self.data = np.memmap(path, dtype=np.dtype(self.meta["dtype"]), mode="r",
+                                  offset=offset, shape=shape)
+
+    fs = property(lambda self: self.meta["fs"])
+    channels = property(lambda self: self.meta["channels"])
+    channel_layout = property(lambda self: self.meta["channel_layout"])
+    onset = property(lambda self: self.meta["onset"])
+    noise_floor_db = property(lambda self: self.meta["noise_floor_db"])
+    config_hash = property(lambda self: self.meta["config_hash"])
+
+    def __len__(self):
+        return self.meta["frames"]
+
+    def channel(self, index=0):
+        """1-D (strided) view of one channel."""
+        return self.data[:, index]
+
+    def segment(self, start_s, end_s=None, channel=None):
+        """View of the samples between two times (seconds from file start)."""
+        a = int(round(start_s * self.fs))
+        b = len(self) if end_s is None else int(round(end_s * self.fs))
+        view = self.data[a:b]
+        return view if channel is None else view[:, channel]
+
+    def close(self):
+        # Views handed out earlier keep the mapping alive; it is released
+        # once the last of them is garbage collected.
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+DEFAULT_IR_PATH = "data/processed/ir.scir"
+
+# Text file holding the path of the most recently measured IR; measurements
+# now land in per-run stage workdirs, so a fixed path would go stale.
+LATEST_POINTER = "data/processed/latest_ir"
+
+
+def record_latest_ir(path):
+    """Remember path as the IR latest_ir_path() resolves to."""
+    os.makedirs(os.path.dirname(LATEST_POINTER), exist_ok=True)
+    tmp = LATEST_POINTER + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(os.path.abspath(path))
+    os.replace(tmp, LATEST_POINTER)
+
+
+def latest_ir_path():
+    """The most recently measured IR.
+
+    The path recorded by record_latest_ir() while that file still exists,
+    otherwise the fixed data/processed output: .scir if present, else the
+    legacy .wav.
+    """
+    try:
+        with open(LATEST_POINTER, encoding="utf-8") as fh:
+            path = fh.read().strip()
+    except OSError:
+        path = ""
+    if path and os.path.exists(path):
+        return path
+    return DEFAULT_IR_PATH if os.path.exists(DEFAULT_IR_PATH) else "data/processed/ir.wav"
+
+
+def open_ir(path):
+    return IRFile(path)
+
+
+def read_ir(path):
+    """Load channel 0 of an IR from .scir (memory-mapped) or any soundfile format.
+
+    Returns:
+        (ir, fs)
+    """
+    if str(path).endswith(".scir"):
+        f = IRFile(path)
+        return f.channel(0), f.fs
+    import soundfile as sf
+
+    data, fs = sf.read(path)
+    if data.ndim > 1:
+        data = data[:, 0]
+    return data, int(fs)
@@ -0,0 +1,83 @@
+"""
+低内存模式 - 工作精度 (float32/float64) 和内存预算
+
+    dtype: float32            # 整个流程使用 float32
+    memory_budget_mb: 2048    # 超过预算 1/4 的大数组改为磁盘上的 memmap
+
+memory_budget_mb 为 0 表示不限制。
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from utils.config import get_config
+
+
+SPILL_DIR = "data/spill"
+
+# A single array larger than this fraction of the budget is spilled to disk
+SPILL_FRACTION = 0.25
+
+_MB = 2 ** 20
+
+
+def work_dtype(cfg=None):
+    """numpy dtype the pipeline computes in (cfg.dtype)."""
+    return np.dtype((cfg or get_config()).dtype)
+
+
+def should_spill(nbytes, cfg=None):
+    budget = (cfg or get_config()).memory_budget_mb
+    return budget > 0 and nbytes > budget * _MB * SPILL_FRACTION
+
+
+def empty(shape, dtype=None, cfg=None, name="buf"):
+    """Uninitialised array; a temporary disk-backed memmap when it would exceed the budget.
+
+    The spill file is unlinked right after mapping (POSIX), so it disappears
+    together with the last reference to the array.
+    """
+    cfg = cfg or get_config()
+    dtype = np.dtype(dtype or work_dtype(cfg))
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    if not should_spill(nbytes, cfg):
+        return np.empty(shape, dtype=dtype)
+    os.makedirs(SPILL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=f"{name}-", suffix=".dat", dir=SPILL_DIR)
+    os.close(fd)
+    arr = np.memmap(path, dtype=dtype, mode="w+", shape=tuple(np.atleast_1d(shape)))
+    if os.name == "posix":
+        os.unlink(path)
+    print(f"💾 {name}: {nbytes / _MB:.0f} MB 超出内存预算，使用磁盘映射")
+    return arr
+
+
+def estimate_peak_mb(cfg=None, channels=None):
+    """Rough peak working set of one measurement run, in MB.
+
+    Dominated by the recording, the full-length IR and the FFT buffers of the
+    deconvolution of one channel.
+    """
+    cfg = cfg or get_config()
+    channels = channels or cfg.input_channels
+    item = work_dtype(cfg).itemsize
+    sweep = (cfg.silence_pre + cfg.sweep_duration + cfg.silence_post) * cfg.fs
+    rec = sweep + cfg.record_tail * cfg.fs
+    ir = rec + cfg.sweep_duration * cfg.fs
+    fft = 4 * ir * item  # two complex spectra for one channel
+    return (rec * channels * item + ir * channels * item + fft) / _MB
+
+
+def check_budget(cfg=None):
+    """Warn when the estimated peak exceeds memory_budget_mb."""
+    cfg = cfg or get_config()
+    if cfg.memory_budget_mb <= 0:
+        return True
+    peak = estimate_peak_mb(cfg)
+    if peak > cfg.memory_budget_mb:
+        print(f"⚠️ 预计峰值内存 {peak:.0f} MB 超过预算 {cfg.memory_budget_mb:.0f} MB，"
+              f"大数组将写入 {SPILL_DIR}/ (建议 --set dtype=float32)")
+        return False
+    return True
@@ -1,20 +1,30 @@
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-from utils.config import load_config
+from utils.config import get_config
+from utils.trace import traced
 
-cfg = load_config()
-EARLY_REFL_TIME = float(cfg.get("early_reflection_time", 0.08))  # 80ms default
-
-def plot_ir(ir, fs, ref=None, path="data/plots/ir.png"):
+@traced()
+def plot_ir(ir, fs, ref=None, path="data/plots/ir.png", cfg=None):
     """Plot impulse response with IR waveform and ETC (Energy Time Curve)."""
-    t = np.arange(len(ir)) / fs
-    t_ms = t * 1000  # Convert to milliseconds for better readability
+    import matplotlib
+    matplotlib.use("Agg")  # file output only; also works on headless servers
+    import matplotlib.pyplot as plt
+
+    EARLY_REFL_TIME = (cfg or get_config()).early_reflection_time  # 80ms default
+    full_len = len(ir)
+    end_ms = (full_len - 1) / fs * 1000
 
     # Find direct sound peak
-    direct_idx = np.argmax(np.abs(ir))
-    direct_time = t[direct_idx]
+    direct_idx = int(np.argmax(np.abs(ir)))
+    direct_time = direct_idx / fs
+
+    # Only the displayed window (first 500ms, plus the direct sound) is
+    # computed and plotted, so a long IR is never copied in full.
+    view = min(full_len, max(int(0.5 * fs), direct_idx + int(0.005 * fs)) + int(0.01 * fs))
+    ir = np.asarray(ir[:view], dtype=np.float64)
+    t = np.arange(len(ir)) / fs
+    t_ms = t * 1000  # Convert to milliseconds for better readability
 
     # Calculate early reflection boundary (80ms after direct sound by default)
     early_end_time = direct_time + EARLY_REFL_TIME
@@ -37,12 +47,12 @@ def plot_ir(ir, fs, ref=None, path="data/plots/ir.png"):
     ax1.axvline(direct_time*1000, color='red', linewidth=2, label='直达声 (Direct)', zorder=10)
 
     # Shade early reflections region (BLUE)
-    if early_end_idx < len(ir):
+    if early_end_idx < full_len:
         ax1.axvspan(direct_time*1000, early_end_time*1000, alpha=0.15, color='blue', label='早反射 (Early)')
 
     # Shade reverb tail region (GRAY)
-    if early_end_idx < len(ir):
-        ax1.axvspan(early_end_time*1000, t_ms[-1], alpha=0.15, color='gray', label='混响尾声 (Late)')
+    if early_end_idx < full_len:
+        ax1.axvspan(early_end_time*1000, end_ms, alpha=0.15, color='gray', label='混响尾声 (Late)')
 
     # Mark detected reflections
     if ref is not None and len(ref) > 0:
@@ -57,7 +67,7 @@ def plot_ir(ir, fs, ref=None, path="data/plots/ir.png"):
     ax1.set_title('脉冲响应 (Impulse Response)', fontsize=14, fontweight='bold')
     ax1.grid(True, alpha=0.3)
     ax1.legend(loc='upper right', fontsize=10)
-    ax1.set_xlim(0, min(500, t_ms[-1]))  # Show first 500ms
+    ax1.set_xlim(0, min(500, end_ms))  # Show first 500ms
 
     # === Plot 2: ETC (Energy Time Curve) ===
     # Direct sound (RED)
@@ -83,11 +93,11 @@ def plot_ir(ir, fs, ref=None, path="data/plots/ir.png"):
     ax2.set_title('能量时间曲线 (ETC - Energy Time Curve)', fontsize=14, fontweight='bold')
     ax2.grid(True, alpha=0.3)
     ax2.legend(loc='upper right', fontsize=10)
-    ax2.set_xlim(0, min(500, t_ms[-1]))  # Show first 500ms
+    ax2.set_xlim(0, min(500, end_ms))  # Show first 500ms
     ax2.set_ylim(-80, 5)
 
     plt.tight_layout()
-    os.makedirs("data/plots", exist_ok=True)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
     plt.savefig(path, dpi=150, bbox_inches='tight')
     plt.close()
     print(f"📊 图表已保存: {path}")
@@ -1,10 +1,13 @@
 
 import os
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+from utils.trace import traced
+
+@traced()
+def generate_report(rt60,c50,img="data/plots/ir.png",out="data/reports/report.pdf",sti=None):
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
 
-def generate_report(rt60,c50,img="data/plots/ir.png",out="data/reports/report.pdf"):
     if not os.path.exists(img):
         raise FileNotFoundError(f"Impulse response plot not found at {img}")
     out_dir=os.path.dirname(out)
@@ -16,5 +19,7 @@ def generate_report(rt60,c50,img="data/plots/ir.png",out="data/reports/report.pd
     c.setFont("Helvetica",12)
     c.drawString(50,770,f"RT60: {rt60:.3f}s")
     c.drawString(50,750,f"C50: {c50:.2f} dB")
+    if sti is not None:
+        c.drawString(50,730,f"STI: {sti:.2f}")
     c.drawImage(img,50,400,500,250)
     c.save()
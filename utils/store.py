@@ -0,0 +1,223 @@
+"""
+测量档案 - SQLite 目录 + 每次测量的数组文件
+
+    data/archive/catalog.sqlite          测量目录与指标（按房间/位置/时间/配置哈希索引）
+    data/archive/arrays/<id>/<name>.npy  IR、录音等数组，np.load(mmap_mode="r") 零拷贝打开
+
+指标查询（例如 "X 房间 500 Hz 的 T30，最近 90 天"）只访问 SQLite，不读取任何音频。
+"""
+
+import os
+import sqlite3
+import time
+import uuid
+
+import numpy as np
+
+
+BROADBAND = 0  # band value used for broadband metrics
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id          TEXT PRIMARY KEY,
+    room        TEXT,
+    position    TEXT,
+    timestamp   REAL NOT NULL,
+    config_hash TEXT,
+    fs          INTEGER,
+    source      TEXT,
+    kind        TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_meas_room_time ON measurements(room, timestamp);
+CREATE INDEX IF NOT EXISTS idx_meas_position ON measurements(room, position, timestamp);
+CREATE INDEX IF NOT EXISTS idx_meas_config ON measurements(config_hash);
+
+CREATE TABLE IF NOT EXISTS metrics (
+    measurement_id TEXT NOT NULL REFERENCES measurements(id) ON DELETE CASCADE,
+    name           TEXT NOT NULL,
+    band           REAL NOT NULL,
+    value          REAL,
+    PRIMARY KEY (measurement_id, name, band)
+);
+CREATE INDEX IF NOT EXISTS idx_metrics_name_band ON metrics(name, band, measurement_id);
+
+CREATE TABLE IF NOT EXISTS arrays (
+    measurement_id TEXT NOT NULL REFERENCES measurements(id) ON DELETE CASCADE,
+    name           TEXT NOT NULL,
+    path           TEXT NOT NULL,
+    dtype          TEXT,
+    shape          TEXT,
+    PRIMARY KEY (measurement_id, name)
+);
+"""
+
+
+def flatten_metrics(metrics=None, bands=None):
+    """Turn {"rt60": x, "c50": y, "sti": z} and band_metrics() output into {(name, band): value}.
+
+    The broadband RT60 is stored as T30, the quantity RT60() actually fits.
+    """
+    rename = {"rt60": "T30", "c50": "C50", "sti": "STI"}
+    flat = {}
+    for name, value in (metrics or {}).items():
+        if isinstance(value, (list, dict)):  # e.g. per-channel details
+            continue
+        flat[(rename.get(name, name), BROADBAND)] = value
+    for band, values in (bands or {}).items():
+        for name, value in values.items():
+            flat[(name, float(band))] = value
+    return flat
+
+
+def array_path(root, measurement_id, name):
+    return os.path.join(root, "arrays", measurement_id, f"{name}.npy")
+
+
+def write_array(root, measurement_id, name, array):
+    """Write one array file of an archive; needs no catalog access, so workers can call it."""
+    path = array_path(root, measurement_id, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(path, np.ascontiguousarray(array))
+    return path
+
+
+class MeasurementStore:
+    """Indexed archive of measurements; safe to share between processes.
+
+    Array files may be written by whoever computes them (write_array()), the
+    catalog rows are then added with add_measurement().
+    """
+
+    def __init__(self, root="data/archive"):
+        self.root = root
+        os.makedirs(os.path.join(root, "arrays"), exist_ok=True)
+        self.db_path = os.path.join(root, "catalog.sqlite")
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    # -- arrays -------------------------------------------------------------
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def array_path(self, measurement_id, name):
+        return array_path(self.root, measurement_id, name)
+
+    def save_array(self, measurement_id, name, array):
+        return write_array(self.root, measurement_id, name, array)
+
+    def load_array(self, measurement_id, name, mmap=True):
+        """Open a stored array; memory-mapped read-only by default."""
+        return np.load(self.array_path(measurement_id, name), mmap_mode="r" if mmap else None)
+
+    # -- catalog ------------------------------------------------------------
+
+    def add_measurement(self, room=None, position=None, cfg=None, metrics=None, arrays=None,
+                        timestamp=None, source=None, kind="sweep", measurement_id=None):
+        """Record one measurement.
+
+        Args:
+            metrics: {(name, band_hz): value}, see flatten_metrics(); band 0 is broadband
+            arrays: {name: ndarray} to write now; arrays already written with
+                write_array() for this measurement_id are picked up automatically
+
+        Returns:
+            measurement id
+        """
+        mid = measurement_id or self.new_id()
+        written = []
+        try:
+            for name, array in (arrays or {}).items():
+                if not os.path.exists(self.array_path(mid, name)):
+                    written.append(self.array_path(mid, name))
+                self.save_array(mid, name, array)
+            self._insert(mid, room, position, cfg, metrics, timestamp, source, kind)
+        except BaseException:
+            # no catalog row: do not leave the arrays this call created behind
+            for path in written:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        return mid
+
+    def _insert(self, mid, room, position, cfg, metrics, timestamp, source, kind):
+        timestamp = time.time() if timestamp is None else float(timestamp)
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO measurements (id, room, position, timestamp, config_hash, fs, source, kind)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (mid, room, None if position is None else str(position), timestamp,
+                 cfg.digest() if cfg is not None else None, cfg.fs if cfg is not None else None,
+                 source, kind),
+            )
+            self.conn.executemany(
+                "INSERT INTO metrics (measurement_id, name, band, value) VALUES (?, ?, ?, ?)",
+                [(mid, name, float(band), _to_sql(value)) for (name, band), value in (metrics or {}).items()],
+            )
+            array_dir = os.path.join(self.root, "arrays", mid)
+            if os.path.isdir(array_dir):
+                rows = []
+                for fname in sorted(os.listdir(array_dir)):
+                    if fname.endswith(".npy"):
+                        arr = np.load(os.path.join(array_dir, fname), mmap_mode="r")
+                        rows.append((mid, fname[:-4], os.path.join(array_dir, fname),
+                                     arr.dtype.str, ",".join(map(str, arr.shape))))
+                self.conn.executemany("INSERT INTO arrays VALUES (?, ?, ?, ?, ?)", rows)
+
+    def query_metric(self, name, band=BROADBAND, room=None, position=None, days=None,
+                     since=None, until=None, config_hash=None):
+        """Time series of one metric, oldest first, without touching any audio.
+
+        Returns:
+            list of (timestamp, value, measurement_id, room, position)
+        """
+        sql = ["SELECT m.timestamp, x.value, m.id, m.room, m.position",
+               "FROM metrics x JOIN measurements m ON m.id = x.measurement_id",
+               "WHERE x.name = ? AND x.band = ?"]
+        params = [name, float(band)]
+        if days is not None:
+            since = time.time() - days * 86400
+        for clause, value in (("m.room = ?", room), ("m.position = ?", None if position is None else str(position)),
+                              ("m.timestamp >= ?", since), ("m.timestamp <= ?", until),
+                              ("m.config_hash = ?", config_hash)):
+            if value is not None:
+                sql.append("AND " + clause)
+                params.append(value)
+        sql.append("ORDER BY m.timestamp")
+        return [tuple(r) for r in self.conn.execute(" ".join(sql), params)]
+
+    def measurements(self, room=None, limit=None):
+        """Catalog rows as dicts, newest first."""
+        sql = "SELECT id, room, position, timestamp, config_hash, fs, source, kind FROM measurements"
+        params = []
+        if room is not None:
+            sql += " WHERE room = ?"
+            params.append(room)
+        sql += " ORDER BY timestamp DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        cols = ("id", "room", "position", "timestamp", "config_hash", "fs", "source", "kind")
+        return [dict(zip(cols, r)) for r in self.conn.execute(sql, params)]
+
+    def metrics_for(self, measurement_id):
+        """{(name, band): value} for one measurement."""
+        rows = self.conn.execute("SELECT name, band, value FROM metrics WHERE measurement_id = ?",
+                                 (measurement_id,))
+        return {(name, band): value for name, band, value in rows}
+
+
+def _to_sql(value):
+    value = float(value)
+    return None if np.isnan(value) else value
@@ -0,0 +1,188 @@
+"""
+性能追踪 - 记录每个阶段/每次调用的耗时、CPU时间、峰值内存和数组大小
+
+    SOUNDCHECK_TRACE=trace.json python run.py ...      或   python run.py --trace trace.json ...
+
+结果导出为 Chrome trace-event JSON (chrome://tracing / Perfetto 可直接打开)
+以及一张汇总表。未启用时 @traced 只多一次布尔判断。
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class _State:
+    enabled = False
+    memory = False
+    events = []
+    origin = 0.0
+    local = threading.local()
+
+
+_state = _State()
+
+
+def enable(memory=True):
+    """Start recording spans (and tracemalloc peaks if memory=True)."""
+    _state.events = []
+    _state.origin = time.perf_counter()
+    _state.memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _state.enabled = True
+
+
+def disable():
+    _state.enabled = False
+    if _state.memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    return _state.enabled
+
+
+def events():
+    return list(_state.events)
+
+
+def _nbytes(value):
+    """Total ndarray bytes in a value (looks one level into tuples/lists/dicts)."""
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value if not isinstance(v, (tuple, list, dict)))
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values() if not isinstance(v, (tuple, list, dict)))
+    return 0
+
+
+def _stack():
+    stack = getattr(_state.local, "stack", None)
+    if stack is None:
+        stack = _state.local.stack = []
+    return stack
+
+
+@contextmanager
+def span(name, **args):
+    """Record one timed region. Nested spans are tracked per thread."""
+    if not _state.enabled:
+        yield args
+        return
+    stack = _stack()
+    frame = {"peak": 0, "mem0": 0}
+    if _state.memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        frame["mem0"] = current
+    stack.append(frame)
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    try:
+        yield args
+    finally:
+        wall1, cpu1 = time.perf_counter(), time.process_time()
+        stack.pop()
+        peak = 0
+        if _state.memory:
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        _state.events.append({
+            "name": name,
+            "ts": wall0 - _state.origin,
+            "wall": wall1 - wall0,
+            "cpu": cpu1 - cpu0,
+            "peak_mem": max(0, peak - frame["mem0"]),
+            "depth": len(stack),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+
+def traced(name=None):
+    """Decorator recording every call of a function as a span.
+
+    Array sizes of the arguments and the return value are recorded as
+    in_bytes / out_bytes.
+    """
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with span(label) as info:
+                info["in_bytes"] = _nbytes(args) + _nbytes(kwargs)
+                result = func(*args, **kwargs)
+                info["out_bytes"] = _nbytes(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def export_chrome(path, trace_events=None):
+    """Write events in Chrome trace-event format (complete "X" events, microseconds)."""
+    pid = os.getpid()
+    out = []
+    for ev in trace_events if trace_events is not None else _state.events:
+        out.append({
+            "name": ev["name"], "ph": "X", "pid": pid, "tid": ev["tid"],
+            "ts": round(ev["ts"] * 1e6, 3), "dur": round(ev["wall"] * 1e6, 3),
+            "args": dict(ev["args"], cpu_ms=round(ev["cpu"] * 1e3, 3),
+                         peak_mem_mb=round(ev["peak_mem"] / 2**20, 3)),
+        })
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({"traceEvents": out, "displayTimeUnit": "ms"}, fh)
+    return path
+
+
+def summarize(trace_events=None):
+    """Aggregate events by name: calls, total/max wall, CPU, peak memory, array sizes."""
+    rows = {}
+    for ev in trace_events if trace_events is not None else _state.events:
+        r = rows.setdefault(ev["name"], {"name": ev["name"], "calls": 0, "wall": 0.0, "max_wall": 0.0,
+                                         "cpu": 0.0, "peak_mem": 0, "in_bytes": 0, "out_bytes": 0})
+        r["calls"] += 1
+        r["wall"] += ev["wall"]
+        r["max_wall"] = max(r["max_wall"], ev["wall"])
+        r["cpu"] += ev["cpu"]
+        r["peak_mem"] = max(r["peak_mem"], ev["peak_mem"])
+        r["in_bytes"] = max(r["in_bytes"], ev["args"].get("in_bytes", 0))
+        r["out_bytes"] = max(r["out_bytes"], ev["args"].get("out_bytes", 0))
+    return sorted(rows.values(), key=lambda r: -r["wall"])
+
+
+def format_summary(trace_events=None):
+    mb = 2 ** 20
+    lines = [f"{'名称':<28}{'次数':>6}{'总耗时(s)':>12}{'最长(s)':>10}{'CPU(s)':>10}"
+             f"{'峰值内存(MB)':>14}{'输入(MB)':>10}{'输出(MB)':>10}"]
+    for r in summarize(trace_events):
+        lines.append(f"{r['name']:<30}{r['calls']:>6}{r['wall']:>12.3f}{r['max_wall']:>10.3f}{r['cpu']:>10.3f}"
+                     f"{r['peak_mem'] / mb:>14.1f}{r['in_bytes'] / mb:>10.1f}{r['out_bytes'] / mb:>10.1f}")
+    return "\n".join(lines)
+
+
+def finish(path):
+    """Export the trace, print the summary table and stop tracing."""
+    export_chrome(path)
+    print("\n⏱️ 性能追踪汇总")
+    print(format_summary())
+    print(f"📁 Chrome trace: {path}")
+    disable()
+
+
+if os.environ.get("SOUNDCHECK_TRACE"):
+    enable(memory=os.environ.get("SOUNDCHECK_TRACE_MEMORY", "1") != "0")